@@ -1,28 +1,218 @@
-import re
+"""Validate migration SQL and the PL/pgSQL bodies of the functions it defines.
+
+    python validate-plpgsql.py path/to/migration.sql
+    python validate-plpgsql.py supabase/migrations --report plpgsql-report.json
+
+A single file is checked in-process and stops at the first error. Directories
+are validated on a process pool; results are cached by file content hash, so
+unchanged migrations are not parsed again, and one aggregated JSON report is
+written.
+"""
+import argparse
+import hashlib
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-from pglast import parse_sql
-from pglast.parser import parse_plpgsql_json
+from pglast import __version__ as pglast_version
+from pglast.parser import parse_plpgsql_json, parse_sql_json
+
+
+DEFAULT_CACHE = Path(__file__).with_name(".plpgsql-cache.json")
+
+
+def validator_key() -> str:
+    """Cache entries are only valid for the same validator code and pglast version."""
+    digest = hashlib.sha256(Path(__file__).read_bytes())
+    digest.update(pglast_version.encode())
+    return digest.hexdigest()[:16]
+
+
+def option(statement: dict, name: str):
+    for item in statement.get("options", []):
+        definition = item.get("DefElem", {})
+        if definition.get("defname") == name:
+            return definition
+    return None
 
 
-path = Path(sys.argv[1])
-text = path.read_text(encoding="utf-8")
-parse_sql(text)
+def extract_functions(text: str, tree: dict | None = None) -> list[dict]:
+    """CREATE FUNCTION statements from the parse tree, with byte offsets into the UTF-8 file.
 
-delimiter = re.escape("$$")
-functions = re.findall(
-    r"CREATE OR REPLACE FUNCTION.*?" + delimiter + r";",
-    text,
-    re.IGNORECASE | re.DOTALL,
-)
+    Statement boundaries come from the parser, so any dollar-quote tag and any
+    trailing clause order is handled, in a single pass over the statements.
+    """
+    encoded = text.encode("utf-8")
+    if tree is None:
+        tree = json.loads(parse_sql_json(text))
+    functions = []
+    for raw in tree.get("stmts", []):
+        statement = raw["stmt"].get("CreateFunctionStmt")
+        if statement is None:
+            continue
+        start = raw.get("stmt_location", 0)
+        end = start + raw["stmt_len"] if raw.get("stmt_len") else len(encoded)
+        chunk = encoded[start:end]
+        first = start + len(chunk) - len(chunk.lstrip())
+        language = option(statement, "language")
+        body = option(statement, "as")
+        functions.append({
+            "function": ".".join(part["String"]["sval"] for part in statement["funcname"]),
+            "language": language["arg"]["String"]["sval"].lower() if language else "sql",
+            "start_byte": start,
+            "end_byte": end,
+            "body_byte": body["location"] if body else None,
+            "line": encoded.count(b"\n", 0, first) + 1,
+            "statement": chunk.decode("utf-8"),
+        })
+    return functions
 
-for index, statement in enumerate(functions, start=1):
-    name = re.search(r"FUNCTION\s+([^\s(]+)", statement, re.IGNORECASE)
-    label = name.group(1) if name else f"function-{index}"
+
+def validate_text(text: str) -> dict:
+    result = {"sql_error": None, "functions": 0, "function_errors": []}
     try:
-        parse_plpgsql_json(statement)
+        tree = json.loads(parse_sql_json(text))
     except Exception as error:
-        print(f"{label}: {error}")
-        raise
-    print(f"{label}: parsed")
+        result["sql_error"] = str(error)
+        return result
+
+    for function in extract_functions(text, tree):
+        if function["language"] != "plpgsql":
+            continue
+        result["functions"] += 1
+        try:
+            parse_plpgsql_json(function["statement"])
+        except Exception as error:
+            result["function_errors"].append({
+                "function": function["function"],
+                "line": function["line"],
+                "start_byte": function["start_byte"],
+                "end_byte": function["end_byte"],
+                "error": str(error),
+            })
+    return result
+
+
+def validate_path(path: str) -> tuple[str, dict]:
+    started = time.perf_counter()
+    result = validate_text(Path(path).read_text(encoding="utf-8"))
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return path, result
+
+
+def validate_single(path: Path) -> None:
+    text = path.read_text(encoding="utf-8")
+    for function in extract_functions(text):
+        if function["language"] != "plpgsql":
+            continue
+        label = function["function"]
+        try:
+            parse_plpgsql_json(function["statement"])
+        except Exception as error:
+            print(f"{label} (line {function['line']}, bytes {function['start_byte']}-{function['end_byte']}): {error}")
+            raise
+        print(f"{label}: parsed")
+
+
+def collect_files(targets: list[Path]) -> list[Path]:
+    files = []
+    for target in targets:
+        if target.is_dir():
+            files.extend(sorted(target.rglob("*.sql")))
+        else:
+            files.append(target)
+    return files
+
+
+def load_cache(path: Path, key: str) -> dict:
+    if not path.exists():
+        return {}
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return {}
+    return cache.get("results", {}) if cache.get("validator") == key else {}
+
+
+def validate_tree(files: list[Path], cache_path: Path | None, workers: int) -> dict:
+    started = time.perf_counter()
+    key = validator_key()
+    cache = load_cache(cache_path, key) if cache_path else {}
+
+    hashes = {str(path): hashlib.sha256(path.read_bytes()).hexdigest() for path in files}
+    results = {}
+    stale = []
+    for path in files:
+        cached = cache.get(hashes[str(path)])
+        if cached is not None:
+            results[str(path)] = {**cached, "cached": True}
+        else:
+            stale.append(str(path))
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, result in pool.map(validate_path, stale, chunksize=8):
+                results[path] = {**result, "cached": False}
+
+    if cache_path:
+        fresh = {hashes[path]: {k: v for k, v in result.items() if k != "cached"} for path, result in results.items()}
+        cache_path.write_text(json.dumps({"validator": key, "results": fresh}), encoding="utf-8")
+
+    failures = [
+        {"file": path, **result}
+        for path, result in results.items()
+        if result["sql_error"] or result["function_errors"]
+    ]
+    return {
+        "validator": key,
+        "pglast": pglast_version,
+        "files": len(files),
+        "validated": len(stale),
+        "cached": len(files) - len(stale),
+        "functions": sum(result["functions"] for result in results.values()),
+        "failed_files": len(failures),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+        "failures": sorted(failures, key=lambda failure: failure["file"]),
+        "results": dict(sorted(results.items())),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", type=Path)
+    parser.add_argument("--report", type=Path, help="Write the aggregated JSON report here")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    if len(args.paths) == 1 and args.paths[0].is_file() and not args.report:
+        validate_single(args.paths[0])
+        return
+
+    report = validate_tree(
+        collect_files(args.paths),
+        None if args.no_cache else args.cache,
+        max(1, args.workers),
+    )
+    for failure in report["failures"]:
+        if failure["sql_error"]:
+            print(f"{failure['file']}: {failure['sql_error']}")
+        for error in failure["function_errors"]:
+            print(f"{failure['file']}:{error['line']}: {error['function']}: {error['error']}")
+    print(
+        f"{report['files']} files ({report['cached']} cached, {report['validated']} validated), "
+        f"{report['functions']} functions, {report['failed_files']} failing, "
+        f"{report['duration_seconds']}s"
+    )
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if report["failed_files"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """Analyze JE structure — what account types are being used in postings?"""
 import json, os, urllib.request
+from db_connection import get_company_id
+from ledger_engine import Ledger
 
 env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 with open(env_path, 'r') as f:
@@ -10,7 +12,7 @@ with open(env_path, 'r') as f:
             break
 
 BASE = "https://qwhunliohlkkahbspfiu.supabase.co/rest/v1"
-CID = "24bc0b21-4e2d-4413-9842-31719a3669f4"
+CID = get_company_id()
 
 # Fetch JELs joined with CoA to see what account types are being posted
 def fetch_all_paginated(url):
@@ -37,55 +39,43 @@ print("Fetching chart_of_accounts...")
 coa = fetch_all_paginated(f"chart_of_accounts?select=id,account_code,account_name,account_type&company_id=eq.{CID}&limit=500")
 print(f"  Got {len(coa)} accounts")
 
-# Build account_id -> account_type map
-acc_type_map = {a['id']: a.get('account_type', '?') for a in coa}
-acc_name_map = {a['id']: a.get('account_name', '?') for a in coa}
-
 # Fetch all JELs
 print("Fetching journal_entry_lines...")
 jels = fetch_all_paginated("journal_entry_lines?select=journal_entry_id,account_id,debit_amount,credit_amount,line_number")
 print(f"  Got {len(jels)} lines")
 
-# Analyze: what account types are being posted to?
-type_debit = {}
-type_credit = {}
-type_count = {}
-for l in jels:
-    aid = l.get('account_id')
-    at = acc_type_map.get(aid, 'UNKNOWN')
-    d = float(l.get('debit_amount') or 0)
-    c = float(l.get('credit_amount') or 0)
-    type_debit[at] = type_debit.get(at, 0) + d
-    type_credit[at] = type_credit.get(at, 0) + c
-    type_count[at] = type_count.get(at, 0) + 1
+# Analyze: what account types are being posted to? Lines on accounts outside
+# this company's CoA roll up as UNKNOWN.
+ledger = Ledger.from_records([], jels, coa)
+rollup = ledger.type_rollup()
 
 print("\n=== POSTING ANALYSIS BY ACCOUNT TYPE ===")
 print(f"{'Type':<15} {'Lines':>8} {'Total Debit':>15} {'Total Credit':>15} {'Net':>15}")
 print("-" * 65)
-for t in sorted(type_count.keys()):
-    d = type_debit.get(t, 0)
-    c = type_credit.get(t, 0)
-    net = d - c
-    print(f"{t:<15} {type_count[t]:>8} {d:>15,.2f} {c:>15,.2f} {net:>15,.2f}")
+for t, totals in sorted(rollup.items()):
+    d = totals['debit']
+    c = totals['credit']
+    print(f"{t:<15} {totals['lines']:>8} {ledger.major(d):>15,} {ledger.major(c):>15,} {ledger.major(d - c):>15,}")
 
-total_d = sum(type_debit.values())
-total_c = sum(type_credit.values())
+total_d = ledger.major(ledger.line_debit.sum())
+total_c = ledger.major(ledger.line_credit.sum())
 print("-" * 65)
-print(f"{'TOTAL':<15} {len(jels):>8} {total_d:>15,.2f} {total_c:>15,.2f} {total_d-total_c:>15,.2f}")
+print(f"{'TOTAL':<15} {ledger.n_lines:>8} {total_d:>15,} {total_c:>15,} {total_d-total_c:>15,}")
 
 # Check if there are UNKNOWN accounts (account_id not in CoA for this company)
-unknown_count = type_count.get('UNKNOWN', 0)
+unknown_count = rollup.get('UNKNOWN', {}).get('lines', 0)
 if unknown_count > 0:
     print(f"\nWARNING: {unknown_count} lines reference accounts not in this company's CoA (cross-company postings?)")
 
 # Key finding: does the system post to liability/equity accounts at all?
-liab_debit = type_debit.get('liabilities', 0)
-liab_credit = type_credit.get('liabilities', 0)
-equity_debit = type_debit.get('equity', 0)
-equity_credit = type_credit.get('equity', 0)
+empty = {'debit': 0, 'credit': 0}
+liab_debit = rollup.get('liabilities', empty)['debit']
+liab_credit = rollup.get('liabilities', empty)['credit']
+equity_debit = rollup.get('equity', empty)['debit']
+equity_credit = rollup.get('equity', empty)['credit']
 print(f"\n=== KEY FINDING ===")
-print(f"Liabilities: D={liab_debit:,.2f} C={liab_credit:,.2f}")
-print(f"Equity: D={equity_debit:,.2f} C={equity_credit:,.2f}")
+print(f"Liabilities: D={ledger.fmt(liab_debit)} C={ledger.fmt(liab_credit)}")
+print(f"Equity: D={ledger.fmt(equity_debit)} C={ledger.fmt(equity_credit)}")
 if liab_debit == 0 and liab_credit == 0:
     print("CRITICAL: No postings to liability accounts — system doesn't record liabilities!")
 if equity_debit == 0 and equity_credit == 0:
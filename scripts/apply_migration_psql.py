@@ -3,12 +3,11 @@
 import os
 import sys
 
-import psycopg2
 
-from db_connection import get_database_url
+from db_connection import connect
 
 try:
-    conn = psycopg2.connect(get_database_url())
+    conn = connect()
     conn.autocommit = True
     cursor = conn.cursor()
     print("Connected!")
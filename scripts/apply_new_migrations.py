@@ -1,12 +1,9 @@
 #!/usr/bin/env python3
-"""Apply production-readiness fixes directly to remote Supabase database.
-Handles missing tables and existing objects gracefully."""
-import os
-import psycopg2
-from db_connection import get_database_url
+"""Apply the production-readiness migrations to the remote Supabase database.
+Only files not yet recorded in the migration ledger are executed."""
+import sys
 
-DB_URL = get_database_url()
-MIGRATION_DIR = "supabase/migrations"
+import apply_pending_migrations
 
 MIGRATION_FILES = [
     "20260709000001_fix_financial_foreign_keys_on_delete.sql",
@@ -21,47 +18,11 @@ MIGRATION_FILES = [
 ]
 
 def main():
-    conn = psycopg2.connect(DB_URL)
-    conn.autocommit = True
-    cursor = conn.cursor()
-    
-    applied = 0
-    errors = 0
-    
+    # Applied state lives in maintenance.migration_ledger; see apply_pending_migrations.py.
+    only = []
     for filename in MIGRATION_FILES:
-        filepath = os.path.join(MIGRATION_DIR, filename)
-        if not os.path.exists(filepath):
-            print(f"SKIP (not found): {filename}")
-            continue
-        
-        print(f"\n=== {filename} ===")
-        with open(filepath, 'r') as f:
-            sql = f.read()
-        
-        # Strip comment lines
-        lines = sql.split('\n')
-        clean_lines = [l for l in lines if not l.strip().startswith('--')]
-        clean_sql = '\n'.join(clean_lines)
-        
-        try:
-            cursor.execute(clean_sql)
-            print(f"  SUCCESS")
-            applied += 1
-        except Exception as e:
-            err_msg = str(e).lower()
-            if 'already exists' in err_msg or 'duplicate' in err_msg:
-                print(f"  SKIP (exists): {str(e)[:80]}")
-                applied += 1
-            elif 'does not exist' in err_msg:
-                print(f"  PARTIAL (missing ref): {str(e)[:80]}")
-                applied += 1  # Partial application is acceptable
-            else:
-                print(f"  ERROR: {str(e)[:200]}")
-                errors += 1
-    
-    cursor.close()
-    conn.close()
-    print(f"\n=== Applied: {applied}/{len(MIGRATION_FILES)}, Errors: {errors} ===")
+        only += ["--only", filename]
+    apply_pending_migrations.main([*only, *sys.argv[1:]])
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Apply only the pending supabase/migrations files, tracked in a checksum ledger.
+
+Every applied file is recorded in maintenance.migration_ledger with the
+SHA-256 of its contents, so a deploy hashes the local files, compares them with
+the ledger and executes only what is missing, oldest first. Each file runs in
+its own transaction together with its ledger row, so a failure leaves neither
+a half-applied file nor a ledger entry behind, and the run stops there.
+Top-level BEGIN / START TRANSACTION / COMMIT / END statements in a file are
+dropped before it runs, since a COMMIT of its own would end that transaction
+before the ledger row is written. A file with any other top-level transaction
+control (ROLLBACK, PREPARE TRANSACTION, ...) is refused, as is one pglast cannot
+parse that appears to contain BEGIN or COMMIT.
+
+Files already recorded with a different checksum were edited after being
+applied; they are reported and never re-run automatically.
+
+A file whose top-level statements include one PostgreSQL refuses inside a
+transaction block (CREATE / DROP / REINDEX ... CONCURRENTLY, VACUUM, ALTER
+SYSTEM) runs statement by statement instead, with its ledger row last; such a
+file is not atomic, and a failure part-way leaves its earlier statements. The
+statements are read with pglast, so the same words inside function bodies,
+strings or comments do not count. Files pglast cannot parse fall back to a
+keyword search with comments, strings and dollar-quoted bodies blanked out.
+
+--status is read-only: it neither takes the run lock nor creates the ledger.
+
+Usage:
+    python scripts/apply_pending_migrations.py --status
+    python scripts/apply_pending_migrations.py --adopt-supabase-history   # first run on an existing database
+    python scripts/apply_pending_migrations.py                             # apply everything pending
+    python scripts/apply_pending_migrations.py --only 20260709000005_financial_audit_triggers.sql
+"""
+import argparse
+import getpass
+import hashlib
+import re
+import sys
+import time
+from pathlib import Path
+
+from pglast import ast, parse_sql, split
+from pglast.enums.parsenodes import TransactionStmtKind
+from pglast.parser import ParseError
+
+from db_connection import connect
+
+
+MIGRATION_DIR = Path(__file__).resolve().parents[1] / "supabase" / "migrations"
+MIGRATION_NAME = re.compile(r"^(\d+)_.+\.sql$")
+# Fallback for files pglast cannot parse: comments, dollar-quoted bodies and
+# string literals are blanked before looking for the statements below.
+NOT_CODE = re.compile(r"--[^\n]*|/\*.*?\*/|(\$\w*\$).*?\1|'(?:[^']|'')*'", re.DOTALL)
+NON_TRANSACTIONAL = re.compile(
+    r"\b(VACUUM|ALTER\s+SYSTEM|(?<!VIEW\s)CONCURRENTLY)\b", re.IGNORECASE)
+TRANSACTION_CONTROL = re.compile(
+    r"^\s*(BEGIN|COMMIT|END|START)(\s+(TRANSACTION|WORK))?\s*;", re.IGNORECASE | re.MULTILINE)
+# Top-level transaction statements dropped so the file runs inside the runner's transaction.
+DROPPED_TRANSACTION_KINDS = {
+    TransactionStmtKind.TRANS_STMT_BEGIN, TransactionStmtKind.TRANS_STMT_START, TransactionStmtKind.TRANS_STMT_COMMIT,
+}
+# Allowed inside the runner's transaction as they are.
+NESTED_TRANSACTION_KINDS = {
+    TransactionStmtKind.TRANS_STMT_SAVEPOINT, TransactionStmtKind.TRANS_STMT_RELEASE,
+    TransactionStmtKind.TRANS_STMT_ROLLBACK_TO,
+}
+LOCK_KEY = 727_001_029
+
+LEDGER_DDL = """
+CREATE SCHEMA IF NOT EXISTS maintenance;
+CREATE TABLE IF NOT EXISTS maintenance.migration_ledger (
+    filename TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    duration_ms INTEGER,
+    applied_by TEXT,
+    baseline BOOLEAN NOT NULL DEFAULT false
+);
+"""
+
+
+def checksum(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def local_migrations(only: list[str] | None = None) -> list[tuple[str, str, Path]]:
+    """(version, filename, path) for every runnable migration file, in apply order."""
+    migrations = []
+    for path in sorted(MIGRATION_DIR.glob("*.sql")):
+        match = MIGRATION_NAME.match(path.name)
+        if not match:
+            continue
+        if only and path.name not in only:
+            continue
+        migrations.append((match.group(1), path.name, path))
+    if only:
+        missing = set(only) - {filename for _, filename, _ in migrations}
+        if missing:
+            raise SystemExit(f"Unknown migration file(s): {', '.join(sorted(missing))}")
+    return migrations
+
+
+def prepare(sql: str) -> tuple[str, bool]:
+    """The file's SQL without top-level BEGIN / COMMIT, and whether it must run outside a transaction.
+
+    Raises ValueError for transaction control the runner cannot keep atomic.
+    """
+    try:
+        statements = [raw.stmt for raw in parse_sql(sql)]
+    except ParseError:
+        code = NOT_CODE.sub(" ", sql)
+        if TRANSACTION_CONTROL.search(code):
+            raise ValueError("pglast cannot parse this file, so its BEGIN / COMMIT cannot be dropped safely")
+        return sql, bool(NON_TRANSACTIONAL.search(code))
+    control = [statement.kind for statement in statements if isinstance(statement, ast.TransactionStmt)]
+    refused = set(control) - DROPPED_TRANSACTION_KINDS - NESTED_TRANSACTION_KINDS
+    if refused:
+        raise ValueError(f"top-level {', '.join(sorted(kind.name for kind in refused))} cannot run atomically")
+    if set(control) & DROPPED_TRANSACTION_KINDS:
+        sql = ";\n".join(
+            text for text, statement in zip(split(sql), statements)
+            if not (isinstance(statement, ast.TransactionStmt) and statement.kind in DROPPED_TRANSACTION_KINDS)
+        ) + ";\n"
+    return sql, non_transactional(statements)
+
+
+def non_transactional(statements: list) -> bool:
+    """Whether a top-level statement cannot run inside a transaction block."""
+    return any(
+        (isinstance(statement, (ast.IndexStmt, ast.DropStmt)) and statement.concurrent)
+        or (isinstance(statement, ast.ReindexStmt)
+            and any(param.defname == "concurrently" for param in statement.params or ()))
+        or (isinstance(statement, ast.VacuumStmt) and statement.is_vacuumcmd)  # ANALYZE alone is fine
+        or isinstance(statement, ast.AlterSystemStmt)
+        for statement in statements
+    )
+
+
+def read_ledger(connection) -> dict[str, str] | None:
+    """filename -> checksum, or None while maintenance.migration_ledger does not exist."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('maintenance.migration_ledger')")
+        if cursor.fetchone()[0] is None:
+            return None
+        cursor.execute("SELECT filename, checksum FROM maintenance.migration_ledger")
+        return dict(cursor.fetchall())
+
+
+def ensure_ledger(connection) -> dict[str, str]:
+    with connection.cursor() as cursor:
+        cursor.execute(LEDGER_DDL)
+    ledger = read_ledger(connection)
+    connection.commit()
+    return ledger
+
+
+def supabase_history(connection) -> set[str]:
+    """Versions the Supabase CLI has already recorded as applied."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('supabase_migrations.schema_migrations')")
+        if cursor.fetchone()[0] is None:
+            return set()
+        cursor.execute("SELECT version FROM supabase_migrations.schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def record(cursor, version: str, filename: str, digest: str, duration_ms: int | None, baseline: bool) -> None:
+    cursor.execute(
+        """
+        INSERT INTO maintenance.migration_ledger
+            (filename, version, checksum, duration_ms, applied_by, baseline)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (filename) DO UPDATE
+        SET checksum = EXCLUDED.checksum,
+            applied_at = now(),
+            duration_ms = EXCLUDED.duration_ms,
+            applied_by = EXCLUDED.applied_by,
+            baseline = EXCLUDED.baseline
+        """,
+        (filename, version, digest, duration_ms, getpass.getuser(), baseline),
+    )
+
+
+def apply_file(connection, version: str, filename: str, path: Path, digest: str) -> int:
+    """Execute one migration and its ledger row atomically (statement by statement when it
+    cannot run in a transaction); returns elapsed ms."""
+    sql, autocommit = prepare(path.read_text(encoding="utf-8"))
+    started = time.perf_counter()
+    if autocommit:
+        # Cannot be wrapped in a transaction, not even the implicit one of a
+        # multi-statement query: run statement by statement, ledger row last.
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                for statement in split(sql):
+                    cursor.execute(statement)
+        finally:
+            connection.autocommit = False
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        with connection.cursor() as cursor:
+            record(cursor, version, filename, digest, duration_ms, baseline=False)
+        connection.commit()
+        return duration_ms
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            record(cursor, version, filename, digest, duration_ms, baseline=False)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return duration_ms
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--status", action="store_true", help="Show pending/changed files without applying")
+    parser.add_argument("--only", action="append", help="Restrict to these migration filenames (repeatable)")
+    parser.add_argument(
+        "--adopt-supabase-history",
+        action="store_true",
+        help="Record files listed in supabase_migrations.schema_migrations as applied without running them",
+    )
+    parser.add_argument(
+        "--baseline-through",
+        metavar="VERSION",
+        help="Record every file up to and including VERSION as applied without running it",
+    )
+    parser.add_argument("--database-url", help="Target database (default: SUPABASE_DB_URL / DATABASE_URL)")
+    parser.add_argument("--accept-changed", action="store_true", help="Update checksums of edited, already-applied files")
+    args = parser.parse_args(argv)
+
+    migrations = local_migrations(args.only)
+    connection = connect(args.database_url, connect_timeout=10)
+    connection.autocommit = False
+    if args.status:
+        connection.set_session(readonly=True)
+    try:
+        if args.status:
+            ledger = read_ledger(connection)
+            if ledger is None:
+                print("Migration ledger not initialised (maintenance.migration_ledger is missing)")
+                ledger = {}
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", (LOCK_KEY,))
+                if not cursor.fetchone()[0]:
+                    raise SystemExit("Another migration run holds the lock")
+            connection.commit()
+            ledger = ensure_ledger(connection)
+        adopted = supabase_history(connection) if args.adopt_supabase_history else set()
+
+        started = time.perf_counter()
+        pending, changed, baselined = [], [], 0
+        digests = {}
+        for version, filename, path in migrations:
+            digest = digests[filename] = checksum(path)
+            recorded = ledger.get(filename)
+            if recorded == digest:
+                continue
+            if recorded is not None:
+                changed.append((version, filename, path))
+                continue
+            if version in adopted or (args.baseline_through and version <= args.baseline_through):
+                if not args.status:
+                    with connection.cursor() as cursor:
+                        record(cursor, version, filename, digest, None, baseline=True)
+                baselined += 1
+                continue
+            pending.append((version, filename, path))
+        connection.commit()
+
+        print(f"{len(migrations)} migration files, {len(ledger)} in ledger, hashed in {time.perf_counter() - started:.2f}s")
+        if baselined:
+            print(f"Baselined {baselined} file(s) as already applied")
+        for _, filename, _ in changed:
+            print(f"CHANGED since applied: {filename}")
+        if args.accept_changed and changed and not args.status:
+            with connection.cursor() as cursor:
+                for version, filename, _ in changed:
+                    record(cursor, version, filename, digests[filename], None, baseline=True)
+            connection.commit()
+            print(f"Accepted {len(changed)} changed checksum(s)")
+        print(f"{len(pending)} pending")
+
+        if args.status:
+            for _, filename, _ in pending:
+                print(f"  PENDING {filename}")
+            return
+
+        total_ms = 0
+        for version, filename, path in pending:
+            try:
+                duration_ms = apply_file(connection, version, filename, path, digests[filename])
+            except Exception as error:
+                print(f"  FAILED  {filename}: {str(error).strip()[:300]}", file=sys.stderr)
+                raise SystemExit(1)
+            total_ms += duration_ms
+            print(f"  APPLIED {filename} ({duration_ms} ms)")
+        print(f"Applied {len(pending)} migration(s) in {total_ms / 1000:.2f}s")
+    finally:
+        connection.rollback()
+        if not args.status:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+            connection.commit()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Receivables aging per customer and per contract for any as-of dates.
+
+recompute_invoice_days_overdue (migration 20260709000004) and the
+customer_aging_analysis rows only describe today. Here every invoice and every
+dated settlement is read once:
+
+  payment_allocations (allocation_type 'invoice')  effective on the payment's
+      payment_date; a voided allocation counts until its voided_at
+  payments.invoice_id                              except while the payment has
+      an active invoice allocation (links that predate the allocation ledger)
+
+Both follow canonical_invoice_paid_amount (migration 20260712052000): only
+completed receipts count, and a linked payment is dropped exactly while one of
+its own invoice allocations is in effect.
+
+Settlements are sorted by (invoice, date) with a cumulative sum, so the amount
+paid on every invoice as of every requested date is one binary search over a
+dates x invoices grid. Outstanding amounts are bucketed by days past due
+(invoice_date when there is no due_date) and summed per (date, customer,
+bucket) and (date, contract, bucket) with grouped sums, so a monthly history
+of the whole company is a handful of array operations.
+
+Usage:
+    python scripts/ar_aging.py                                    # as of today
+    python scripts/ar_aging.py --as-of 2025-06-30 --buckets 30,60,90,120
+    python scripts/ar_aging.py --monthly 2024-01 2025-12 --format csv --output aging.csv
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+from db_connection import connect, get_company_id
+from money import company_scale, group_sum, minor_array, to_major
+from payment_allocator import COMPLETED_RECEIPT
+
+
+DAY_OFFSET = 2**31
+DEFAULT_BUCKETS = (30, 60, 90)
+NO_CUSTOMER = "(no customer)"
+NO_CONTRACT = "(no contract)"
+
+INVOICES = """
+    SELECT i.id, i.customer_id, i.contract_id, i.invoice_number, i.invoice_date, i.due_date,
+           i.total_amount, i.paid_amount, c.customer_code, ct.contract_number
+    FROM invoices i
+    LEFT JOIN customers c ON c.id = i.customer_id
+    LEFT JOIN contracts ct ON ct.id = i.contract_id
+    WHERE i.company_id = %(company)s
+      AND COALESCE(i.status, '') <> 'cancelled'
+      AND i.total_amount > 0
+"""
+ALLOCATIONS = """
+    SELECT pa.payment_id, pa.target_id, COALESCE(p.payment_date, pa.allocated_date::date), pa.voided_at::date,
+           pa.amount, pa.is_active
+    FROM payment_allocations pa
+    JOIN payments p ON p.id = pa.payment_id
+    WHERE pa.company_id = %(company)s
+      AND pa.allocation_type = 'invoice'
+      AND (pa.is_active OR pa.voided_at IS NOT NULL)
+""" + COMPLETED_RECEIPT
+LINKED_PAYMENTS = """
+    SELECT p.id, p.invoice_id, p.payment_date, p.amount
+    FROM payments p
+    WHERE p.company_id = %(company)s
+      AND p.invoice_id IS NOT NULL
+""" + COMPLETED_RECEIPT
+
+
+def _day(value) -> int:
+    return int(np.datetime64(str(value)[:10], "D").astype(np.int64))
+
+
+def _merge(periods: list[tuple[int, int | None]]) -> list[tuple[int, int | None]]:
+    """Union of [start, end) day ranges (end None: open), as disjoint ranges."""
+    merged = []
+    for start, end in sorted(periods, key=lambda period: period[0]):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1]):
+            last_end = merged[-1][1]
+            merged[-1] = (merged[-1][0], None if last_end is None or end is None else max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def bucket_labels(bounds: tuple[int, ...]) -> list[str]:
+    """current, 1-30, 31-60, ..., <last>+ for bounds (30, 60, ...)."""
+    labels, low = ["current"], 1
+    for bound in bounds:
+        labels.append(f"{low}-{bound}")
+        low = bound + 1
+    return labels + [f"{bounds[-1]}+"]
+
+
+def month_ends(first: str, last: str) -> list[str]:
+    """Last day of every month from YYYY-MM to YYYY-MM inclusive."""
+    months = np.arange(np.datetime64(first[:7], "M"), np.datetime64(last[:7], "M") + 1)
+    return [str(day) for day in ((months + 1).astype("datetime64[D]") - 1)]
+
+
+class Receivables:
+    """Invoices with their dated settlements, sorted by (invoice, date)."""
+
+    def __init__(self, invoices: list[tuple], allocations: list[tuple], linked_payments: list[tuple], scale: int = 2):
+        self.scale = scale
+        self.invoice_ids = [str(row[0]) for row in invoices]
+        self.invoice_index = {invoice_id: i for i, invoice_id in enumerate(self.invoice_ids)}
+        self.invoice_number = np.array([row[3] for row in invoices], dtype=object)
+        self.issued = np.array([_day(row[4]) for row in invoices], dtype=np.int64)
+        self.due = np.array([_day(row[5] or row[4]) for row in invoices], dtype=np.int64)
+        self.amount = minor_array([row[6] for row in invoices], scale)
+        self.paid_amount = minor_array([row[7] for row in invoices], scale)
+
+        self.customers, self.customer = self._intern([row[1] for row in invoices])
+        self.contracts, self.contract = self._intern([row[2] for row in invoices])
+        self.customer_code = {str(row[1]): row[8] for row in invoices if row[1]}
+        self.contract_number = {str(row[2]): row[9] for row in invoices if row[2]}
+
+        # Settlement events: +amount when an allocation (or linked payment) takes
+        # effect, -amount when a voided allocation stops counting.
+        events = []
+        allocated = {}  # payment -> [start, end) days of its invoice allocations, end None while active
+        for payment_id, target, effective, voided, amount, active in allocations:
+            start = _day(effective)
+            end = None if active else max(_day(voided), start)
+            allocated.setdefault(str(payment_id), []).append((start, end))
+            invoice = self.invoice_index.get(str(target))
+            if invoice is None:
+                continue
+            events.append((invoice, start, amount))
+            if end is not None:
+                events.append((invoice, end, -amount))
+        for payment_id, invoice_id, paid_on, amount in linked_payments:
+            invoice = self.invoice_index.get(str(invoice_id))
+            if invoice is None:
+                continue
+            # The link counts from payment_date, minus every period in which the
+            # payment has an invoice allocation in effect (overlaps merged).
+            paid_day = _day(paid_on)
+            events.append((invoice, paid_day, amount))
+            for start, end in _merge(allocated.get(str(payment_id), [])):
+                if end is not None and end <= paid_day:
+                    continue
+                events.append((invoice, max(start, paid_day), -amount))
+                if end is not None:
+                    events.append((invoice, end, amount))
+        invoice = np.array([event[0] for event in events], dtype=np.int64)
+        day = np.array([event[1] for event in events], dtype=np.int64)
+        value = minor_array([event[2] for event in events], scale)
+        order = np.lexsort((day, invoice))
+        self.event_key = (invoice[order] << 32) | (day[order] + DAY_OFFSET)
+        self.event_cumulative = np.concatenate(([0], np.cumsum(value[order]))).astype(np.int64)
+        self.event_offsets = np.searchsorted(invoice[order], np.arange(len(self.invoice_ids) + 1))
+
+    @staticmethod
+    def _intern(values: list) -> tuple[list, np.ndarray]:
+        labels, index = [], {}
+        codes = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            key = str(value) if value else None
+            if key not in index:
+                index[key] = len(labels)
+                labels.append(key)
+            codes[i] = index[key]
+        return labels, codes
+
+    @classmethod
+    def load(cls, company_id: str, database_url: str | None = None) -> "Receivables":
+        params = {"company": company_id}
+        connection = connect(database_url, connect_timeout=10)
+        connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(INVOICES, params)
+                invoices = cursor.fetchall()
+                cursor.execute(ALLOCATIONS, params)
+                allocations = cursor.fetchall()
+                cursor.execute(LINKED_PAYMENTS, params)
+                linked_payments = cursor.fetchall()
+                scale = company_scale(cursor, company_id)
+        finally:
+            connection.rollback()
+            connection.close()
+        return cls(invoices, allocations, linked_payments, scale)
+
+    @property
+    def n_invoices(self) -> int:
+        return len(self.invoice_ids)
+
+    def paid(self, as_of: np.ndarray) -> np.ndarray:
+        """Settled amount of every invoice as of every date: a (dates, invoices) array."""
+        invoices = np.arange(self.n_invoices, dtype=np.int64)
+        query = (invoices[None, :] << 32) | (as_of[:, None] + DAY_OFFSET)
+        position = np.searchsorted(self.event_key, query, side="right")
+        return self.event_cumulative[position] - self.event_cumulative[self.event_offsets[:-1]][None, :]
+
+    def outstanding(self, as_of: np.ndarray) -> np.ndarray:
+        """Open amount of every invoice issued by each date (0 before issue, never negative)."""
+        open_amount = np.clip(self.amount[None, :] - self.paid(as_of), 0, None)
+        return np.where(self.issued[None, :] <= as_of[:, None], open_amount, 0)
+
+    def aging(self, as_of: list[str], bounds: tuple[int, ...] = DEFAULT_BUCKETS, by: str = "customer") -> np.ndarray:
+        """(dates, groups, buckets) outstanding amounts, grouped by customer or contract."""
+        days = np.array([_day(value) for value in as_of], dtype=np.int64)
+        groups = self.customer if by == "customer" else self.contract
+        n_groups = len(self.customers if by == "customer" else self.contracts)
+        n_buckets = len(bounds) + 2
+        outstanding = self.outstanding(days)
+        overdue = days[:, None] - self.due[None, :]
+        bucket = np.where(overdue <= 0, 0, 1 + np.searchsorted(np.asarray(bounds), overdue, side="left"))
+        cell = (np.arange(len(days))[:, None] * n_groups + groups[None, :]) * n_buckets + bucket
+        open_cells = outstanding > 0
+        totals = group_sum(cell[open_cells], outstanding[open_cells], len(days) * n_groups * n_buckets)
+        return totals.reshape(len(days), n_groups, n_buckets)
+
+    def unexplained(self) -> np.ndarray:
+        """Invoices whose paid_amount differs from their dated settlements today."""
+        settled = self.event_cumulative[self.event_offsets[1:]] - self.event_cumulative[self.event_offsets[:-1]]
+        return np.flatnonzero(np.minimum(settled, self.amount) != np.minimum(self.paid_amount, self.amount))
+
+    def label(self, by: str, group: int) -> tuple[str | None, str]:
+        if by == "customer":
+            group_id = self.customers[group]
+            return group_id, (self.customer_code.get(group_id) or group_id or NO_CUSTOMER)
+        group_id = self.contracts[group]
+        return group_id, (self.contract_number.get(group_id) or group_id or NO_CONTRACT)
+
+
+def aging_rows(book: Receivables, as_of: list[str], bounds: tuple[int, ...], by: str) -> list[dict]:
+    """One row per (as-of date, group) with a non-zero balance, amounts in major units."""
+    labels = bucket_labels(bounds)
+    table = book.aging(as_of, bounds, by)
+    rows = []
+    for d, g in zip(*np.nonzero(table.sum(axis=2))):
+        group_id, label = book.label(by, int(g))
+        buckets = table[d, g]
+        rows.append({
+            "as_of": as_of[d],
+            "level": by,
+            "group_id": group_id,
+            "group": label,
+            **{name: to_major(int(value), book.scale) for name, value in zip(labels, buckets.tolist())},
+            "total": to_major(int(buckets.sum()), book.scale),
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company (default FLEETIFY_COMPANY_ID)")
+    dates = parser.add_mutually_exclusive_group()
+    dates.add_argument("--as-of", action="append", help="As-of date (repeatable; default today)")
+    dates.add_argument("--monthly", nargs=2, metavar=("FROM", "TO"), help="Every month end from YYYY-MM to YYYY-MM")
+    parser.add_argument("--buckets", default=",".join(map(str, DEFAULT_BUCKETS)),
+                        help="Upper bounds of the overdue buckets in days (default 30,60,90)")
+    parser.add_argument("--by", choices=("customer", "contract", "both"), default="customer")
+    parser.add_argument("--format", choices=("console", "csv", "json"), default="console")
+    parser.add_argument("--output", help="Write csv or json here instead of stdout")
+    parser.add_argument("--limit", type=int, default=20, help="Groups shown per date on the console")
+    args = parser.parse_args()
+
+    bounds = tuple(sorted(int(value) for value in args.buckets.split(",") if value.strip()))
+    if not bounds or bounds[0] <= 0:
+        parser.error("--buckets needs positive day counts, e.g. 30,60,90")
+    as_of = month_ends(*args.monthly) if args.monthly else sorted(args.as_of or [date.today().isoformat()])
+    levels = ("customer", "contract") if args.by == "both" else (args.by,)
+
+    started = time.perf_counter()
+    book = Receivables.load(args.company_id or get_company_id())
+    loaded = time.perf_counter() - started
+    rows = [row for by in levels for row in aging_rows(book, as_of, bounds, by)]
+    computed = time.perf_counter() - started - loaded
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(rows, out, ensure_ascii=False, indent=2, default=str)
+        elif args.format == "csv":
+            fields = ["as_of", "level", "group_id", "group", *bucket_labels(bounds), "total"]
+            writer = csv.DictWriter(out, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            labels = bucket_labels(bounds)
+            print(f"{book.n_invoices} invoices, {len(as_of)} as-of dates "
+                  f"(loaded in {loaded:.1f}s, aged in {computed:.2f}s)", file=out)
+            unexplained = book.unexplained()
+            if len(unexplained):
+                print(f"  {len(unexplained)} invoices have a paid_amount not explained by dated settlements", file=out)
+            for by in levels:
+                for day in as_of:
+                    dated = sorted((row for row in rows if row["level"] == by and row["as_of"] == day),
+                                   key=lambda row: row["total"], reverse=True)
+                    totals = [sum(row[name] for row in dated) for name in (*labels, "total")]
+                    print(f"\n{by} aging as of {day}: " + ", ".join(
+                        f"{name} {value:,}" for name, value in zip((*labels, "total"), totals)
+                    ), file=out)
+                    if len(as_of) == 1:
+                        print(f"  {by.capitalize():<24}" + "".join(f"{name:>14}" for name in (*labels, "total")),
+                              file=out)
+                        for row in dated[:args.limit]:
+                            print(f"  {str(row['group'])[:24]:<24}" + "".join(
+                                f"{row[name]:>14,}" for name in (*labels, "total")
+                            ), file=out)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@
 import json, sys
 from collections import defaultdict
 
+from coa_validator import validate as validate_coa
+from ledger_engine import Ledger
+from money import format_minor, to_minor
+
 def load(path):
     try:
         with open(path) as f:
@@ -29,69 +33,56 @@ print("\n" + "=" * 60)
 print("DOMAIN 1: DOUBLE-ENTRY INTEGRITY")
 print("=" * 60)
 
+ledger = Ledger.from_records(je, jel, coa)
+line_debit, line_credit, line_count = ledger.entry_totals()
+
 # Check header-level balance (total_debit vs total_credit on journal_entries)
-unbalanced_header = [e for e in je if abs(float(e.get('total_debit',0)) - float(e.get('total_credit',0))) > 0.01]
+unbalanced_header = ledger.header_unbalanced_entries()
 print(f"\n1a. Journal Entries (header-level balance):")
-print(f"  Total JEs: {len(je)}")
+print(f"  Total JEs: {ledger.n_entries}")
 print(f"  Unbalanced (total_debit != total_credit): {len(unbalanced_header)}")
-if unbalanced_header:
+if len(unbalanced_header):
     print("  CRITICAL FINDINGS:")
-    for e in unbalanced_header[:10]:
-        diff = float(e['total_debit']) - float(e['total_credit'])
-        print(f"    {e['entry_number']}: D={e['total_debit']} C={e['total_credit']} diff={diff}")
+    for i in unbalanced_header[:10]:
+        diff = ledger.entry_debit[i] - ledger.entry_credit[i]
+        print(f"    {ledger.entry_number[i]}: D={ledger.fmt(ledger.entry_debit[i])} C={ledger.fmt(ledger.entry_credit[i])} diff={ledger.fmt(diff)}")
 else:
     print("  PASS: All journal entries have balanced debit=credit at header level.")
 
 # Check line-level balance (sum of debit_amount vs credit_amount per JE)
-je_line_sums = defaultdict(lambda: {'debit': 0, 'credit': 0, 'count': 0})
-for line in jel:
-    jid = line.get('journal_entry_id')
-    if jid:
-        je_line_sums[jid]['debit'] += float(line.get('debit_amount') or 0)
-        je_line_sums[jid]['credit'] += float(line.get('credit_amount') or 0)
-        je_line_sums[jid]['count'] += 1
-
-unbalanced_lines = []
-for jid, sums in je_line_sums.items():
-    if abs(sums['debit'] - sums['credit']) > 0.01:
-        unbalanced_lines.append((jid, sums))
-
+unbalanced_lines = ledger.unbalanced_entries()
 print(f"\n1b. Journal Entry Lines (line-level balance):")
-print(f"  Total JEs with lines: {len(je_line_sums)}")
+print(f"  Total JEs with lines: {int((line_count > 0).sum())}")
+print(f"  Lines whose JE is not in the export: {len(ledger.orphan_lines())}")
 print(f"  Unbalanced JEs (sum(debit) != sum(credit)): {len(unbalanced_lines)}")
-if unbalanced_lines:
+if len(unbalanced_lines):
     print("  CRITICAL FINDINGS:")
-    for jid, sums in unbalanced_lines[:10]:
-        diff = sums['debit'] - sums['credit']
-        print(f"    JE ID {jid}: D={sums['debit']} C={sums['credit']} diff={diff} lines={sums['count']}")
+    for i in unbalanced_lines[:10]:
+        diff = line_debit[i] - line_credit[i]
+        print(f"    JE ID {ledger.entry_ids[i]}: D={ledger.fmt(line_debit[i])} C={ledger.fmt(line_credit[i])} diff={ledger.fmt(diff)} lines={line_count[i]}")
 else:
     print("  PASS: All journal entry lines have balanced debit=credit at line level.")
 
 # Check for JEs with no lines
-je_ids = set(e['id'] for e in je)
-je_ids_with_lines = set(je_line_sums.keys())
-jes_without_lines = je_ids - je_ids_with_lines
+jes_without_lines = ledger.entries_without_lines()
 print(f"\n1c. JEs without any lines:")
 print(f"  JEs with no lines: {len(jes_without_lines)}")
-if jes_without_lines:
+if len(jes_without_lines):
     print("  WARNING: These entries have no detail lines (cannot verify balance):")
-    for jid in list(jes_without_lines)[:5]:
-        print(f"    {jid}")
+    for i in jes_without_lines[:5]:
+        print(f"    {ledger.entry_ids[i]}")
 
 # Check for entries with only 1 line (double-entry requires >= 2)
-single_line_jes = [jid for jid, sums in je_line_sums.items() if sums['count'] < 2]
+single_line_jes = ledger.single_line_entries()
 print(f"\n1d. JEs with fewer than 2 lines (violates double-entry):")
 print(f"  Count: {len(single_line_jes)}")
-if single_line_jes:
+if len(single_line_jes):
     print("  CRITICAL: Double-entry requires at least 2 lines per entry.")
 
 # Status breakdown
-status_counts = defaultdict(int)
-for e in je:
-    status_counts[e.get('status','unknown')] += 1
 print(f"\n1e. JE Status breakdown:")
-for status, count in sorted(status_counts.items()):
-    print(f"  {status}: {count}")
+for status, count in sorted(ledger.status_counts().items(), key=lambda item: str(item[0])):
+    print(f"  {status or 'unknown'}: {count}")
 
 # ===== DOMAIN 2: Chart of Accounts =====
 print("\n" + "=" * 60)
@@ -107,43 +98,43 @@ print(f"\n2a. Account types:")
 for t, c in sorted(type_counts.items()):
     print(f"  {t}: {c}")
 
+coa_findings = defaultdict(list)
+for finding in validate_coa(ledger):
+    coa_findings[finding.check].append(finding)
+
 # Check for accounts with NULL/invalid types
-invalid_types = [a for a in coa if a.get('account_type') not in ('assets','liabilities','equity','revenue','expense')]
+invalid_types = coa_findings['invalid_type']
 print(f"\n2b. Accounts with invalid/NULL type: {len(invalid_types)}")
-if invalid_types:
-    for a in invalid_types[:5]:
-        print(f"  {a.get('account_code')}: type={a.get('account_type')}")
+for f in invalid_types[:5]:
+    print(f"  {f.account_code}: {f.detail}")
 
 # Check for duplicate account codes
-codes = [a.get('account_code') for a in coa if a.get('account_code')]
-dupes = [c for c in codes if codes.count(c) > 1]
-print(f"\n2c. Duplicate account codes: {len(set(dupes))}")
+dupes = sorted({f.account_code for f in coa_findings['duplicate_code']})
+print(f"\n2c. Duplicate account codes: {len(dupes)}")
 if dupes:
-    print(f"  Duplicate codes: {list(set(dupes))[:10]}")
+    print(f"  Duplicate codes: {dupes[:10]}")
 
 # Check header accounts (should not have postings)
 headers = [a for a in coa if a.get('is_header') == True]
 non_headers = [a for a in coa if a.get('is_header') == False]
 print(f"\n2d. Header accounts: {len(headers)}, Postable accounts: {len(non_headers)}")
+print(f"  Header accounts with postings: {len(coa_findings['header_postings'])}")
+for f in coa_findings['header_postings'][:5]:
+    print(f"    {f.account_code}: {f.detail}")
+print(f"  Parents not flagged is_header: {len(coa_findings['parent_not_header'])}")
+print(f"  Headers without children: {len(coa_findings['header_without_children'])}")
 
 # Check inactive accounts
 inactive = [a for a in coa if a.get('is_active') == False]
 print(f"\n2e. Inactive accounts: {len(inactive)}")
 
 # Parent-child hierarchy check
-accounts_by_id = {a.get('id'): a for a in coa}
-circular = []
-missing_parent = []
-for a in coa:
-    pid = a.get('parent_account_id')
-    if pid:
-        if pid == a.get('id'):
-            circular.append(a)
-        if pid not in accounts_by_id:
-            missing_parent.append(a)
 print(f"\n2f. Hierarchy issues:")
-print(f"  Circular references (account is own parent): {len(circular)}")
-print(f"  Missing parent accounts: {len(missing_parent)}")
+print(f"  Cycles (incl. account is own parent): {len(coa_findings['cycle'])}")
+print(f"  Missing parent accounts: {len(coa_findings['orphan_parent']) + len(coa_findings['unresolved_parent_code'])}")
+print(f"  Parent in another company: {len(coa_findings['cross_company_parent'])}")
+print(f"  parent_account_code disagrees with parent: {len(coa_findings['parent_code_mismatch'])}")
+print(f"  account_level disagrees with tree depth: {len(coa_findings['level_mismatch'])}")
 
 # ===== DOMAIN 3: GL & Sub-Ledger Reconciliation =====
 print("\n" + "=" * 60)
@@ -176,25 +167,24 @@ print("DOMAIN 4: TRIAL BALANCE (from account balances)")
 print("=" * 60)
 
 # Sum current_balance by account_type
-type_balances = defaultdict(float)
+type_balances = defaultdict(int)
 for a in coa:
-    balance = float(a.get('current_balance') or 0)
-    type_balances[a.get('account_type','unknown')] += balance
+    type_balances[a.get('account_type','unknown')] += to_minor(a.get('current_balance'))
 print(f"\n4a. Account balances by type:")
 for t, b in sorted(type_balances.items()):
-    print(f"  {t}: {b:,.2f}")
+    print(f"  {t}: {format_minor(b)}")
 
 total_assets = type_balances.get('assets', 0)
 total_liabilities = type_balances.get('liabilities', 0)
 total_equity = type_balances.get('equity', 0)
 print(f"\n4b. Accounting equation check:")
-print(f"  Assets: {total_assets:,.2f}")
-print(f"  Liabilities: {total_liabilities:,.2f}")
-print(f"  Equity: {total_equity:,.2f}")
-print(f"  L+E = {total_liabilities + total_equity:,.2f}")
+print(f"  Assets: {format_minor(total_assets)}")
+print(f"  Liabilities: {format_minor(total_liabilities)}")
+print(f"  Equity: {format_minor(total_equity)}")
+print(f"  L+E = {format_minor(total_liabilities + total_equity)}")
 diff = abs(total_assets - (total_liabilities + total_equity))
-print(f"  Difference (Assets - (Liabilities+Equity)): {diff:,.2f}")
-if diff > 0.01:
+print(f"  Difference (Assets - (Liabilities+Equity)): {format_minor(diff)}")
+if diff:
     print("  WARNING: Accounting equation not balanced!")
 else:
     print("  PASS: Accounting equation balances.")
@@ -2,6 +2,9 @@
 import json
 from collections import defaultdict
 
+from coa_validator import validate as validate_coa
+from ledger_engine import Ledger
+
 TMP = r'C:\Users\khamis\AppData\Local\Temp'
 with open(f'{TMP}\\je.json', encoding='utf-8') as f:
     je = json.load(f)
@@ -72,20 +75,19 @@ print(f'  Total: {len(coa)}')
 types = defaultdict(int)
 for a in coa: types[a.get('account_type','MISSING')] += 1
 print(f'  Types: {dict(types)}')
-invalid = [a for a in coa if a.get('account_type') not in ('assets','liabilities','equity','revenue','expense')]
-print(f'  Invalid types: {len(invalid)}')
-codes = [a.get('account_code') for a in coa if a.get('account_code')]
-dupes = set([c for c in codes if codes.count(c)>1])
-print(f'  Duplicate codes: {len(dupes)} {list(dupes)[:5] if dupes else ""}')
+coa_issues = defaultdict(list)
+for finding in validate_coa(Ledger.from_records(je, jel, coa)):
+    coa_issues[finding.check].append(finding)
+print(f'  Invalid types: {len(coa_issues["invalid_type"])}')
+dupes = sorted({f.account_code for f in coa_issues['duplicate_code']})
+print(f'  Duplicate codes: {len(dupes)} {dupes[:5] if dupes else ""}')
 headers = [a for a in coa if a.get('is_header')]
-print(f'  Headers: {len(headers)}, Postable: {len(coa)-len(headers)}')
+print(f'  Headers: {len(headers)}, Postable: {len(coa)-len(headers)}, headers with postings: {len(coa_issues["header_postings"])}')
 inactive = [a for a in coa if a.get('is_active') is False]
 print(f'  Inactive: {len(inactive)}')
-by_id = {a.get('id'): a for a in coa}
-circular = [a for a in coa if a.get('parent_account_id') and a.get('parent_account_id')==a.get('id')]
-missing_parent = [a for a in coa if a.get('parent_account_id') and a.get('parent_account_id') not in by_id]
-print(f'  Circular refs: {len(circular)}')
-print(f'  Missing parents: {len(missing_parent)}')
+print(f'  Cycles: {len(coa_issues["cycle"])}')
+print(f'  Missing parents: {len(coa_issues["orphan_parent"]) + len(coa_issues["unresolved_parent_code"])}')
+print(f'  Level mismatches: {len(coa_issues["level_mismatch"])}, parents not flagged header: {len(coa_issues["parent_not_header"])}')
 
 # DOMAIN 3: GL Linkage
 print()
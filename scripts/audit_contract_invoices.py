@@ -7,6 +7,8 @@ import requests, time, json
 from dotenv import dotenv_values
 from collections import defaultdict
 
+from money import format_minor, to_major, to_minor
+
 vals = dotenv_values('.env')
 BASE_URL = vals.get('VITE_SUPABASE_URL', '').strip()
 SRK = vals.get('SUPABASE_SERVICE_ROLE_KEY', '').strip()
@@ -109,7 +111,7 @@ for inv in invoices:
             'contract_start': start or 'NULL',
             'contract_end': end or 'NULL',
             'violation_type': 'CONTRACT_MISSING_DATES',
-            'total_amount': inv.get('total_amount', 0),
+            'total_amount': to_minor(inv.get('total_amount')),
             'invoice_status': inv.get('status', '?'),
             'payment_status': inv.get('payment_status', '?'),
         })
@@ -136,7 +138,7 @@ for inv in invoices:
                 'contract_start': start,
                 'contract_end': end,
                 'violation_type': violation_type,
-                'total_amount': float(inv.get('total_amount', 0) or 0),
+                'total_amount': to_minor(inv.get('total_amount')),
                 'invoice_status': inv.get('status', '?'),
                 'payment_status': inv.get('payment_status', '?'),
             })
@@ -153,7 +155,7 @@ for inv in invoices:
             'contract_start': start,
             'contract_end': end,
             'violation_type': 'INVOICE_MISSING_DATE',
-            'total_amount': float(inv.get('total_amount', 0) or 0),
+            'total_amount': to_minor(inv.get('total_amount')),
             'invoice_status': inv.get('status', '?'),
             'payment_status': inv.get('payment_status', '?'),
         })
@@ -189,7 +191,7 @@ report_lines.append("")
 
 # Violation breakdown by type
 by_type = defaultdict(int)
-by_type_amount = defaultdict(float)
+by_type_amount = defaultdict(int)
 for v in violations:
     by_type[v['violation_type']] += 1
     by_type_amount[v['violation_type']] += v.get('total_amount', 0)
@@ -197,7 +199,7 @@ for v in violations:
 report_lines.append("VIOLATION BREAKDOWN")
 report_lines.append("-" * 40)
 for vtype, count in sorted(by_type.items(), key=lambda x: -x[1]):
-    report_lines.append(f"  {vtype}: {count} invoices (QAR {by_type_amount[vtype]:,.2f})")
+    report_lines.append(f"  {vtype}: {count} invoices (QAR {format_minor(by_type_amount[vtype])})")
 report_lines.append("")
 
 # Detailed violations
@@ -210,7 +212,7 @@ if violations:
         report_lines.append(
             f"{v['invoice_number'][:39]:<40} {v['invoice_date']:<12} {v['contract_number'][:14]:<15} "
             f"{v['contract_start']:<12} {v['contract_end']:<12} {v['violation_type']:<25} "
-            f"{v['total_amount']:>10,.2f} {v['invoice_status']:<10}"
+            f"{to_major(v['total_amount']):>10,.2f} {v['invoice_status']:<10}"
         )
     report_lines.append("")
 
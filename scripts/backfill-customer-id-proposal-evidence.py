@@ -10,8 +10,9 @@ from urllib.request import Request, urlopen
 
 import pypdfium2 as pdfium
 
+from db_connection import get_company_id, write_company_result
+
 
-COMPANY_ID = "24bc0b21-4e2d-4413-9842-31719a3669f4"
 BUCKET = "contract-documents"
 
 
@@ -66,6 +67,7 @@ def render_pdf_page(pdf_bytes: bytes, page_number: int) -> bytes:
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--company-id", default=get_company_id())
     parser.add_argument(
         "--ocr-crop",
         action="store_true",
@@ -86,7 +88,7 @@ def main() -> None:
             "id,page_number,contract_document_id,proposed_changes,extracted_data,"
             "contract_documents(document_name,file_path,mime_type)"
         ),
-        "company_id": f"eq.{COMPANY_ID}",
+        "company_id": f"eq.{args.company_id}",
         "status": "in.(pending,partial)",
         "evidence_image_path": "is.null",
         "order": "created_at.asc",
@@ -122,7 +124,7 @@ def main() -> None:
             )
             png_bytes = render_pdf_page(pdf_bytes, int(page_number))
             evidence_path = (
-                f"id-scan-evidence/{COMPANY_ID}/{document_id}/page-{page_number}.png"
+                f"id-scan-evidence/{args.company_id}/{document_id}/page-{page_number}.png"
             )
 
             request_bytes(
@@ -205,6 +207,7 @@ def main() -> None:
         f"Complete: succeeded={succeeded} cropped={cropped} failed={failed}",
         flush=True,
     )
+    write_company_result({"succeeded": succeeded, "cropped": cropped, "failed": failed})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Keep chart_of_accounts.current_balance current from journal deltas instead of full recomputes.
+
+The maintainer remembers, in the maintenance schema, what every journal entry
+has already contributed to each account (maintenance.balance_applied) and the
+running debit/credit per account (maintenance.account_balances). A sync picks
+up only the entries touched since the last watermark -- entries whose
+updated_at moved (status changes such as posting, un-posting or reversal) and
+entries with inserted or edited lines (journal_entry_lines.updated_at; editing a
+line's amount or account does not touch its entry) -- recomputes their contribution, applies the
+difference to the running totals and writes current_balance for the touched
+accounts. Contributions follow update_account_balances_from_entries: lines of
+posted entries, signed by balance_type, header accounts left alone.
+
+Every VERIFY_EVERY syncs (and on --verify) the running totals are compared
+with a full recomputation; drift is reported and, with --repair, rebuilt.
+Deleted lines or entries are only picked up by that verification.
+
+Usage:
+    python scripts/balance_maintainer.py            # incremental sync
+    python scripts/balance_maintainer.py --verify   # sync, then compare with a full recompute
+    python scripts/balance_maintainer.py --rebuild  # reset the state from all posted lines
+"""
+import argparse
+import time
+
+from db_connection import connect
+
+
+LOCK_KEY = 727_001_038
+SCOPE = "global"
+# Re-scan this far behind the watermark: a transaction can commit after a
+# later one and carry an older timestamp. Re-applying an entry is idempotent.
+OVERLAP = "5 minutes"
+VERIFY_EVERY = 50
+
+STATE_DDL = """
+CREATE SCHEMA IF NOT EXISTS maintenance;
+CREATE TABLE IF NOT EXISTS maintenance.balance_watermark (
+    scope TEXT PRIMARY KEY,
+    entries_updated_at TIMESTAMPTZ,
+    lines_updated_at TIMESTAMPTZ,
+    syncs_since_verify INTEGER NOT NULL DEFAULT 0,
+    last_sync_at TIMESTAMPTZ,
+    last_verified_at TIMESTAMPTZ
+);
+CREATE TABLE IF NOT EXISTS maintenance.balance_applied (
+    journal_entry_id UUID NOT NULL,
+    account_id UUID NOT NULL,
+    debit NUMERIC NOT NULL,
+    credit NUMERIC NOT NULL,
+    PRIMARY KEY (journal_entry_id, account_id)
+);
+CREATE TABLE IF NOT EXISTS maintenance.account_balances (
+    account_id UUID PRIMARY KEY,
+    debit NUMERIC NOT NULL DEFAULT 0,
+    credit NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+-- Earlier versions watched lines by created_at; an empty lines_updated_at forces one rebuild.
+ALTER TABLE maintenance.balance_watermark ADD COLUMN IF NOT EXISTS lines_updated_at TIMESTAMPTZ;
+"""
+
+POSTED_CONTRIBUTIONS = """
+    SELECT line.journal_entry_id, line.account_id,
+           SUM(COALESCE(line.debit_amount, 0)) AS debit,
+           SUM(COALESCE(line.credit_amount, 0)) AS credit
+    FROM public.journal_entry_lines line
+    JOIN public.journal_entries entry ON entry.id = line.journal_entry_id
+    WHERE lower(COALESCE(entry.status::text, '')) = 'posted'
+      {filter}
+    GROUP BY line.journal_entry_id, line.account_id
+"""
+
+# Accounts without any running row have no posted lines and balance to zero.
+WRITE_CURRENT_BALANCE = """
+    UPDATE public.chart_of_accounts account
+    SET current_balance = target.balance,
+        updated_at = now()
+    FROM (
+        SELECT touched.account_id,
+               CASE WHEN lower(coa.balance_type) = 'debit'
+                    THEN COALESCE(running.debit, 0) - COALESCE(running.credit, 0)
+                    ELSE COALESCE(running.credit, 0) - COALESCE(running.debit, 0)
+               END AS balance
+        FROM touched_accounts touched
+        JOIN public.chart_of_accounts coa ON coa.id = touched.account_id
+        LEFT JOIN maintenance.account_balances running ON running.account_id = touched.account_id
+    ) target
+    WHERE target.account_id = account.id
+      AND COALESCE(account.is_header, false) = false
+      AND account.current_balance IS DISTINCT FROM target.balance
+"""
+
+DRIFT_QUERY = """
+    WITH full_recompute AS (
+        SELECT account_id, SUM(debit) AS debit, SUM(credit) AS credit
+        FROM ({contributions}) contribution
+        GROUP BY account_id
+    )
+    SELECT COALESCE(running.account_id, full_recompute.account_id),
+           COALESCE(running.debit, 0) - COALESCE(running.credit, 0),
+           COALESCE(full_recompute.debit, 0) - COALESCE(full_recompute.credit, 0)
+    FROM maintenance.account_balances running
+    FULL JOIN full_recompute ON full_recompute.account_id = running.account_id
+    WHERE COALESCE(running.debit, 0) <> COALESCE(full_recompute.debit, 0)
+       OR COALESCE(running.credit, 0) <> COALESCE(full_recompute.credit, 0)
+""".format(contributions=POSTED_CONTRIBUTIONS.format(filter=""))
+
+
+def high_water(cursor) -> tuple:
+    cursor.execute(
+        "SELECT (SELECT max(updated_at) FROM public.journal_entries), "
+        "(SELECT max(updated_at) FROM public.journal_entry_lines)"
+    )
+    return cursor.fetchone()
+
+
+def save_watermark(cursor, entries_at, lines_at, *, verified: bool, reset: bool = False) -> None:
+    cursor.execute(
+        """
+        INSERT INTO maintenance.balance_watermark
+            (scope, entries_updated_at, lines_updated_at, syncs_since_verify, last_sync_at, last_verified_at)
+        VALUES (%(scope)s, %(entries_at)s, %(lines_at)s, 0, now(), CASE WHEN %(verified)s THEN now() END)
+        ON CONFLICT (scope) DO UPDATE
+        SET entries_updated_at = COALESCE(EXCLUDED.entries_updated_at, balance_watermark.entries_updated_at),
+            lines_updated_at = COALESCE(EXCLUDED.lines_updated_at, balance_watermark.lines_updated_at),
+            syncs_since_verify = CASE WHEN %(verified)s OR %(reset)s THEN 0
+                                      ELSE balance_watermark.syncs_since_verify + 1 END,
+            last_sync_at = now(),
+            last_verified_at = CASE WHEN %(verified)s THEN now() ELSE balance_watermark.last_verified_at END
+        """,
+        {"scope": SCOPE, "entries_at": entries_at, "lines_at": lines_at, "verified": verified, "reset": reset},
+    )
+
+
+def rebuild(cursor) -> int:
+    """Reset the running totals and applied contributions from every posted line."""
+    entries_at, lines_at = high_water(cursor)
+    cursor.execute("TRUNCATE maintenance.balance_applied, maintenance.account_balances")
+    cursor.execute(
+        "INSERT INTO maintenance.balance_applied (journal_entry_id, account_id, debit, credit) "
+        + POSTED_CONTRIBUTIONS.format(filter="")
+    )
+    cursor.execute(
+        """
+        INSERT INTO maintenance.account_balances (account_id, debit, credit)
+        SELECT account_id, SUM(debit), SUM(credit) FROM maintenance.balance_applied GROUP BY account_id
+        """
+    )
+    cursor.execute("DROP TABLE IF EXISTS touched_accounts")
+    cursor.execute(
+        "CREATE TEMP TABLE touched_accounts ON COMMIT DROP AS SELECT id AS account_id FROM public.chart_of_accounts"
+    )
+    cursor.execute(WRITE_CURRENT_BALANCE)
+    written = cursor.rowcount
+    save_watermark(cursor, entries_at, lines_at, verified=True, reset=True)
+    return written
+
+
+def apply_changes(cursor, entries_since, lines_since) -> dict:
+    """Apply the contribution deltas of entries touched since the watermarks."""
+    entries_at, lines_at = high_water(cursor)
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE changed_entries ON COMMIT DROP AS
+        SELECT id FROM public.journal_entries WHERE updated_at > %(entries_since)s - interval '{OVERLAP}'
+        UNION
+        SELECT journal_entry_id FROM public.journal_entry_lines WHERE updated_at > %(lines_since)s - interval '{OVERLAP}'
+        """,
+        {"entries_since": entries_since, "lines_since": lines_since},
+    )
+    cursor.execute("SELECT count(*) FROM changed_entries")
+    changed = cursor.fetchone()[0]
+
+    cursor.execute(
+        "CREATE TEMP TABLE current_contributions ON COMMIT DROP AS "
+        + POSTED_CONTRIBUTIONS.format(filter="AND line.journal_entry_id IN (SELECT id FROM changed_entries)")
+    )
+    cursor.execute(
+        """
+        CREATE TEMP TABLE balance_deltas ON COMMIT DROP AS
+        SELECT account_id, SUM(debit) AS debit, SUM(credit) AS credit
+        FROM (
+            SELECT account_id, debit, credit FROM current_contributions
+            UNION ALL
+            SELECT account_id, -debit, -credit
+            FROM maintenance.balance_applied
+            WHERE journal_entry_id IN (SELECT id FROM changed_entries)
+        ) delta
+        GROUP BY account_id
+        HAVING SUM(debit) <> 0 OR SUM(credit) <> 0
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO maintenance.account_balances AS running (account_id, debit, credit)
+        SELECT account_id, debit, credit FROM balance_deltas
+        ON CONFLICT (account_id) DO UPDATE
+        SET debit = running.debit + EXCLUDED.debit,
+            credit = running.credit + EXCLUDED.credit,
+            updated_at = now()
+        """
+    )
+    cursor.execute(
+        "DELETE FROM maintenance.balance_applied WHERE journal_entry_id IN (SELECT id FROM changed_entries)"
+    )
+    cursor.execute(
+        "INSERT INTO maintenance.balance_applied (journal_entry_id, account_id, debit, credit) "
+        "SELECT journal_entry_id, account_id, debit, credit FROM current_contributions"
+    )
+    cursor.execute("CREATE TEMP TABLE touched_accounts ON COMMIT DROP AS SELECT account_id FROM balance_deltas")
+    cursor.execute(WRITE_CURRENT_BALANCE)
+    written = cursor.rowcount
+    cursor.execute("SELECT count(*) FROM balance_deltas")
+    accounts = cursor.fetchone()[0]
+    save_watermark(cursor, entries_at, lines_at, verified=False)
+    return {"changed_entries": changed, "accounts_changed": accounts, "balances_written": written}
+
+
+def drift(cursor) -> list[tuple]:
+    """(account_id, running net debit, recomputed net debit) for every account that disagrees."""
+    cursor.execute(DRIFT_QUERY)
+    return cursor.fetchall()
+
+
+def sync(connection=None, *, verify: bool | None = None, repair: bool = False, rebuild_state: bool = False) -> dict:
+    """Bring current_balance up to date; verify against a full recompute every VERIFY_EVERY syncs."""
+    own_connection = connection is None
+    connection = connection or connect(connect_timeout=10)
+    started = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(STATE_DDL)
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_KEY,))
+            cursor.execute(
+                "SELECT entries_updated_at, lines_updated_at, syncs_since_verify "
+                "FROM maintenance.balance_watermark WHERE scope = %s",
+                (SCOPE,),
+            )
+            state = cursor.fetchone()
+            if rebuild_state or state is None or state[0] is None or state[1] is None:
+                result = {"mode": "rebuild", "balances_written": rebuild(cursor), "drift": []}
+            else:
+                result = {"mode": "incremental", **apply_changes(cursor, state[0], state[1])}
+                if verify or (verify is None and state[2] + 1 >= VERIFY_EVERY):
+                    result["drift"] = drift(cursor)
+                    if result["drift"] and repair:
+                        result["repaired"] = rebuild(cursor)
+                    elif not result["drift"]:
+                        save_watermark(cursor, None, None, verified=True)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if own_connection:
+            connection.close()
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verify", action="store_true", help="Compare with a full recomputation after syncing")
+    parser.add_argument("--repair", action="store_true", help="Rebuild the state if verification finds drift")
+    parser.add_argument("--rebuild", action="store_true", help="Reset the state from all posted lines")
+    args = parser.parse_args()
+
+    result = sync(verify=True if args.verify else None, repair=args.repair, rebuild_state=args.rebuild)
+    if result["mode"] == "rebuild":
+        print(f"Rebuilt balance state; {result['balances_written']} balances written in {result['seconds']}s")
+    else:
+        print(
+            f"{result['changed_entries']} entries touched since the last sync, "
+            f"{result['accounts_changed']} accounts changed, {result['balances_written']} balances written "
+            f"in {result['seconds']}s"
+        )
+    if "drift" in result and result["mode"] == "incremental":
+        if result["drift"]:
+            print(f"DRIFT: {len(result['drift'])} accounts differ from a full recomputation")
+            for account_id, running, recomputed in result["drift"][:20]:
+                print(f"  {account_id}: running={running} recomputed={recomputed}")
+            if "repaired" in result:
+                print(f"  Rebuilt; {result['repaired']} balances written")
+        else:
+            print("Verified: running balances match a full recomputation")
+
+
+if __name__ == "__main__":
+    main()
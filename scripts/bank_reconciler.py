@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""Match bank statement lines to payments and bank transactions at scale and write reconciliation batches.
+
+Sources are the payments and bank transactions that mark_bank_statement_line_matched
+would accept. A payment must be completed, bank-method, journal-backed, not yet
+reconciled, and have its original bank transaction. A bank transaction must be
+completed, unreconciled, not a reversal, and have a journal. Sources are
+grouped by (bank, absolute amount in minor units) and sorted by
+group<<32 | day. For each unmatched or needs_review statement line, two binary
+searches per amount step inside --amount-tolerance give the candidates of the
+same bank within --window days. Finding all C candidates costs
+O((L + S) log S + C) rather than L x S.
+
+Candidates are scored like run_auto_bank_reconciliation_batch, plus the
+customer:
+
+  45  amount within tolerance (the candidate condition)
+  10  same bank (always true here: matching requires it)
+  20 / 15 / 5   same day / within 2 days / within 7 days
+  25  statement reference equals the source reference or number (alphanumerics only)
+  15  statement reference inside the source notes or description, or the
+      source reference inside the statement description
+  10  the source customer's name appears in the statement description
+
+The score is capped at 100. A payment and its own bank transaction are one
+resource, as in mark_bank_statement_line_matched's lock key, so only one of
+them can be taken. Candidates scoring at least --min-score are assigned one
+to one, either greedy or optimal:
+
+  greedy   best score first, closer date first on ties
+  optimal  maximum total score, by successive shortest augmenting paths
+           (Dijkstra with potentials) over the sparse candidate graph; each
+           line may stay unmatched through a zero-weight dummy
+
+Lines left without a source are written as needs_review.
+
+--apply opens one bank_reconciliation_batches row per bank and bulk-inserts
+every line's bank_reconciliation_batch_matches row. It then runs
+mark_bank_statement_line_matched for all matched rows in one statement, which
+reconciles the payment or transaction, audits the change and refreshes the
+import counts. All of this happens in one transaction. Approval stays in the
+app (approve_bank_reconciliation_batch; the starter cannot approve).
+
+Usage:
+    python scripts/bank_reconciler.py                                  # dry run, every bank
+    python scripts/bank_reconciler.py --bank-id <uuid> --assign optimal --format csv --output matches.csv
+    python scripts/bank_reconciler.py --import-id <uuid> --apply --actor-id <uuid>
+"""
+import argparse
+import csv
+import heapq
+import json
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from db_connection import connect, get_company_id
+from money import minor_array, to_major
+
+
+# bank_statement_lines.amount is NUMERIC(14, 3)
+SCALE = 3
+DAY_OFFSET = 2**31
+AMOUNT_BITS = 47
+ASSIGNMENTS = ("greedy", "optimal")
+MIN_SCORE = 70
+WINDOW_DAYS = 7
+COMPLETED = ("completed", "paid", "success", "succeeded")
+
+LINES = """
+    SELECT l.id, l.import_id, l.bank_id, l.statement_date, abs(l.amount), l.reference_number, l.description
+    FROM bank_statement_lines l
+    WHERE l.company_id = %(company)s
+      AND l.match_status IN ('unmatched', 'needs_review')
+      AND (%(banks)s::uuid[] IS NULL OR l.bank_id = ANY(%(banks)s::uuid[]))
+      AND (%(imports)s::uuid[] IS NULL OR l.import_id = ANY(%(imports)s::uuid[]))
+    ORDER BY l.statement_date, l.id
+"""
+# kind, id, bank, date, amount, resource, number, reference, free text, customer names
+SOURCES = """
+    SELECT 'payment', p.id, p.bank_id, p.payment_date, abs(p.amount), p.id,
+           p.payment_number, p.reference_number, p.notes,
+           c.company_name, concat_ws(' ', c.first_name, c.last_name),
+           c.company_name_ar, concat_ws(' ', c.first_name_ar, c.last_name_ar)
+    FROM payments p
+    LEFT JOIN customers c ON c.id = p.customer_id
+    WHERE p.company_id = %(company)s
+      AND p.bank_id = ANY(%(banks)s::uuid[])
+      AND lower(COALESCE(p.payment_status, '')) = ANY(%(completed)s)
+      AND lower(COALESCE(p.reconciliation_status, 'pending')) <> 'reconciled'
+      AND payment_method_uses_bank(p.payment_method)
+      AND p.journal_entry_id IS NOT NULL
+      AND EXISTS (
+          SELECT 1 FROM bank_transactions t
+          WHERE t.company_id = p.company_id AND t.payment_id = p.id
+            AND t.reversal_of_transaction_id IS NULL
+            AND lower(COALESCE(t.status, '')) = 'completed'
+            AND t.bank_id = p.bank_id
+            AND abs(t.amount - p.amount) < 0.005
+            AND t.journal_entry_id = p.journal_entry_id
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM bank_statement_lines l
+          WHERE l.match_status = 'matched' AND l.matched_payment_id = p.id
+      )
+    UNION ALL
+    SELECT 'bank_transaction', t.id, t.bank_id, t.transaction_date, abs(t.amount), COALESCE(t.payment_id, t.id),
+           t.transaction_number, t.reference_number, t.description,
+           c.company_name, concat_ws(' ', c.first_name, c.last_name),
+           c.company_name_ar, concat_ws(' ', c.first_name_ar, c.last_name_ar)
+    FROM bank_transactions t
+    LEFT JOIN payments p ON p.id = t.payment_id
+    LEFT JOIN customers c ON c.id = p.customer_id
+    WHERE t.company_id = %(company)s
+      AND t.bank_id = ANY(%(banks)s::uuid[])
+      AND lower(COALESCE(t.status, '')) = 'completed'
+      AND NOT COALESCE(t.reconciled, false)
+      AND t.reversal_of_transaction_id IS NULL
+      AND t.journal_entry_id IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM bank_statement_lines l
+          WHERE l.match_status = 'matched'
+            AND (l.matched_bank_transaction_id = t.id
+                 OR (t.payment_id IS NOT NULL AND l.matched_payment_id = t.payment_id))
+      )
+"""
+INSERT_BATCHES = """
+    INSERT INTO bank_reconciliation_batches (company_id, bank_id, status, match_mode, started_by, notes)
+    VALUES %s
+    RETURNING bank_id, id
+"""
+INSERT_MATCHES = """
+    INSERT INTO bank_reconciliation_batch_matches (
+        batch_id, statement_line_id, matched_payment_id, matched_bank_transaction_id,
+        match_status, match_score, match_reasons
+    ) VALUES %s
+"""
+MARK_MATCHED = """
+    SELECT count(mark_bank_statement_line_matched(
+        m.statement_line_id, m.matched_payment_id, m.matched_bank_transaction_id, m.match_score, 'auto'
+    ))
+    FROM bank_reconciliation_batch_matches m
+    WHERE m.batch_id = ANY(%(batches)s::uuid[]) AND m.match_status = 'matched'
+"""
+TAG_LINES = """
+    UPDATE bank_statement_lines line
+    SET reconciliation_batch_id = m.batch_id,
+        match_status = CASE WHEN line.match_status = 'matched' THEN 'matched' ELSE 'needs_review' END,
+        match_score = CASE WHEN m.match_status = 'matched' THEN line.match_score ELSE m.match_score END,
+        updated_at = now()
+    FROM bank_reconciliation_batch_matches m
+    WHERE m.batch_id = ANY(%(batches)s::uuid[]) AND m.statement_line_id = line.id
+"""
+REFRESH_IMPORTS = """
+    SELECT count(*) FROM (
+        SELECT refresh_bank_statement_import_counts(import_id)
+        FROM (SELECT DISTINCT import_id FROM bank_statement_lines
+              WHERE reconciliation_batch_id = ANY(%(batches)s::uuid[])) imports
+    ) refreshed
+"""
+COMPLETE_BATCHES = """
+    UPDATE bank_reconciliation_batches batch
+    SET status = 'completed',
+        statement_line_count = counts.total,
+        auto_matched_count = counts.matched,
+        needs_review_count = counts.total - counts.matched,
+        completed_at = now(),
+        updated_at = now()
+    FROM (
+        SELECT batch_id, count(*)::integer AS total,
+               count(*) FILTER (WHERE match_status = 'matched')::integer AS matched
+        FROM bank_reconciliation_batch_matches
+        WHERE batch_id = ANY(%(batches)s::uuid[])
+        GROUP BY batch_id
+    ) counts
+    WHERE batch.id = counts.batch_id
+"""
+
+
+@dataclass
+class Match:
+    statement_line_id: str
+    import_id: str
+    bank_id: str
+    statement_date: str
+    amount: Decimal
+    reference_number: str | None
+    status: str
+    score: int
+    source_kind: str | None = None
+    source_id: str | None = None
+    source_number: str | None = None
+    source_date: str | None = None
+    reasons: list[str] = field(default_factory=list)
+
+
+def _day(value) -> int:
+    return int(np.datetime64(str(value)[:10], "D").astype(np.int64))
+
+
+def _norm(text) -> str:
+    """Lower-cased alphanumerics only, as regexp_replace(..., '[^[:alnum:]]', '') in the SQL matcher."""
+    return "".join(ch for ch in str(text or "").lower() if ch.isalnum())
+
+
+def candidates(lines: list[tuple], sources: list[tuple], *, window: int = WINDOW_DAYS,
+               tolerance: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """(line index, source index) of every same-bank source within `tolerance` minor units and `window` days."""
+    banks = {bank: i for i, bank in enumerate(sorted({str(row[2]) for row in lines} | {str(row[2]) for row in sources}))}
+    empty = np.zeros(0, dtype=np.int64)
+    if not lines or not sources:
+        return empty, empty
+    line_group = np.array([banks[str(row[2])] for row in lines], dtype=np.int64) << AMOUNT_BITS
+    line_amount = minor_array([row[4] for row in lines], SCALE)
+    line_day = np.array([_day(row[3]) for row in lines], dtype=np.int64) + DAY_OFFSET
+    source_key = (np.array([banks[str(row[2])] for row in sources], dtype=np.int64) << AMOUNT_BITS) \
+        | minor_array([row[4] for row in sources], SCALE)
+    groups, source_group = np.unique(source_key, return_inverse=True)
+    source_day = np.array([_day(row[3]) for row in sources], dtype=np.int64) + DAY_OFFSET
+    composite = (source_group.astype(np.int64) << 32) | source_day
+    order = np.argsort(composite, kind="stable")
+    composite = composite[order]
+
+    line_parts, source_parts = [], []
+    for delta in range(-tolerance, tolerance + 1):
+        amount = line_amount + delta
+        key = line_group | np.maximum(amount, 0)
+        pos = np.searchsorted(groups, key)
+        found = (amount >= 0) & (pos < len(groups))
+        found[found] &= groups[pos[found]] == key[found]
+        index = np.nonzero(found)[0]
+        group = pos[index].astype(np.int64) << 32
+        lo = np.searchsorted(composite, group | (line_day[index] - window), side="left")
+        hi = np.searchsorted(composite, group | (line_day[index] + window), side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        if not total:
+            continue
+        starts = np.cumsum(counts) - counts
+        line_parts.append(np.repeat(index, counts))
+        source_parts.append(order[np.repeat(lo - starts, counts) + np.arange(total)])
+    if not line_parts:
+        return empty, empty
+    return np.concatenate(line_parts), np.concatenate(source_parts)
+
+
+REFERENCE_EXACT, REFERENCE_PARTIAL, CUSTOMER_NAME = 1, 2, 4
+
+
+def score(lines: list[tuple], sources: list[tuple], line_index: np.ndarray, source_index: np.ndarray,
+          tolerance: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(score, date gap, exact amount, text flags) per candidate pair."""
+    line_day = np.array([_day(row[3]) for row in lines], dtype=np.int64)
+    source_day = np.array([_day(row[3]) for row in sources], dtype=np.int64)
+    gap = np.abs(line_day[line_index] - source_day[source_index])
+    points = 55 + np.select([gap == 0, gap <= 2, gap <= 7], [20, 15, 5], 0)
+    exact = np.ones(len(line_index), dtype=bool)
+    if tolerance:
+        exact = minor_array([row[4] for row in lines], SCALE)[line_index] \
+            == minor_array([row[4] for row in sources], SCALE)[source_index]
+
+    # Normalized references as ids, so the exact-reference test is an array comparison.
+    ids = {"": 0}
+    line_text = [(_norm(row[5]), _norm(row[6])) for row in lines]
+    source_text = [(_norm(row[7]), _norm(row[6]), _norm(row[8]),
+                    [name for name in map(_norm, row[9:13]) if len(name) >= 4]) for row in sources]
+    line_reference = np.array([ids.setdefault(text[0], len(ids)) for text in line_text], dtype=np.int64)
+    source_reference = np.array([ids.setdefault(text[0], len(ids)) for text in source_text], dtype=np.int64)
+    source_number = np.array([ids.setdefault(text[1], len(ids)) for text in source_text], dtype=np.int64)
+    reference = line_reference[line_index]
+    flags = np.where((reference > 0) & ((reference == source_reference[source_index])
+                                        | (reference == source_number[source_index])), REFERENCE_EXACT, 0)
+    for k, (i, j) in enumerate(zip(line_index.tolist(), source_index.tolist())):
+        line_reference_text, description = line_text[i]
+        source_reference_text, number, text, names = source_text[j]
+        if not flags[k] and ((line_reference_text and line_reference_text in text) or any(
+                len(ref) >= 4 and ref in description for ref in (source_reference_text, number))):
+            flags[k] = REFERENCE_PARTIAL
+        if description and any(name in description for name in names):
+            flags[k] |= CUSTOMER_NAME
+    points += np.select([flags & REFERENCE_EXACT > 0, flags & REFERENCE_PARTIAL > 0], [25, 15], 0)
+    points += np.where(flags & CUSTOMER_NAME, 10, 0)
+    return np.minimum(points, 100), gap, exact, flags
+
+
+def reasons(gap: int, exact: bool, flags: int) -> list[str]:
+    """match_reasons of one scored pair."""
+    why = ["amount_exact" if exact else "amount_within_tolerance",
+           "same_day" if gap == 0 else "date_within_2_days" if gap <= 2 else
+           "date_within_7_days" if gap <= 7 else "date_outside_7_days"]
+    if flags & REFERENCE_EXACT:
+        why.append("reference_exact")
+    elif flags & REFERENCE_PARTIAL:
+        why.append("reference_partial")
+    if flags & CUSTOMER_NAME:
+        why.append("customer_name")
+    return why
+
+
+def assign_greedy(line_index: np.ndarray, resource: np.ndarray, weight: np.ndarray) -> dict[int, int]:
+    """Edge position per assigned line: highest weight first, each line and resource used once."""
+    taken_lines, taken_resources, chosen = set(), set(), {}
+    for k in np.lexsort((resource, line_index, -weight)).tolist():
+        line, res = int(line_index[k]), int(resource[k])
+        if line not in taken_lines and res not in taken_resources:
+            taken_lines.add(line)
+            taken_resources.add(res)
+            chosen[line] = k
+    return chosen
+
+
+def assign_optimal(line_index: np.ndarray, resource: np.ndarray, weight: np.ndarray) -> dict[int, int]:
+    """Edge position per assigned line for the maximum total weight, with each line and resource used once.
+
+    Successive shortest paths over costs top - weight, with a zero-weight dummy right node
+    per line so that every line can be placed; only lines with an edge take part.
+    """
+    if not len(weight):
+        return {}
+    top = int(weight.max())
+    n_resources = int(resource.max()) + 1
+    adjacency = {}
+    for k in np.lexsort((-weight, line_index)).tolist():
+        adjacency.setdefault(int(line_index[k]), []).append((int(resource[k]), top - int(weight[k]), k))
+    for line, edges in adjacency.items():
+        edges.append((n_resources + line, top, -1))
+
+    u, v = {}, {}
+    owner, placed = {}, {}  # right node -> line, line -> (right node, edge)
+    for start in adjacency:
+        settled, reached, via = {}, {start: 0}, {}
+        heap = [(cost - v.get(right, 0), right, start, k) for right, cost, k in adjacency[start]]
+        heapq.heapify(heap)
+        end = None
+        while heap:
+            distance, right, line, k = heapq.heappop(heap)
+            if right in settled:
+                continue
+            settled[right] = distance
+            via[right] = (line, k)
+            if right not in owner:
+                end = right
+                break
+            nxt = owner[right]
+            reached[nxt] = distance
+            base = distance - u.get(nxt, 0)
+            for right2, cost, k2 in adjacency[nxt]:
+                if right2 not in settled:
+                    heapq.heappush(heap, (base + cost - v.get(right2, 0), right2, nxt, k2))
+        total = settled[end]
+        for line, distance in reached.items():
+            u[line] = u.get(line, 0) + total - distance
+        for right, distance in settled.items():
+            v[right] = v.get(right, 0) - (total - distance)
+        right = end
+        while True:
+            line, k = via[right]
+            previous = placed.get(line)
+            owner[right] = line
+            placed[line] = (right, k)
+            if line == start:
+                break
+            right = previous[0]
+    return {line: k for line, (right, k) in placed.items() if k >= 0}
+
+
+def reconcile(lines: list[tuple], sources: list[tuple], *, window: int = WINDOW_DAYS, tolerance: int = 0,
+              min_score: int = MIN_SCORE, assignment: str = "greedy") -> list[Match]:
+    """One Match per statement line: its assigned source, or needs_review."""
+    line_index, source_index = candidates(lines, sources, window=window, tolerance=tolerance)
+    points, gap, exact, flags = score(lines, sources, line_index, source_index, tolerance)
+    best = np.zeros(len(lines), dtype=np.int64)
+    np.maximum.at(best, line_index, points)
+
+    resources = {}
+    resource = np.array([resources.setdefault(str(sources[j][5]), len(resources)) for j in source_index.tolist()], dtype=np.int64)
+    weight = points * 16 + (15 - np.minimum(gap, 15))
+    keep = points >= min_score
+    positions = np.nonzero(keep)[0]
+    solver = assign_optimal if assignment == "optimal" else assign_greedy
+    chosen = {line: int(positions[k]) for line, k in
+              solver(line_index[keep], resource[keep], weight[keep]).items()}
+    contested = set(line_index[keep].tolist())
+
+    matches = []
+    for i, row in enumerate(lines):
+        match = Match(str(row[0]), str(row[1]), str(row[2]), str(row[3])[:10], to_major(int(minor_array([row[4]], SCALE)[0]), SCALE),
+                      row[5], "needs_review", int(best[i]))
+        k = chosen.get(i)
+        if k is not None:
+            source = sources[int(source_index[k])]
+            match.status, match.score = "matched", int(points[k])
+            match.reasons = reasons(int(gap[k]), bool(exact[k]), int(flags[k]))
+            match.source_kind, match.source_id, match.source_number = source[0], str(source[1]), source[6]
+            match.source_date = str(source[3])[:10]
+        else:
+            match.reasons = ["candidate_taken"] if i in contested else ["no_strong_match"]
+        matches.append(match)
+    return matches
+
+
+def write_batches(connection, company_id: str, matches: list[Match], actor_id: str | None = None,
+                  notes: str | None = None) -> dict[str, str]:
+    """One batch per bank, every line's match row, and the matched lines posted, in one transaction."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('request.jwt.claim.role', 'service_role', false)")
+        banks = sorted({match.bank_id for match in matches})
+        batches = dict(execute_values(
+            cursor, INSERT_BATCHES, [(company_id, bank, "running", "auto", actor_id, notes) for bank in banks],
+            fetch=True,
+        ))
+        batches = {str(bank): str(batch) for bank, batch in batches.items()}
+        execute_values(cursor, INSERT_MATCHES, [(
+            batches[match.bank_id], match.statement_line_id,
+            match.source_id if match.source_kind == "payment" else None,
+            match.source_id if match.source_kind == "bank_transaction" else None,
+            match.status, match.score, match.reasons,
+        ) for match in matches], template="(%s, %s, %s, %s, %s, %s, %s::text[])", page_size=1000)
+        params = {"batches": list(batches.values())}
+        cursor.execute(MARK_MATCHED, params)
+        cursor.execute(TAG_LINES, params)
+        cursor.execute(REFRESH_IMPORTS, params)
+        cursor.execute(COMPLETE_BATCHES, params)
+    connection.commit()
+    return batches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company (default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--bank-id", action="append", help="Only this bank (repeatable; default every bank with open lines)")
+    parser.add_argument("--import-id", action="append", help="Only lines of this statement import (repeatable)")
+    parser.add_argument("--window", type=int, default=WINDOW_DAYS, help=f"Date window in days (default {WINDOW_DAYS})")
+    parser.add_argument("--amount-tolerance", type=Decimal, default=Decimal(0),
+                        help="Amount difference allowed (default 0; matching rejects 0.005 or more)")
+    parser.add_argument("--min-score", type=int, default=MIN_SCORE, help=f"Lowest score matched automatically (default {MIN_SCORE})")
+    parser.add_argument("--assign", choices=ASSIGNMENTS, default="greedy",
+                        help="greedy, or optimal for the highest total score (slower when many lines share an amount)")
+    parser.add_argument("--format", choices=("console", "csv", "jsonl"), default="console")
+    parser.add_argument("--output", help="Write csv or jsonl here instead of stdout")
+    parser.add_argument("--apply", action="store_true", help="Write the batches and match the lines (default is a dry run)")
+    parser.add_argument("--actor-id", help="User recorded as the batch starter with --apply")
+    parser.add_argument("--notes", help="Stored on the batches with --apply")
+    args = parser.parse_args()
+    if args.apply and args.amount_tolerance >= Decimal("0.005"):
+        parser.error("--apply needs --amount-tolerance below 0.005; mark_bank_statement_line_matched rejects the rest")
+
+    company_id = args.company_id or get_company_id()
+    tolerance = int(minor_array([args.amount_tolerance], SCALE)[0])
+    started = time.perf_counter()
+    connection = connect(connect_timeout=10)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cursor.execute(LINES, {"company": company_id, "banks": args.bank_id, "imports": args.import_id})
+            lines = cursor.fetchall()
+            banks = sorted({str(row[2]) for row in lines})
+            cursor.execute(SOURCES, {"company": company_id, "banks": banks, "completed": list(COMPLETED)})
+            sources = cursor.fetchall()
+        connection.rollback()
+        loaded = time.perf_counter() - started
+
+        matches = reconcile(lines, sources, window=args.window, tolerance=tolerance,
+                            min_score=args.min_score, assignment=args.assign)
+        computed = time.perf_counter() - started - loaded
+
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            if args.format == "csv":
+                writer = csv.DictWriter(out, fieldnames=list(Match.__dataclass_fields__))
+                writer.writeheader()
+                writer.writerows({**asdict(match), "reasons": ";".join(match.reasons)} for match in matches)
+            elif args.format == "jsonl":
+                for match in matches:
+                    out.write(json.dumps(asdict(match), ensure_ascii=False, default=str) + "\n")
+        finally:
+            if args.output:
+                out.close()
+
+        log = sys.stderr if args.format != "console" and not args.output else sys.stdout
+        matched = [match for match in matches if match.status == "matched"]
+        amount = sum((match.amount for match in matched), Decimal(0))
+        kinds = Counter(match.source_kind for match in matched)
+        review = Counter(match.reasons[0] for match in matches if match.status != "matched")
+        print(
+            f"{len(lines)} open statement lines in {len(banks)} banks, {len(sources)} payment/bank-transaction sources "
+            f"(loaded in {loaded:.1f}s, matched in {computed:.2f}s, {args.assign})\n"
+            f"  matched {len(matched)} lines for {amount:,}: {dict(kinds)}\n"
+            f"  needs review {len(matches) - len(matched)}: {dict(review)}",
+            file=log,
+        )
+        if args.format == "console":
+            for match in matched[:20]:
+                print(f"    {match.statement_date} {match.amount:>14,} {str(match.reference_number or '-'):<18} -> "
+                      f"{match.source_kind} {match.source_number or match.source_id[:8]} ({match.score}: {', '.join(match.reasons)})")
+
+        if args.apply:
+            if not matches:
+                return
+            batches = write_batches(connection, company_id, matches, args.actor_id, args.notes)
+            print(f"Wrote {len(batches)} reconciliation batches: {', '.join(batches.values())}")
+        elif matches:
+            print("Dry run: nothing written (use --apply)", file=log)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
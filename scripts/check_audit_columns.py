@@ -1,20 +1,8 @@
 #!/usr/bin/env python3
-import psycopg2
-from db_connection import get_database_url
+"""Show the audit_logs columns from the local catalog snapshot."""
+from catalog_snapshot import CatalogSnapshot
 
-conn = psycopg2.connect(get_database_url())
-conn.autocommit = True
-cur = conn.cursor()
-
-cur.execute("""
-    SELECT column_name, data_type, is_nullable, column_default
-    FROM information_schema.columns
-    WHERE table_schema = 'public' AND table_name = 'audit_logs'
-    ORDER BY ordinal_position
-""")
-print("=== AUDIT_LOGS COLUMNS ===")
-for r in cur.fetchall():
-    print(f"  {r[0]}: {r[1]} (nullable={r[2]}, default={r[3]})")
-
-cur.close()
-conn.close()
+with CatalogSnapshot() as catalog:
+    print("=== AUDIT_LOGS COLUMNS ===")
+    for r in catalog.columns('audit_logs'):
+        print(f"  {r['column_name']}: {r['data_type']} (nullable={r['is_nullable']}, default={r['column_default']})")
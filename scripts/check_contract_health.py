@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 """Check contract dates and health analysis expectations."""
-import psycopg2
-from db_connection import get_database_url
+from catalog_snapshot import CatalogSnapshot
+from db_connection import connect
 
-conn = psycopg2.connect(get_database_url())
+conn = connect()
 conn.autocommit = True
 cur = conn.cursor()
 
@@ -45,16 +45,11 @@ invoices = cur.fetchall()
 print(f"\nActual invoices: {len(invoices)}")
 print(f"Missing: {months - len(invoices)}")
 
-# Check what triggers exist on invoices
-cur.execute("""
-    SELECT tgname, tgtype::regtype::text
-    FROM pg_trigger
-    WHERE tgrelid = 'invoices'::regclass
-    ORDER BY tgname
-""")
+# Check what triggers exist on invoices (local catalog snapshot)
 print(f"\n=== TRIGGERS ON INVOICES ===")
-for t in cur.fetchall():
-    print(f"  {t[0]} ({t[1]})")
+with CatalogSnapshot() as catalog:
+    for t in catalog.triggers('invoices'):
+        print(f"  {t['trigger_name']} ({t['function_name']}, {t['enabled']})")
 
 cur.close()
 conn.close()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""Fiscal-year closing for any set of companies and years, through annual_financial_close_runs.
+
+One ledger snapshot is reduced to a (account x year) matrix of net movements
+in a single grouped sum; every requested (company, fiscal year) is then read
+off that matrix:
+
+  income_close     every revenue/expense account's movement in the year,
+                   reversed, plus the net income to retained earnings
+  opening_balance  every balance-sheet account's cumulative balance at year
+                   end, with all profit and loss not yet closed carried into
+                   retained earnings, so the entry balances
+
+Results are written like calculate_annual_financial_close -- one run per
+(company, fiscal_year), upserted while still draft/calculated, lines replaced
+-- but for every run in one transaction. --apply needs --requested-by, the
+user recorded as the runs' requester (auth.uid() in the RPC), so that
+approve_annual_financial_close can still refuse requester == approver.
+Approval stays in the app. --post then turns the
+approved runs' income_close lines into CLOSE-<year>-<run> journal entries in
+one set-based statement; runs that already have a closing entry are left
+alone, so re-running is safe. No opening entry is posted: balances are
+computed from the full journal history (trial_balance.py, balance_maintainer.py),
+so an OPEN-<year> entry would count every balance-sheet balance twice.
+Opening entries posted by post_annual_financial_close are ignored for the
+same reason.
+
+Usage:
+    python scripts/closing_engine.py --year 2025                     # dry run, FLEETIFY_COMPANY_ID
+    python scripts/closing_engine.py --all-companies --year 2024 --year 2025 --apply --requested-by <user uuid>
+    python scripts/closing_engine.py --company-id <uuid> --year 2025 --post --requested-by <user uuid>
+"""
+import argparse
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from db_connection import connect, get_company_id
+from ledger_engine import Ledger, load_ledger
+from money import group_sum, to_major
+from trial_balance import EXPENSE_TYPES, INCOME_TYPES
+
+
+POSTED = ("posted",)
+RETAINED_EARNINGS_CODE = "3100"
+RETAINED_EARNINGS_KEYWORDS = ("retained", "أرباح", "مبقاة", "محتجزة")
+OPENING_REFERENCE_TYPE = "annual_close_opening"
+LEGACY_REFERENCE_TYPE = "closing"
+EDITABLE_STATUSES = ("draft", "calculated")
+LOCK_KEY = 727_001_040
+
+RUNS_QUERY = """
+    SELECT id, company_id, fiscal_year, status, retained_earnings_account_id, closing_journal_entry_id
+    FROM annual_financial_close_runs
+    WHERE company_id = ANY(%(companies)s::uuid[])
+"""
+
+UPSERT_RUNS = """
+    INSERT INTO annual_financial_close_runs (
+        company_id, fiscal_year, period_start, period_end, retained_earnings_account_id,
+        revenue_total, expense_total, net_income, status, notes, requested_by
+    )
+    VALUES %s
+    ON CONFLICT (company_id, fiscal_year) DO UPDATE SET
+        period_start = EXCLUDED.period_start,
+        period_end = EXCLUDED.period_end,
+        retained_earnings_account_id = EXCLUDED.retained_earnings_account_id,
+        revenue_total = EXCLUDED.revenue_total,
+        expense_total = EXCLUDED.expense_total,
+        net_income = EXCLUDED.net_income,
+        status = 'calculated',
+        notes = EXCLUDED.notes,
+        -- the first requester stays, as in calculate_annual_financial_close
+        requested_by = COALESCE(annual_financial_close_runs.requested_by, EXCLUDED.requested_by),
+        updated_at = now()
+    WHERE annual_financial_close_runs.status IN ('draft', 'calculated')
+    RETURNING id, company_id, fiscal_year
+"""
+
+INSERT_LINES = """
+    INSERT INTO annual_financial_close_lines (
+        close_run_id, account_id, line_type, debit_amount, credit_amount, description, line_integer
+    )
+    VALUES %s
+"""
+
+# Mirrors post_annual_financial_close (entry number, date, reference) for
+# every approved run at once; the closing_journal_entry_id check and the row
+# lock make a second run a no-op.
+POST_CLOSING_ENTRIES = """
+    WITH runs AS (
+        SELECT r.*
+        FROM annual_financial_close_runs r
+        WHERE r.id = ANY(%(runs)s::uuid[])
+          AND r.status = 'closed'
+          AND r.closing_journal_entry_id IS NULL
+        FOR UPDATE
+    ),
+    totals AS (
+        SELECT l.close_run_id, SUM(l.debit_amount) AS debit, SUM(l.credit_amount) AS credit
+        FROM annual_financial_close_lines l
+        JOIN runs r ON r.id = l.close_run_id
+        WHERE l.line_type = 'income_close'
+        GROUP BY l.close_run_id
+        HAVING SUM(l.debit_amount) = SUM(l.credit_amount)
+    ),
+    entries AS (
+        INSERT INTO journal_entries (
+            company_id, entry_number, entry_date, description,
+            total_debit, total_credit, status, reference_type, reference_id, created_by
+        )
+        SELECT
+            r.company_id, 'CLOSE-' || r.fiscal_year || '-' || substring(r.id::text, 1, 8), r.period_end,
+            'Annual financial close ' || r.fiscal_year,
+            t.debit, t.credit, 'posted', 'annual_close', r.id, %(actor)s
+        FROM runs r
+        JOIN totals t ON t.close_run_id = r.id
+        RETURNING id, reference_id
+    ),
+    lines AS (
+        INSERT INTO journal_entry_lines (
+            journal_entry_id, account_id, line_number, line_description, debit_amount, credit_amount
+        )
+        SELECT
+            e.id, l.account_id,
+            row_number() OVER (PARTITION BY l.close_run_id ORDER BY l.line_integer, l.created_at),
+            l.description, l.debit_amount, l.credit_amount
+        FROM entries e
+        JOIN annual_financial_close_lines l ON l.close_run_id = e.reference_id AND l.line_type = 'income_close'
+    )
+    UPDATE annual_financial_close_runs r
+    SET closing_journal_entry_id = e.id, updated_at = now()
+    FROM entries e
+    WHERE r.id = e.reference_id
+    RETURNING r.id, r.company_id, r.fiscal_year, e.id
+"""
+
+
+@dataclass
+class CloseLine:
+    account: int  # ledger account index
+    line_type: str  # income_close / opening_balance
+    debit: int  # minor units
+    credit: int
+    description: str
+
+
+@dataclass
+class ClosePlan:
+    company_id: str
+    fiscal_year: int
+    period_start: date
+    period_end: date
+    retained_earnings: int  # ledger account index
+    revenue_total: int  # minor units
+    expense_total: int
+    lines: list[CloseLine] = field(default_factory=list)
+
+    @property
+    def net_income(self) -> int:
+        return self.revenue_total - self.expense_total
+
+    def difference(self, line_type: str) -> int:
+        """Debit minus credit of one side of the close; 0 when it balances."""
+        return sum(line.debit - line.credit for line in self.lines if line.line_type == line_type)
+
+
+def signed_line(account: int, line_type: str, net: int, description: str) -> CloseLine:
+    """A line carrying a debit-minus-credit amount on the side it belongs."""
+    return CloseLine(account, line_type, max(net, 0), max(-net, 0), description)
+
+
+def retained_earnings_account(ledger: Ledger, company_id: str, preferred: str | None = None) -> int:
+    """The account net income closes into: the run's own, account 3100, a keyword match, the first equity account."""
+    if preferred in ledger.account_index:
+        return ledger.account_index[preferred]
+    candidates = np.flatnonzero(
+        (ledger.account_company == ledger.company_code(company_id))
+        & (ledger.account_type == ledger.type_code("equity"))
+        & ~ledger.account_is_header
+        & ledger.account_is_active
+    )
+    candidates = candidates[np.argsort(ledger.account_code[candidates].astype(str), kind="stable")]
+    for a in candidates.tolist():
+        if ledger.account_code[a] == RETAINED_EARNINGS_CODE:
+            return a
+    for a in candidates.tolist():
+        name = str(ledger.account_name[a] or "").lower()
+        if any(keyword in name for keyword in RETAINED_EARNINGS_KEYWORDS):
+            return a
+    if not len(candidates):
+        raise LookupError(f"Company {company_id} has no postable equity account to close into")
+    return int(candidates[0])
+
+
+def yearly_movements(ledger: Ledger, first_year: int, last_year: int, statuses=POSTED) -> np.ndarray:
+    """(accounts x years) debit-minus-credit matrix in one grouped sum.
+
+    Column 0 holds everything before first_year and the last column everything
+    after last_year, so a cumulative sum along a row is the balance at each
+    year end.
+    """
+    mask = ledger.line_mask(statuses=statuses) & (ledger.line_account >= 0)
+    if ledger.n_entries:
+        entry = np.where(mask, ledger.line_entry, 0)
+        mask &= ledger.entry_reference_type[entry] != OPENING_REFERENCE_TYPE
+        mask &= ~np.isnat(ledger.entry_date[entry])
+    entry = ledger.line_entry[mask]
+    years = ledger.entry_date[entry].astype("datetime64[Y]").astype(np.int64) + 1970
+    width = last_year - first_year + 3
+    column = np.clip(years - first_year + 1, 0, width - 1)
+    cells = ledger.line_account[mask].astype(np.int64) * width + column
+    net = ledger.line_debit[mask] - ledger.line_credit[mask]
+    return group_sum(cells, net, ledger.n_accounts * width).reshape(ledger.n_accounts, width)
+
+
+def plan_closings(
+    ledger: Ledger,
+    company_ids: list[str],
+    years: list[int],
+    *,
+    retained: dict[tuple[str, int], str] | None = None,
+    statuses=POSTED,
+    skipped: dict[str, str] | None = None,
+) -> list[ClosePlan]:
+    """Closing and opening lines for every (company, fiscal year), from one pass over the lines.
+
+    A company without an account to close into is left out, with the reason
+    recorded in `skipped`, and the other companies are still planned.
+    """
+    if not years:
+        return []
+    first, last = min(years), max(years)
+    movements = yearly_movements(ledger, first, last, statuses)
+    balances = np.cumsum(movements, axis=1)
+    revenue = np.isin(ledger.account_type, [ledger.type_code(t) for t in INCOME_TYPES])
+    expense = np.isin(ledger.account_type, [ledger.type_code(t) for t in EXPENSE_TYPES])
+    profit_and_loss = revenue | expense
+
+    plans = []
+    for company_id in company_ids:
+        if company_id not in ledger.company_index:
+            continue
+        own = ledger.account_company == ledger.company_code(company_id)
+        order = np.flatnonzero(own)
+        order = order[np.argsort(ledger.account_code[order].astype(str), kind="stable")]
+        income_accounts = order[profit_and_loss[order]]
+        balance_accounts = order[~profit_and_loss[order]]
+        company_plans = []
+        for year in sorted(set(years)):
+            column = year - first + 1
+            if not movements[order, column].any():
+                continue
+            preferred = (retained or {}).get((company_id, year))
+            try:
+                re_account = retained_earnings_account(ledger, company_id, preferred)
+            except LookupError as error:
+                if skipped is not None:
+                    skipped[company_id] = str(error)
+                company_plans = []
+                break
+            moved = movements[:, column]
+            plan = ClosePlan(
+                company_id=company_id,
+                fiscal_year=year,
+                period_start=date(year, 1, 1),
+                period_end=date(year, 12, 31),
+                retained_earnings=re_account,
+                revenue_total=-int(moved[income_accounts[revenue[income_accounts]]].sum()),
+                expense_total=int(moved[income_accounts[expense[income_accounts]]].sum()),
+            )
+            for a in income_accounts[moved[income_accounts] != 0].tolist():
+                description = (
+                    "Close revenue account to retained earnings" if revenue[a]
+                    else "Close expense account to retained earnings"
+                )
+                plan.lines.append(signed_line(a, "income_close", -int(moved[a]), description))
+            if plan.net_income:
+                description = (
+                    "Transfer annual profit to retained earnings" if plan.net_income > 0
+                    else "Transfer annual loss to retained earnings"
+                )
+                plan.lines.append(signed_line(re_account, "income_close", -plan.net_income, description))
+
+            closing = balances[:, column].copy()
+            closing[re_account] += balances[income_accounts, column].sum()
+            for a in balance_accounts[closing[balance_accounts] != 0].tolist():
+                plan.lines.append(signed_line(
+                    a, "opening_balance", int(closing[a]), "Opening balance carried from prior fiscal year"
+                ))
+            company_plans.append(plan)
+        plans.extend(company_plans)
+    return plans
+
+
+def store_plans(cursor, ledger: Ledger, plans: list[ClosePlan], requested_by: str,
+                notes: str | None = None) -> dict[tuple[str, int], str]:
+    """Upsert runs and replace their lines in bulk; returns the run id per (company, year) actually written."""
+    if not requested_by:
+        raise ValueError("close runs need a requester")
+    if not plans:
+        return {}
+    scale = ledger.scale
+    rows = execute_values(
+        cursor,
+        UPSERT_RUNS,
+        [
+            (
+                plan.company_id, plan.fiscal_year, plan.period_start, plan.period_end,
+                ledger.account_ids[plan.retained_earnings],
+                to_major(plan.revenue_total, scale), to_major(plan.expense_total, scale),
+                to_major(plan.net_income, scale),
+                "calculated", notes, requested_by,
+            )
+            for plan in plans
+        ],
+        fetch=True,
+    )
+    run_ids = {(str(company_id), year): str(run_id) for run_id, company_id, year in rows}
+    if not run_ids:
+        return run_ids
+    cursor.execute(
+        "DELETE FROM annual_financial_close_lines WHERE close_run_id = ANY(%s::uuid[])", (list(run_ids.values()),)
+    )
+    lines = []
+    for plan in plans:
+        run_id = run_ids.get((plan.company_id, plan.fiscal_year))
+        if run_id is None:
+            continue
+        for number, line in enumerate(plan.lines, start=1):
+            lines.append((
+                run_id, ledger.account_ids[line.account], line.line_type,
+                to_major(line.debit, scale), to_major(line.credit, scale), line.description, number,
+            ))
+    execute_values(cursor, INSERT_LINES, lines, page_size=1000)
+    return run_ids
+
+
+def post_closings(cursor, run_ids: list[str], actor_id: str) -> list[tuple]:
+    """Post the closing entry of every approved run without one; (run, company, year, entry) per entry created."""
+    if not run_ids:
+        return []
+    cursor.execute(POST_CLOSING_ENTRIES, {"runs": run_ids, "actor": actor_id})
+    return cursor.fetchall()
+
+
+def default_years(ledger: Ledger) -> list[int]:
+    """Every calendar year with entries, up to the last completed one."""
+    dates = ledger.entry_date[~np.isnat(ledger.entry_date)]
+    years = np.unique(dates.astype("datetime64[Y]").astype(np.int64) + 1970)
+    return [int(y) for y in years if y < date.today().year]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", action="append", help="Company to close (repeatable; default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--all-companies", action="store_true", help="Close every company in the journal")
+    parser.add_argument("--year", type=int, action="append", help="Fiscal (calendar) year to close (repeatable; default every completed year)")
+    parser.add_argument("--notes", help="Stored on the close runs")
+    parser.add_argument("--apply", action="store_true", help="Write the runs and lines (default is a dry run)")
+    parser.add_argument("--post", action="store_true", help="Post closing entries for approved runs (implies --apply)")
+    parser.add_argument("--requested-by", metavar="USER_ID",
+                        help="User recorded as the runs' requester and the closing entries' creator (required to write)")
+    args = parser.parse_args()
+    apply = args.apply or args.post
+    if apply and not args.requested_by:
+        parser.error("--apply and --post need --requested-by")
+
+    started = time.perf_counter()
+    company_ids = None if args.all_companies else (args.company_id or [get_company_id()])
+    ledger = load_ledger(company_ids)
+    company_ids = company_ids or [str(c) for c in ledger.companies]
+    years = args.year or default_years(ledger)
+
+    connection = connect(connect_timeout=10)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_KEY,))
+            cursor.execute(RUNS_QUERY, {"companies": company_ids})
+            runs = {(str(row[1]), row[2]): row for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT count(*) FROM journal_entries "
+                "WHERE company_id = ANY(%s::uuid[]) AND reference_type = %s AND status = 'posted'",
+                (company_ids, LEGACY_REFERENCE_TYPE),
+            )
+            legacy = cursor.fetchone()[0]
+
+            frozen = {key for key, run in runs.items() if run[3] not in EDITABLE_STATUSES}
+            retained = {key: str(run[4]) for key, run in runs.items() if run[4]}
+            skipped = {}
+            plans = [
+                plan for plan in plan_closings(ledger, company_ids, years, retained=retained, skipped=skipped)
+                if (plan.company_id, plan.fiscal_year) not in frozen
+            ]
+            computed = time.perf_counter()
+
+            print(f"{'Company':<10} {'Year':<6} {'Revenue':>15} {'Expenses':>15} {'Net income':>15} {'Lines':>6}  Retained earnings")
+            for plan in plans:
+                re_account = plan.retained_earnings
+                print(
+                    f"{plan.company_id[:8]:<10} {plan.fiscal_year:<6} {ledger.fmt(plan.revenue_total):>15} "
+                    f"{ledger.fmt(plan.expense_total):>15} {ledger.fmt(plan.net_income):>15} {len(plan.lines):>6}  "
+                    f"{ledger.account_code[re_account]} {ledger.account_name[re_account]}"
+                )
+                opening = plan.difference("opening_balance")
+                if opening:
+                    print(f"  WARNING: opening balances differ by {ledger.fmt(opening)} (unbalanced entries in the ledger?)")
+            for company_id, reason in sorted(skipped.items()):
+                print(f"{company_id[:8]:<10} skipped: {reason}")
+            for company_id, year in sorted(frozen):
+                if not args.year or year in args.year:
+                    print(f"{company_id[:8]:<10} {year:<6} already {runs[(company_id, year)][3]}; not recalculated")
+            if legacy:
+                print(f"NOTE: {legacy} posted legacy '{LEGACY_REFERENCE_TYPE}' entries remain in the journal and are part of the movements")
+
+            if apply:
+                run_ids = store_plans(cursor, ledger, plans, args.requested_by, args.notes)
+                print(f"\nStored {len(run_ids)} close runs as 'calculated'")
+                if args.post:
+                    approved = [
+                        str(run[0]) for key, run in runs.items()
+                        if run[3] == "closed" and run[5] is None and (not args.year or key[1] in args.year)
+                    ]
+                    posted = post_closings(cursor, approved, args.requested_by)
+                    for run_id, company_id, year, entry_id in posted:
+                        print(f"  Posted CLOSE-{year}-{str(run_id)[:8]} for {str(company_id)[:8]} ({entry_id})")
+                    skipped = len(approved) - len(posted)
+                    print(f"Posted {len(posted)} closing entries" + (f"; {skipped} unbalanced runs skipped" if skipped else ""))
+                connection.commit()
+            else:
+                connection.rollback()
+                print("\nDry run: nothing written (use --apply)")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    if args.post:
+        from balance_maintainer import sync as sync_balances
+
+        sync_balances()
+    print(
+        f"{ledger.n_lines} lines, {len(plans)} closings: load+plan {computed - started:.2f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
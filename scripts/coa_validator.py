@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Chart-of-accounts integrity checks across all companies in linear time.
+
+One pass over the accounts builds hash indexes on id and (company, code) and a
+parent index per account (parent_account_id, falling back to
+parent_account_code within the company). A second pass walks every
+parent chain once, finding cycles and each account's depth in the
+same walk. A grouped count over the journal lines finds postings to header
+accounts. Checks:
+
+  duplicate_code, missing_code, invalid_type        account rows
+  orphan_parent, cross_company_parent,
+  unresolved_parent_code, parent_code_mismatch      parent references
+  cycle, level_mismatch                             the resolved tree (roots are level 1)
+  parent_not_header, header_without_children        is_header vs the account's children
+  header_postings                                   journal lines on header accounts
+
+Usage:
+    python scripts/coa_validator.py                          # every company
+    python scripts/coa_validator.py --company-id <uuid> --format json --output coa_issues.json
+    python scripts/coa_validator.py --accounts coa.json --lines jel.json --entries je.json
+"""
+import argparse
+import json
+import sys
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from ledger_engine import Ledger, load_ledger
+from trial_balance import EXPENSE_TYPES, INCOME_TYPES
+
+
+# Both spellings of revenue and expense accounts are in use; trial_balance reads either.
+VALID_TYPES = ("assets", "liabilities", "equity", *INCOME_TYPES, *EXPENSE_TYPES)
+UNKNOWN_DEPTH = -1
+UNRESOLVED = -2  # parent reference that points nowhere: depth below it is unknown
+CHECKS = (
+    "duplicate_code", "missing_code", "invalid_type",
+    "orphan_parent", "cross_company_parent", "unresolved_parent_code", "parent_code_mismatch",
+    "cycle", "level_mismatch",
+    "parent_not_header", "header_without_children",
+    "header_postings",
+)
+
+
+@dataclass
+class Finding:
+    check: str
+    company_id: str
+    account_id: str
+    account_code: str | None
+    detail: str
+
+
+def code_index(ledger: Ledger) -> dict[tuple[int, str], list[int]]:
+    """(company code, account_code) -> account indexes, in one pass."""
+    index = defaultdict(list)
+    for a, (company, code) in enumerate(zip(ledger.account_company.tolist(), ledger.account_code)):
+        if code:
+            index[company, code].append(a)
+    return index
+
+
+def parent_index(ledger: Ledger, codes: dict[tuple[int, str], list[int]]) -> np.ndarray:
+    """Parent account index per account, or -1 for roots and unresolvable parents."""
+    parents = ledger.account_parent.copy()
+    for a in np.flatnonzero(parents < 0).tolist():
+        code = ledger.account_parent_code[a]
+        if code and not ledger.account_parent_id[a]:
+            matches = codes.get((int(ledger.account_company[a]), code))
+            if matches:
+                parents[a] = matches[0]
+    return parents
+
+
+def walk_tree(parents: list[int]) -> tuple[list[int], list[list[int]]]:
+    """Depth of every account (0 for roots) and the cycles, visiting each account once.
+
+    Accounts on a cycle, or whose chain runs into one or into an UNRESOLVED
+    parent, get UNKNOWN_DEPTH.
+    """
+    n = len(parents)
+    depth = [UNKNOWN_DEPTH] * n
+    state = [0] * n  # 0 unvisited, 1 on the current path, 2 done
+    cycles = []
+    for start in range(n):
+        if state[start]:
+            continue
+        path = []
+        node = start
+        while node >= 0 and state[node] == 0:
+            state[node] = 1
+            path.append(node)
+            node = parents[node]
+        if node == UNRESOLVED:
+            base = None
+        elif node < 0:
+            base = -1
+        elif state[node] == 1:
+            cycles.append(path[path.index(node):])
+            base = None
+        else:
+            base = None if depth[node] == UNKNOWN_DEPTH else depth[node]
+        for a in reversed(path):
+            state[a] = 2
+            if base is not None:
+                base += 1
+                depth[a] = base
+    return depth, cycles
+
+
+def validate(ledger: Ledger) -> list[Finding]:
+    findings = []
+    company_ids = [str(c) for c in ledger.companies]
+
+    def add(check: str, a: int, detail: str) -> None:
+        findings.append(Finding(
+            check, company_ids[ledger.account_company[a]], ledger.account_ids[a], ledger.account_code[a], detail
+        ))
+
+    codes = code_index(ledger)
+    for (_, code), accounts in codes.items():
+        if len(accounts) > 1:
+            for a in accounts:
+                add("duplicate_code", a, f"{len(accounts)} accounts share code {code}")
+    for a in range(ledger.n_accounts):
+        if not ledger.account_code[a]:
+            add("missing_code", a, "account_code is empty")
+        type_name = ledger.account_type_name(a)
+        if type_name not in VALID_TYPES:
+            add("invalid_type", a, f"account_type={type_name!r}")
+
+    parents = parent_index(ledger, codes)
+    for a in range(ledger.n_accounts):
+        parent_id = ledger.account_parent_id[a]
+        parent_code = ledger.account_parent_code[a]
+        p = int(parents[a])
+        if parent_id and p < 0:
+            add("orphan_parent", a, f"parent_account_id {parent_id} does not exist")
+        elif parent_code and p < 0:
+            add("unresolved_parent_code", a, f"parent_account_code {parent_code} not found in the company")
+        if p >= 0 and ledger.account_company[p] != ledger.account_company[a]:
+            add("cross_company_parent", a, f"parent {ledger.account_ids[p]} belongs to another company")
+        if p >= 0 and parent_code and ledger.account_code[p] != parent_code:
+            add("parent_code_mismatch", a, f"parent_account_code {parent_code}, parent's code {ledger.account_code[p]}")
+
+    referenced = np.array(
+        [bool(p or c) for p, c in zip(ledger.account_parent_id, ledger.account_parent_code)], dtype=bool
+    )
+    broken = (parents < 0) & referenced
+    depth, cycles = walk_tree(np.where(broken, UNRESOLVED, parents).tolist())
+    for cycle in cycles:
+        chain = " -> ".join(str(ledger.account_code[a]) for a in [*cycle, cycle[0]])
+        for a in cycle:
+            add("cycle", a, chain)
+    for a in range(ledger.n_accounts):
+        level = int(ledger.account_level[a])
+        if depth[a] != UNKNOWN_DEPTH and level and level != depth[a] + 1:
+            add("level_mismatch", a, f"account_level {level}, depth in tree {depth[a] + 1}")
+
+    children = np.bincount(parents[parents >= 0], minlength=ledger.n_accounts)
+    for a in np.flatnonzero((children > 0) & ~ledger.account_is_header).tolist():
+        add("parent_not_header", a, f"is_header is false but the account has {children[a]} children")
+    for a in np.flatnonzero((children == 0) & ledger.account_is_header).tolist():
+        add("header_without_children", a, "is_header is true but no account has it as parent")
+
+    known = ledger.line_account >= 0
+    on_header = np.zeros(ledger.n_lines, dtype=bool)
+    on_header[known] = ledger.account_is_header[ledger.line_account[known]]
+    if on_header.any():
+        posted = ledger.line_mask(statuses=("posted",)) & on_header
+        lines = np.bincount(ledger.line_account[on_header], minlength=ledger.n_accounts)
+        posted_lines = np.bincount(ledger.line_account[posted], minlength=ledger.n_accounts)
+        debit, credit = ledger.account_balances(on_header)
+        for a in np.flatnonzero(lines).tolist():
+            add(
+                "header_postings", a,
+                f"{lines[a]} lines ({posted_lines[a]} posted), debit {ledger.fmt(debit[a])} credit {ledger.fmt(credit[a])}",
+            )
+    return findings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", action="append", help="Company to check (repeatable; default every company)")
+    parser.add_argument("--accounts", help="chart_of_accounts JSON dump instead of the database")
+    parser.add_argument("--lines", help="journal_entry_lines JSON dump (for header postings)")
+    parser.add_argument("--entries", help="journal_entries JSON dump (for posted status)")
+    parser.add_argument("--format", choices=("console", "json"), default="console")
+    parser.add_argument("--output", help="Write the findings here instead of stdout")
+    parser.add_argument("--limit", type=int, default=10, help="Examples shown per check on the console")
+    args = parser.parse_args()
+
+    if args.accounts:
+        ledger = Ledger.from_json_files(args.entries, args.lines, args.accounts)
+    else:
+        ledger = load_ledger(args.company_id)
+    findings = validate(ledger)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump([asdict(finding) for finding in findings], out, ensure_ascii=False, indent=2)
+        else:
+            by_check = defaultdict(list)
+            for finding in findings:
+                by_check[finding.check].append(finding)
+            print(f"{ledger.n_accounts} accounts in {len(ledger.companies)} companies, {ledger.n_lines} lines", file=out)
+            for check in CHECKS:
+                found = by_check.get(check, [])
+                companies = Counter(finding.company_id for finding in found)
+                print(f"\n{check}: {len(found)}" + (f" in {len(companies)} companies" if found else ""), file=out)
+                for finding in found[:args.limit]:
+                    print(f"  {finding.company_id[:8]} {finding.account_code or '-':<12} {finding.detail}", file=out)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
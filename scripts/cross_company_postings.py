@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Find journal lines posted to another company's account, with totals per offending account.
+
+Entries and lines are loaded for the companies being checked and the chart of
+accounts for every company, so a line's entry and account are both interned
+indexes: comparing entry_company[line_entry] with account_company[line_account]
+is one vectorized pass over the lines, and per-account totals are one grouped
+sum. Lines whose account is in no company's chart are reported as missing.
+
+Usage:
+    python scripts/cross_company_postings.py                         # every company
+    python scripts/cross_company_postings.py --company-id <uuid> --format csv --output cross.csv
+    python scripts/cross_company_postings.py --entries je.json --lines jel.json --accounts coa_all.json
+"""
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from ledger_engine import Ledger, load_ledger
+from money import group_sum
+
+
+LINE_FIELDS = (
+    "line_id", "entry_id", "entry_number", "entry_date", "status", "entry_company_id",
+    "account_id", "account_code", "account_name", "account_company_id", "debit_amount", "credit_amount",
+)
+
+
+def cross_company_lines(ledger: Ledger) -> np.ndarray:
+    """Indexes of lines whose account belongs to a different company than their entry."""
+    known = (ledger.line_entry >= 0) & (ledger.line_account >= 0)
+    entry_company = np.full(ledger.n_lines, -1, dtype=np.int32)
+    account_company = np.full(ledger.n_lines, -1, dtype=np.int32)
+    entry_company[known] = ledger.entry_company[ledger.line_entry[known]]
+    account_company[known] = ledger.account_company[ledger.line_account[known]]
+    return np.flatnonzero(known & (entry_company != account_company))
+
+
+def missing_account_lines(ledger: Ledger) -> np.ndarray:
+    """Indexes of lines (of known entries) whose account_id is in no loaded chart of accounts."""
+    return np.flatnonzero((ledger.line_entry >= 0) & (ledger.line_account < 0))
+
+
+def offending_accounts(ledger: Ledger, lines: np.ndarray) -> list[dict]:
+    """Line count, debit and credit per (entry company, account) over the given lines, largest first."""
+    if not len(lines):
+        return []
+    entry_company = ledger.entry_company[ledger.line_entry[lines]].astype(np.int64)
+    pairs = entry_company * ledger.n_accounts + ledger.line_account[lines]
+    keys, group = np.unique(pairs, return_inverse=True)
+    counts = np.bincount(group, minlength=len(keys))
+    debit = group_sum(group, ledger.line_debit[lines], len(keys))
+    credit = group_sum(group, ledger.line_credit[lines], len(keys))
+    rows = []
+    for k, key in enumerate(keys.tolist()):
+        company, account = divmod(key, ledger.n_accounts)
+        rows.append({
+            "entry_company_id": str(ledger.companies[company]),
+            "account_id": ledger.account_ids[account],
+            "account_code": ledger.account_code[account],
+            "account_name": ledger.account_name[account],
+            "account_type": ledger.account_type_name(account),
+            "account_company_id": str(ledger.companies[ledger.account_company[account]]),
+            "lines": int(counts[k]),
+            "debit": int(debit[k]),
+            "credit": int(credit[k]),
+        })
+    rows.sort(key=lambda row: row["debit"] + row["credit"], reverse=True)
+    return rows
+
+
+def line_rows(ledger: Ledger, lines: np.ndarray) -> list[dict]:
+    rows = []
+    for i in lines.tolist():
+        entry, account = int(ledger.line_entry[i]), int(ledger.line_account[i])
+        rows.append({
+            "line_id": ledger.line_ids[i],
+            "entry_id": ledger.entry_ids[entry],
+            "entry_number": ledger.entry_number[entry],
+            "entry_date": str(ledger.entry_date[entry]),
+            "status": ledger.entry_status_name(entry),
+            "entry_company_id": str(ledger.companies[ledger.entry_company[entry]]),
+            "account_id": ledger.line_account_id[i],
+            "account_code": ledger.account_code[account] if account >= 0 else None,
+            "account_name": ledger.account_name[account] if account >= 0 else None,
+            "account_company_id": str(ledger.companies[ledger.account_company[account]]) if account >= 0 else None,
+            "debit_amount": ledger.major(ledger.line_debit[i]),
+            "credit_amount": ledger.major(ledger.line_credit[i]),
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", action="append", help="Company whose lines to check (repeatable; default every company)")
+    parser.add_argument("--entries", help="journal_entries JSON dump instead of the database")
+    parser.add_argument("--lines", help="journal_entry_lines JSON dump")
+    parser.add_argument("--accounts", help="chart_of_accounts JSON dump of every company")
+    parser.add_argument("--format", choices=("console", "csv", "json"), default="console")
+    parser.add_argument("--output", help="Write csv (one row per line) or json here instead of stdout")
+    parser.add_argument("--limit", type=int, default=20, help="Accounts and lines shown on the console")
+    args = parser.parse_args()
+
+    if args.entries or args.lines or args.accounts:
+        if not (args.entries and args.lines and args.accounts):
+            parser.error("--entries, --lines and --accounts must be given together")
+        ledger = Ledger.from_json_files(args.entries, args.lines, args.accounts)
+    else:
+        ledger = load_ledger(args.company_id, all_accounts=True)
+    cross = cross_company_lines(ledger)
+    missing = missing_account_lines(ledger)
+    accounts = offending_accounts(ledger, cross)
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump({
+                "lines_checked": ledger.n_lines,
+                "accounts": accounts,
+                "cross_company_lines": line_rows(ledger, cross),
+                "missing_account_lines": line_rows(ledger, missing),
+            }, out, ensure_ascii=False, indent=2, default=str)
+        elif args.format == "csv":
+            writer = csv.DictWriter(out, fieldnames=("issue", *LINE_FIELDS))
+            writer.writeheader()
+            for issue, lines in (("cross_company", cross), ("missing_account", missing)):
+                for row in line_rows(ledger, lines):
+                    writer.writerow({"issue": issue, **row})
+        else:
+            print(f"{ledger.n_lines} lines checked: {len(cross)} on another company's account, "
+                  f"{len(missing)} on a missing account", file=out)
+            if accounts:
+                print(f"\n{'Entry company':<14} {'Account company':<16} {'Code':<12} {'Account':<30} "
+                      f"{'Lines':>7} {'Debit':>15} {'Credit':>15}", file=out)
+                for row in accounts[:args.limit]:
+                    print(
+                        f"{row['entry_company_id'][:8]:<14} {row['account_company_id'][:8]:<16} "
+                        f"{row['account_code'] or '':<12} {str(row['account_name'] or '')[:30]:<30} "
+                        f"{row['lines']:>7} {ledger.fmt(row['debit']):>15} {ledger.fmt(row['credit']):>15}",
+                        file=out,
+                    )
+            if len(missing):
+                ids, counts = np.unique(ledger.line_account_id[missing].astype(str), return_counts=True)
+                print(f"\nMissing account ids ({len(ids)}):", file=out)
+                for account_id, count in sorted(zip(ids, counts), key=lambda pair: -pair[1])[:args.limit]:
+                    print(f"  {account_id}: {count} lines", file=out)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""Account statements for every customer of a company in one pass.
+
+The per-customer SQL functions (sql/CREATE_CUSTOMER_ACCOUNT_STATEMENT_FUNCTION.sql,
+sql/CREATE_SIMPLE_CUSTOMER_STATEMENT.sql) re-read invoices and payments and
+recompute running balances with a correlated subquery per row, one customer
+per call. Here customers, non-cancelled invoices, completed receipts and
+their active invoice allocations are read once, in one snapshot. The
+transactions are sorted by (customer, date, created_at) and a single cumulative
+sum of debit - credit gives every running balance; per-customer offsets and a
+binary search on the date turn it into opening balances, period slices and
+closing balances. Allocations add the applied amount of each invoice and
+payment, and each customer's unapplied credit: the part of the payments dated
+up to the period end that is not allocated, from a second cumulative sum.
+As in canonical_invoice_paid_amount (migration 20260712052000), a payment's
+legacy invoice_id link applies its whole amount while the payment has no
+active invoice allocation.
+
+Usage:
+    python scripts/customer_statements.py --start 2025-01-01 --end 2025-01-31 --output statements.jsonl
+    python scripts/customer_statements.py --end 2025-01-31 --format csv --output statements.csv
+    python scripts/customer_statements.py --start 2025-01-01 --format docx --output statements.docx
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections.abc import Iterator
+from datetime import datetime
+
+import numpy as np
+
+from db_connection import connect, get_company_id
+from money import company_scale, group_sum, minor_array, to_major
+from payment_allocator import COMPLETED_RECEIPT
+
+
+DAY_OFFSET = 2**31
+INVOICE, PAYMENT = 0, 1
+SOURCES = ("invoices", "payments")
+TRANSACTION_TYPES = ("invoice", "payment")
+
+CUSTOMERS = """
+    SELECT id, customer_code, customer_type, company_name, company_name_ar,
+           first_name, last_name, first_name_ar, last_name_ar, phone, is_active
+    FROM customers
+    WHERE company_id = %(company)s
+"""
+INVOICES = """
+    SELECT id, customer_id, invoice_date, created_at, invoice_number,
+           COALESCE(notes, 'Invoice No: ' || invoice_number), total_amount
+    FROM invoices
+    WHERE company_id = %(company)s
+      AND customer_id IS NOT NULL
+      AND COALESCE(status, 'active') <> 'cancelled'
+"""
+PAYMENTS = """
+    SELECT p.id, p.customer_id, p.payment_date, p.created_at, p.payment_number,
+           COALESCE(p.notes, 'Payment No: ' || p.payment_number), p.amount, p.invoice_id
+    FROM payments p
+    WHERE p.company_id = %(company)s
+""" + COMPLETED_RECEIPT
+ALLOCATIONS = """
+    SELECT pa.payment_id, pa.target_id, pa.amount
+    FROM payment_allocations pa
+    JOIN payments p ON p.id = pa.payment_id
+    WHERE pa.company_id = %(company)s
+      AND pa.allocation_type = 'invoice'
+      AND pa.is_active
+""" + COMPLETED_RECEIPT
+
+ROW_FIELDS = (
+    "transaction_id", "transaction_date", "transaction_type", "description", "reference_number",
+    "debit_amount", "credit_amount", "running_balance", "applied_amount", "source_table",
+)
+CSV_FIELDS = ("customer_id", "customer_code", "customer_name", *ROW_FIELDS)
+
+DOCX_HEADERS = ["التاريخ", "النوع", "المرجع", "البيان", "مدين", "دائن", "الرصيد"]
+DOCX_WIDTHS = [1200, 900, 1400, 2580, 1060, 1060, 1160]
+DOCX_TYPES = {"invoice": "فاتورة", "payment": "دفعة", "opening_balance": "رصيد افتتاحي"}
+
+
+def _name(customer: dict, arabic: bool = False) -> str:
+    suffix = "_ar" if arabic else ""
+    parts = (customer.get("first_name" + suffix), customer.get("last_name" + suffix))
+    return customer.get("company_name" + suffix) or " ".join(part for part in parts if part)
+
+
+def _instant(value) -> float:
+    """Seconds since the epoch of a created_at (datetime or ISO string), 0 when missing."""
+    if not value:
+        return 0.0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _day(value) -> int:
+    return int(np.datetime64(str(value)[:10], "D").astype(np.int64))
+
+
+class StatementBook:
+    """Every customer's invoices and payments, sorted by (customer, date, created_at)."""
+
+    def __init__(self, customers: list[dict], invoices: list[tuple], payments: list[tuple],
+                 allocations: list[tuple], scale: int = 2):
+        self.scale = scale
+        self.customers = customers
+        self.customer_index = {str(c["id"]): i for i, c in enumerate(customers)}
+
+        # Legacy links settle as allocations do, for payments of any customer.
+        allocated = {str(row[0]) for row in allocations}
+        allocations = list(allocations) + [
+            (row[0], row[7], row[6]) for row in payments if row[7] is not None and str(row[0]) not in allocated
+        ]
+        # Transactions whose customer is not in the company's customer list are dropped,
+        # as the SQL functions never reach them either.
+        invoices = [row for row in invoices if str(row[1]) in self.customer_index]
+        payments = [row for row in payments if str(row[1]) in self.customer_index]
+        rows = invoices + payments
+        ids = np.array([str(row[0]) for row in rows], dtype=object)
+        kind = np.array([INVOICE] * len(invoices) + [PAYMENT] * len(payments), dtype=np.int8)
+        customer = np.array([self.customer_index[str(row[1])] for row in rows], dtype=np.int32)
+        day = np.array([_day(row[2]) for row in rows], dtype=np.int64)
+        created = np.array([_instant(row[3]) for row in rows], dtype=np.float64)
+        amount = minor_array([row[6] for row in rows], scale)
+
+        # Applied amount per invoice and per payment: one grouped sum over the allocations.
+        by_kind = [{}, {}]
+        for i, transaction_id in enumerate(ids.tolist()):
+            by_kind[kind[i]][transaction_id] = i
+        applied = np.zeros(len(rows), dtype=np.int64)
+        if allocations:
+            allocation_amount = minor_array([row[2] for row in allocations], scale)
+            for k, column in ((PAYMENT, 0), (INVOICE, 1)):
+                target = np.array([by_kind[k].get(str(row[column]), -1) for row in allocations], dtype=np.int64)
+                known = target >= 0
+                applied += group_sum(target[known], allocation_amount[known], len(rows))
+
+        order = np.lexsort((created, day, customer))
+        self.ids = ids[order]
+        self.kind = kind[order]
+        self.customer = customer[order]
+        self.day = day[order]
+        self.reference = np.array([rows[i][4] for i in order.tolist()], dtype=object)
+        self.description = np.array([rows[i][5] for i in order.tolist()], dtype=object)
+        self.debit = np.where(self.kind == INVOICE, amount[order], 0)
+        self.credit = np.where(self.kind == PAYMENT, amount[order], 0)
+        self.applied = applied[order]
+
+        self.key = (self.customer.astype(np.int64) << 32) | (self.day + DAY_OFFSET)
+        self.offsets = np.searchsorted(self.customer, np.arange(len(customers) + 1))
+        self.cumulative = np.concatenate(([0], np.cumsum(self.debit - self.credit))).astype(np.int64)
+        # Unapplied credit up to any row: payments minus what they were allocated.
+        unapplied = np.where(self.kind == PAYMENT, self.credit - self.applied, 0)
+        self.unapplied_cumulative = np.concatenate(([0], np.cumsum(unapplied))).astype(np.int64)
+
+    @classmethod
+    def load(cls, company_id: str, database_url: str | None = None) -> "StatementBook":
+        params = {"company": company_id}
+        connection = connect(database_url, connect_timeout=10)
+        connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(CUSTOMERS, params)
+                names = [column[0] for column in cursor.description]
+                customers = [dict(zip(names, row)) for row in cursor.fetchall()]
+                cursor.execute(INVOICES, params)
+                invoices = cursor.fetchall()
+                cursor.execute(PAYMENTS, params)
+                payments = cursor.fetchall()
+                cursor.execute(ALLOCATIONS, params)
+                allocations = cursor.fetchall()
+                scale = company_scale(cursor, company_id)
+        finally:
+            connection.rollback()
+            connection.close()
+        return cls(customers, invoices, payments, allocations, scale)
+
+    @property
+    def n_transactions(self) -> int:
+        return len(self.ids)
+
+    def windows(self, start=None, end=None) -> tuple[np.ndarray, np.ndarray]:
+        """Row positions [lo, hi) of every customer's transactions dated start..end."""
+        customers = np.arange(len(self.customers), dtype=np.int64) << 32
+        lo = self.offsets[:-1] if start is None else np.searchsorted(self.key, customers | (_day(start) + DAY_OFFSET))
+        hi = self.offsets[1:] if end is None else np.searchsorted(self.key, customers | (_day(end) + DAY_OFFSET), "right")
+        return lo, np.maximum(lo, hi)
+
+    def major(self, minor: int):
+        return to_major(int(minor), self.scale)
+
+    def statements(self, start=None, end=None, *, include_inactive: bool = False,
+                   include_empty: bool = False) -> Iterator[dict]:
+        lo, hi = self.windows(start, end)
+        base = self.cumulative[self.offsets[:-1]]
+        opening = self.cumulative[lo] - base
+        closing = self.cumulative[hi] - base
+        unapplied = self.unapplied_cumulative[hi] - self.unapplied_cumulative[self.offsets[:-1]]
+        for c, customer in enumerate(self.customers):
+            if not include_inactive and customer.get("is_active") is False:
+                continue
+            first, last = int(lo[c]), int(hi[c])
+            if not include_empty and first == last and not opening[c]:
+                continue
+            rows = []
+            if start is not None and opening[c]:
+                rows.append({
+                    "transaction_id": "opening",
+                    "transaction_date": str(start)[:10],
+                    "transaction_type": "opening_balance",
+                    "description": "Opening Balance",
+                    "reference_number": "OB-" + str(start)[:10].replace("-", ""),
+                    "debit_amount": self.major(max(opening[c], 0)),
+                    "credit_amount": self.major(max(-opening[c], 0)),
+                    "running_balance": self.major(opening[c]),
+                    "applied_amount": None,
+                    "source_table": "opening_balance",
+                })
+            running = self.cumulative[first + 1:last + 1] - base[c]
+            for i, balance in zip(range(first, last), running.tolist()):
+                kind = int(self.kind[i])
+                rows.append({
+                    "transaction_id": self.ids[i],
+                    "transaction_date": str(np.datetime64(int(self.day[i]), "D")),
+                    "transaction_type": TRANSACTION_TYPES[kind],
+                    "description": self.description[i],
+                    "reference_number": self.reference[i],
+                    "debit_amount": self.major(self.debit[i]),
+                    "credit_amount": self.major(self.credit[i]),
+                    "running_balance": self.major(balance),
+                    "applied_amount": self.major(self.applied[i]),
+                    "source_table": SOURCES[kind],
+                })
+            yield {
+                "customer_id": str(customer["id"]),
+                "customer_code": customer.get("customer_code"),
+                "customer_name": _name(customer),
+                "customer_name_ar": _name(customer, arabic=True),
+                "period_start": str(start)[:10] if start else None,
+                "period_end": str(end)[:10] if end else None,
+                "opening_balance": self.major(opening[c]),
+                "total_debit": self.major(self.debit[first:last].sum()),
+                "total_credit": self.major(self.credit[first:last].sum()),
+                "closing_balance": self.major(closing[c]),
+                "unapplied_credit": self.major(unapplied[c]),
+                "rows": rows,
+            }
+
+
+def write_jsonl(statements: Iterator[dict], out) -> int:
+    count = 0
+    for statement in statements:
+        out.write(json.dumps(statement, ensure_ascii=False, default=str) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(statements: Iterator[dict], out) -> int:
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    count = 0
+    for statement in statements:
+        customer = {field: statement[field] for field in ("customer_id", "customer_code", "customer_name")}
+        for row in statement["rows"]:
+            writer.writerow({**customer, **row})
+        count += 1
+    return count
+
+
+def write_docx(statements: Iterator[dict], path: str, company_name: str | None = None) -> int:
+    """One right-to-left statement per customer, each starting on a new page."""
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+
+    from generate_employee_workspace_guide_docx import (
+        MUTED, add_label_detail_table, add_para, set_document_rtl, set_table_text, table_setup,
+    )
+
+    doc = Document()
+    set_document_rtl(doc)
+    count = 0
+    for statement in statements:
+        if count:
+            doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+        add_para(doc, "كشف حساب عميل", size=16, bold=True, after=4)
+        if company_name:
+            add_para(doc, company_name, size=10.5, color=MUTED, after=8)
+        period = " - ".join(part for part in (statement["period_start"], statement["period_end"]) if part)
+        add_label_detail_table(doc, [
+            ("العميل", statement["customer_name_ar"] or statement["customer_name"] or ""),
+            ("رمز العميل", statement["customer_code"] or ""),
+            ("الفترة", period or "كل الحركات"),
+            ("الرصيد الافتتاحي", f"{statement['opening_balance']:,}"),
+            ("إجمالي المدين", f"{statement['total_debit']:,}"),
+            ("إجمالي الدائن", f"{statement['total_credit']:,}"),
+            ("الرصيد الختامي", f"{statement['closing_balance']:,}"),
+            ("دفعات غير مخصصة", f"{statement['unapplied_credit']:,}"),
+        ])
+        # Filled row by row: table.cell(r, c) rescans the whole table, which is
+        # quadratic on statements with hundreds of transactions.
+        table = doc.add_table(rows=1 + len(statement["rows"]), cols=len(DOCX_HEADERS))
+        table_setup(table, DOCX_WIDTHS)
+        cells = [row.cells for row in table.rows]
+        for cell, header in zip(cells[0], DOCX_HEADERS):
+            set_table_text(cell, header, bold=True, size=10.2)
+        for row_cells, row in zip(cells[1:], statement["rows"]):
+            values = (
+                row["transaction_date"],
+                DOCX_TYPES[row["transaction_type"]],
+                row["reference_number"] or "",
+                str(row["description"] or "")[:80],
+                f"{row['debit_amount']:,}",
+                f"{row['credit_amount']:,}",
+                f"{row['running_balance']:,}",
+            )
+            for cell, text in zip(row_cells, values):
+                set_table_text(cell, text, size=9.6)
+        count += 1
+    doc.save(path)
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company (default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--start", help="First transaction date; earlier ones form the opening balance")
+    parser.add_argument("--end", help="Last transaction date")
+    parser.add_argument("--format", choices=("jsonl", "csv", "docx"), default="jsonl")
+    parser.add_argument("--output", help="Output file (required for docx; default stdout)")
+    parser.add_argument("--include-inactive", action="store_true", help="Also inactive customers")
+    parser.add_argument("--include-empty", action="store_true", help="Also customers with no balance and no activity")
+    args = parser.parse_args()
+    if args.format == "docx" and not args.output:
+        parser.error("--format docx needs --output")
+
+    company_id = args.company_id or get_company_id()
+    started = time.perf_counter()
+    book = StatementBook.load(company_id)
+    loaded = time.perf_counter() - started
+    statements = book.statements(
+        args.start, args.end, include_inactive=args.include_inactive, include_empty=args.include_empty
+    )
+
+    if args.format == "docx":
+        count = write_docx(statements, args.output)
+    else:
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            count = (write_jsonl if args.format == "jsonl" else write_csv)(statements, out)
+        finally:
+            if args.output:
+                out.close()
+    print(
+        f"{count} statements from {book.n_transactions} transactions of {len(book.customers)} customers "
+        f"(loaded in {loaded:.1f}s, total {time.perf_counter() - started:.1f}s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,38 @@
 """Shared database connection configuration for maintenance scripts."""
+import json
 import os
 
 
+DEFAULT_COMPANY_ID = '24bc0b21-4e2d-4413-9842-31719a3669f4'
+
+
 def get_database_url() -> str:
     database_url = os.environ.get('SUPABASE_DB_URL') or os.environ.get('DATABASE_URL')
     if not database_url:
         raise RuntimeError('SUPABASE_DB_URL or DATABASE_URL must be configured')
     return database_url
+
+
+def connect(database_url: str | None = None, **kwargs):
+    """psycopg2 connection; cursors are timed when FLEETIFY_QUERY_TIMING is set."""
+    import psycopg2
+
+    from query_timing import TimedCursor, timing_enabled
+
+    if timing_enabled():
+        kwargs.setdefault('cursor_factory', TimedCursor)
+    return psycopg2.connect(database_url or get_database_url(), **kwargs)
+
+
+def get_company_id() -> str:
+    """Company the script operates on; set by run_per_company.py for fan-out runs."""
+    return os.environ.get('FLEETIFY_COMPANY_ID') or DEFAULT_COMPANY_ID
+
+
+def write_company_result(payload) -> None:
+    """Hand a JSON-serialisable result back to run_per_company.py, if it launched us."""
+    result_path = os.environ.get('FLEETIFY_RESULT_PATH')
+    if not result_path:
+        return
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, default=str)
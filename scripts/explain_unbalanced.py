@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Explain every unbalanced journal entry: its lines, header vs line totals and accounts.
+
+Lines are grouped by entry once (ledger_engine's offsets index), so the report
+is linear in the number of lines however many entries are broken. Each entry
+is written as soon as it is explained, to the console, CSV (one row per line)
+or JSON Lines (one object per entry).
+
+Usage:
+    python scripts/explain_unbalanced.py --entries je_all.json --lines jel_all.json --accounts coa.json
+    python scripts/explain_unbalanced.py --company-id <uuid> --format csv --output unbalanced.csv
+"""
+import argparse
+import csv
+import json
+import sys
+from collections.abc import Iterator
+from decimal import Decimal
+
+import numpy as np
+
+from ledger_engine import TOLERANCE, Ledger, load_ledger
+from money import to_minor
+
+
+CSV_FIELDS = (
+    "entry_id", "entry_number", "entry_date", "status", "issues",
+    "header_debit", "header_credit", "line_debit", "line_credit", "line_difference",
+    "line_number", "account_id", "account_code", "account_name", "account_type",
+    "debit_amount", "credit_amount", "line_description",
+)
+
+
+def problem_entries(ledger: Ledger, tolerance: int) -> dict[int, list[str]]:
+    """Entry index -> the checks it fails, in entry order."""
+    issues: dict[int, list[str]] = {}
+    for name, entries in (
+        ("lines_unbalanced", ledger.unbalanced_entries(tolerance)),
+        ("header_unbalanced", ledger.header_unbalanced_entries(tolerance)),
+        ("header_differs_from_lines", ledger.header_line_mismatches(tolerance)),
+    ):
+        for entry in entries.tolist():
+            issues.setdefault(entry, []).append(name)
+    return dict(sorted(issues.items()))
+
+
+def explain(ledger: Ledger, tolerance: int = TOLERANCE) -> Iterator[dict]:
+    debit, credit, count = ledger.entry_totals()
+    for entry, issues in problem_entries(ledger, tolerance).items():
+        lines = []
+        for line in ledger.lines_of(entry).tolist():
+            account = int(ledger.line_account[line])
+            known = account >= 0
+            lines.append({
+                "line_number": int(ledger.line_number[line]),
+                "account_id": ledger.line_account_id[line],
+                "account_code": ledger.account_code[account] if known else None,
+                "account_name": ledger.account_name[account] if known else None,
+                "account_type": ledger.account_type_name(account),
+                "debit_amount": ledger.major(ledger.line_debit[line]),
+                "credit_amount": ledger.major(ledger.line_credit[line]),
+                "line_description": ledger.line_description[line],
+            })
+        date = ledger.entry_date[entry]
+        yield {
+            "entry_id": ledger.entry_ids[entry],
+            "entry_number": ledger.entry_number[entry],
+            "entry_date": None if np.isnat(date) else str(date),
+            "status": ledger.entry_status_name(entry),
+            "reference_type": ledger.entry_reference_type[entry],
+            "reference_id": ledger.entry_reference_id[entry],
+            "issues": issues,
+            "header_debit": ledger.major(ledger.entry_debit[entry]),
+            "header_credit": ledger.major(ledger.entry_credit[entry]),
+            "line_debit": ledger.major(debit[entry]),
+            "line_credit": ledger.major(credit[entry]),
+            "line_difference": ledger.major(debit[entry] - credit[entry]),
+            "line_count": int(count[entry]),
+            "accounts": sorted({line["account_code"] or line["account_id"] or "?" for line in lines}),
+            "lines": lines,
+        }
+
+
+def write_console(explanations: Iterator[dict], out) -> int:
+    written = 0
+    for item in explanations:
+        written += 1
+        print(f"JE {item['entry_number']} ({item['entry_id']}) {item['entry_date']} status={item['status']}", file=out)
+        print(f"  issues: {', '.join(item['issues'])}", file=out)
+        print(f"  header: D={item['header_debit']:,} C={item['header_credit']:,}", file=out)
+        print(
+            f"  lines:  D={item['line_debit']:,} C={item['line_credit']:,} "
+            f"diff={item['line_difference']:,} ({item['line_count']} lines)",
+            file=out,
+        )
+        print(f"  accounts: {', '.join(item['accounts'])}", file=out)
+        for line in item["lines"]:
+            print(
+                f"    {line['line_number']:>3} {line['account_code'] or '?':<12} {line['account_type'] or '?':<12} "
+                f"D={line['debit_amount']:>12,} C={line['credit_amount']:>12,} {line['line_description'] or ''}",
+                file=out,
+            )
+        print(file=out)
+    return written
+
+
+def write_csv(explanations: Iterator[dict], out) -> int:
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    written = 0
+    for item in explanations:
+        written += 1
+        header = {**item, "issues": ";".join(item["issues"])}
+        for line in item["lines"] or [{}]:
+            writer.writerow({**header, **line})
+    return written
+
+
+def write_json(explanations: Iterator[dict], out) -> int:
+    written = 0
+    for item in explanations:
+        written += 1
+        out.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+    return written
+
+
+WRITERS = {"console": write_console, "csv": write_csv, "json": write_json}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", help="journal_entries JSON dump")
+    parser.add_argument("--lines", help="journal_entry_lines JSON dump")
+    parser.add_argument("--accounts", help="chart_of_accounts JSON dump (for account codes and types)")
+    parser.add_argument("--company-id", action="append", help="Read from the database for this company (repeatable)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="console")
+    parser.add_argument("--output", help="Write here instead of stdout")
+    parser.add_argument("--tolerance", type=Decimal, default=Decimal(0), help="Allowed difference in currency units")
+    args = parser.parse_args()
+
+    if args.entries and args.lines:
+        ledger = Ledger.from_json_files(args.entries, args.lines, args.accounts)
+    elif args.entries or args.lines:
+        parser.error("--entries and --lines must be given together")
+    else:
+        ledger = load_ledger(args.company_id)
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        written = WRITERS[args.format](explain(ledger, to_minor(args.tolerance, ledger.scale)), out)
+    finally:
+        if args.output:
+            out.close()
+    print(
+        f"{written} problem entries out of {ledger.n_entries} ({ledger.n_lines} lines)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
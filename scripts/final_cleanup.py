@@ -1,6 +1,6 @@
 """
-Final cleanup: Fix stuck payments by temporarily adjusting contract amounts,
-delete placeholder invoices, restore 2099 dates.
+Final cleanup: release stuck payments through stuck_payment_planner,
+restore 2099 dates, purge placeholder invoices through placeholder_purge.
 """
 import os, sys
 
@@ -8,9 +8,8 @@ if os.environ.get('ALLOW_DANGEROUS_PAYMENT_CLEANUP') != 'YES':
     print('Blocked: this cleanup script directly mutates payments. Set ALLOW_DANGEROUS_PAYMENT_CLEANUP=YES only after a reviewed repair plan.')
     sys.exit(1)
 
-import requests, time, json
+import requests, time
 from dotenv import dotenv_values
-from collections import defaultdict
 
 vals = dotenv_values('.env')
 BASE_URL = vals.get('VITE_SUPABASE_URL', '').strip()
@@ -50,77 +49,28 @@ print("FINAL CLEANUP")
 print("=" * 70)
 
 # ============================================================
-# STEP 1: Fix 31 stuck payments by temporarily adjusting contract amounts
+# STEP 1: Release stuck payments (one bulk statement per planned strategy)
 # ============================================================
 print("\n--- STEP 1: FIX STUCK PAYMENTS ---")
 
-# Get all PYINV* invoice IDs
-invoices = get_all('invoices', 'id,invoice_number')
-pyinv_ids = set(i['id'] for i in invoices if i.get('invoice_number', '').startswith(('PYINV-', 'PYINV3-', 'PYINV2-')))
-
-# Get stuck payments (linked to PYINV* invoices)
-linked = get_all('payments', 'id,payment_number,amount,invoice_id,payment_status,contract_id,company_id', 'invoice_id=not.is.null')
-stuck = [p for p in linked if p.get('invoice_id') in pyinv_ids]
-print(f"  Stuck payments: {len(stuck)}")
-
-# Get contracts
-contracts = get_all('contracts', 'id,contract_number,total_amount')
-con_lookup = {c['id']: c for c in contracts}
-
-fixed = 0
-still_stuck = 0
-for p in stuck:
-    pid = p['id']
-    con_id = p.get('contract_id')
-    pay_amount = float(p.get('amount', 0))
-    
-    # Strategy: temporarily increase contract amount to bypass overpayment trigger
-    if con_id and con_id in con_lookup:
-        con = con_lookup[con_id]
-        original_amount = float(con.get('total_amount', 0) or 0)
-        # Set contract amount high enough to cover the payment
-        inflated = max(original_amount, pay_amount * 2)
-        
-        # Step 1: Inflate contract amount
-        ok1, _ = patch('contracts', 'id=eq.' + con_id, {'total_amount': inflated})
-        if not ok1:
-            still_stuck += 1
-            continue
-        
-        # Step 2: Set payment to cancelled
-        ok2, _ = patch('payments', 'id=eq.' + pid, {'payment_status': 'cancelled'})
-        if not ok2:
-            patch('contracts', 'id=eq.' + con_id, {'total_amount': original_amount})
-            still_stuck += 1
-            continue
-        
-        # Step 3: Set invoice_id to NULL
-        ok3, _ = patch('payments', 'id=eq.' + pid, {'invoice_id': None})
-        if not ok3:
-            patch('payments', 'id=eq.' + pid, {'payment_status': 'completed'})
-            patch('contracts', 'id=eq.' + con_id, {'total_amount': original_amount})
-            still_stuck += 1
-            continue
-        
-        # Step 4: Set back to completed
-        ok4, _ = patch('payments', 'id=eq.' + pid, {'payment_status': 'completed'})
-        
-        # Step 5: Restore contract amount
-        patch('contracts', 'id=eq.' + con_id, {'total_amount': original_amount})
-        
-        fixed += 1
-    else:
-        # No contract - try direct cancelled approach
-        ok, _ = patch('payments', 'id=eq.' + pid, {'payment_status': 'cancelled'})
-        if ok:
-            patch('payments', 'id=eq.' + pid, {'invoice_id': None})
-            patch('payments', 'id=eq.' + pid, {'payment_status': 'completed'})
-            fixed += 1
-        else:
-            still_stuck += 1
-
-print(f"  Fixed: {fixed}")
-print(f"  Still stuck: {still_stuck}")
+from db_connection import connect, get_company_id
+from stuck_payment_planner import apply_repairs, load_snapshot, plan_repairs
+
+connection = connect(connect_timeout=10)
+try:
+    with connection.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        snapshot = load_snapshot(cursor, get_company_id())
+    connection.rollback()
+    repairs = plan_repairs(snapshot)
+    print(f"  Stuck payments: {len(repairs)}")
+    outcomes = apply_repairs(connection, get_company_id(), repairs, 'Final cleanup: release PYINV placeholder payments')
+finally:
+    connection.close()
+
+for strategy, outcome in outcomes.items():
+    print(f"  {strategy}: {outcome}")
+print(f"  Still stuck: {sum(1 for r in repairs if r.strategy == 'blocked')}")
 
 # ============================================================
 # STEP 2: Restore 2099 dates to original payment dates
@@ -166,25 +116,25 @@ for inv in bad_dates:
 print(f"  Restored dates: {restored}")
 
 # ============================================================
-# STEP 3: Delete placeholder invoices (try via status change)
+# STEP 3: Delete placeholder invoices (one bulk statement per chain step)
 # ============================================================
 print("\n--- STEP 3: DELETE PLACEHOLDER INVOICES ---")
 
-# Get all PYINV* invoices
-pyinv_invs = get_all('invoices', 'id,invoice_number,status,payment_status', 'invoice_number=like.PYINV-%25')
-print(f"  PYINV* invoices: {len(pyinv_invs)}")
-
-# Try to delete them - first set status to draft, then delete
-deleted = 0
-for i, inv in enumerate(pyinv_invs):
-    # Set status to draft
-    patch('invoices', 'id=eq.' + inv['id'], {'status': 'draft'})
-    # Try delete
-    r = requests.delete(BASE_URL + '/rest/v1/invoices?id=eq.' + inv['id'], headers=H)
-    if r.status_code == 200:
-        deleted += 1
-    if (i + 1) % 200 == 0:
-        print(f"  Processed {i+1}/{len(pyinv_invs)}... deleted={deleted}")
+from placeholder_purge import plan_purge, run_purge
+
+connection = connect(connect_timeout=10)
+try:
+    with connection.cursor() as cursor:
+        purge = plan_purge(cursor, companies=[get_company_id()], lock=True)
+        print(f"  PYINV* invoices: {len(purge.invoices) + len(purge.blocked)} ({len(purge.blocked)} still in use)")
+        deleted = run_purge(cursor, purge)['delete invoices']
+    connection.commit()
+except Exception as error:
+    connection.rollback()
+    deleted = 0
+    print(f"  Rolled back: {str(error).strip().splitlines()[0]}")
+finally:
+    connection.close()
 
 print(f"  Deleted: {deleted}")
 
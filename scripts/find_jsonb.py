@@ -1,39 +1,25 @@
 #!/usr/bin/env python3
-import psycopg2
-from db_connection import get_database_url
+"""List jsonb columns and the jsonb usage of payment trigger functions.
 
-conn = psycopg2.connect(get_database_url())
-conn.autocommit = True
-cur = conn.cursor()
+Reads the local catalog snapshot; run `catalog_snapshot.py refresh` after schema changes.
+"""
+from catalog_snapshot import CatalogSnapshot
+
+catalog = CatalogSnapshot()
 
-cur.execute("""
-    SELECT table_name, column_name, data_type
-    FROM information_schema.columns
-    WHERE data_type = 'jsonb'
-    AND table_schema = 'public'
-    ORDER BY table_name, column_name
-""")
 print("=== JSONB COLUMNS ===")
-for r in cur.fetchall():
-    print(f"  {r[0]}.{r[1]}")
+for r in catalog.columns_of_type('jsonb'):
+    print(f"  {r['table_name']}.{r['column_name']}")
 
-cur.execute("""
-    SELECT DISTINCT p.proname, pg_get_functiondef(p.oid)
-    FROM pg_proc p
-    JOIN pg_trigger t ON t.tgfoid = p.oid
-    WHERE tgrelid = 'payments'::regclass
-    ORDER BY p.proname
-""")
 print("\n=== PAYMENT TRIGGER FUNCTIONS ===")
-for r in cur.fetchall():
-    body = r[1]
+for r in catalog.trigger_functions('payments'):
+    body = r['definition']
     if 'jsonb' in body.lower() or '->>' in body:
-        print(f"\n--- {r[0]} ---")
+        print(f"\n--- {r['function_name']} ---")
         for line in body.split('\n'):
             if 'jsonb' in line.lower() or '->>' in line or 'INSERT' in line.upper():
                 print(f"  {line.strip()[:200]}")
     else:
-        print(f"  {r[0]} (no jsonb)")
+        print(f"  {r['function_name']} (no jsonb)")
 
-cur.close()
-conn.close()
+catalog.close()
@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
-"""Fix accounting equation: run update_account_balances_from_entries RPC."""
+"""Fix accounting equation: run update_account_balances_from_entries RPC.
+
+The expected balances come from the trial balance over journal_entry_lines, so
+the RPC only runs when stored current_balance values have drifted.
+"""
 import json, os, urllib.request
 
+from db_connection import get_company_id
+from ledger_engine import load_ledger
+from money import to_minor
+from trial_balance import compute_trial_balance
+
 env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 with open(env_path, 'r') as f:
     for line in f:
@@ -10,8 +19,7 @@ with open(env_path, 'r') as f:
             break
 
 BASE = "https://qwhunliohlkkahbspfiu.supabase.co/rest/v1/rpc"
-TMP = 'C:/Users/khamis/AppData/Local/Temp'
-CID = "24bc0b21-4e2d-4413-9842-31719a3669f4"
+CID = get_company_id()
 
 def rpc_call(name, payload=None):
     url = f"{BASE}/{name}"
@@ -30,31 +38,37 @@ def rpc_call(name, payload=None):
     except Exception as e:
         return f"Error: {e}"
 
-# Step 1: Check current account balances
-print("=== STEP 1: Current account balances ===")
-with open(f'{TMP}/coa.json') as f:
-    coa = json.load(f)
-type_balances = {}
-for a in coa:
-    at = a.get('account_type', '?')
-    bal = float(a.get('current_balance') or 0)
-    type_balances[at] = type_balances.get(at, 0) + bal
-for t, b in sorted(type_balances.items()):
-    print(f"  {t}: {b:,.2f}")
-ta = type_balances.get('assets', 0)
-tl = type_balances.get('liabilities', 0)
-te = type_balances.get('equity', 0)
-print(f"  A={ta:,.2f} L={tl:,.2f} E={te:,.2f} L+E={tl+te:,.2f}")
-print(f"  Diff: {abs(ta-(tl+te)):,.2f}")
+def print_equation(types):
+    for t, b in sorted(types.items()):
+        print(f"  {t}: {b:,.2f}")
+    ta = types.get('assets', 0)
+    tl = types.get('liabilities', 0)
+    te = types.get('equity', 0)
+    print(f"  A={ta:,.2f} L={tl:,.2f} E={te:,.2f} L+E={tl+te:,.2f}")
+    print(f"  Diff: {abs(ta-(tl+te)):,.2f}")
+
+# Step 1: Trial balance from posted journal lines vs stored current_balance
+print("=== STEP 1: Trial balance from journal_entry_lines ===")
+ledger = load_ledger([CID])
+tb = compute_trial_balance(ledger, company_id=CID)
+print_equation({t: ledger.major(b) for t, b in tb.by_type().items()})
+
+stored = ledger.account_current_balance
+postable = tb.accounts[~ledger.account_is_header[tb.accounts]]
+stale = postable[stored[postable] != tb.closing[postable]]
+print(f"\n  Accounts whose current_balance differs from their lines: {len(stale)}")
 
 # Step 2: Run update_account_balances_from_entries RPC
-print("\n=== STEP 2: Run update_account_balances_from_entries ===")
-result = rpc_call('update_account_balances_from_entries')
-print(f"  Result: {result}")
+if len(stale):
+    print("\n=== STEP 2: Run update_account_balances_from_entries ===")
+    result = rpc_call('update_account_balances_from_entries')
+    print(f"  Result: {result}")
+else:
+    print("\n=== STEP 2: current_balance already matches the lines, RPC not needed ===")
 
 # Step 3: Re-fetch account balances and check
 print("\n=== STEP 3: Re-fetch account balances ===")
-url = f"https://qwhunliohlkkahbspfiu.supabase.co/rest/v1/chart_of_accounts?select=account_code,account_name,account_type,current_balance&company_id=eq.{CID}&limit=500"
+url = f"https://qwhunliohlkkahbspfiu.supabase.co/rest/v1/chart_of_accounts?select=id,account_code,account_name,account_type,current_balance&company_id=eq.{CID}&limit=500"
 req = urllib.request.Request(url, headers={
     'apikey': SRK,
     'Authorization': f'Bearer {SRK}',
@@ -62,22 +76,15 @@ req = urllib.request.Request(url, headers={
 with urllib.request.urlopen(req) as resp:
     coa2 = json.loads(resp.read())
 
-type_balances2 = {}
+mismatched = 0
 for a in coa2:
-    at = a.get('account_type', '?')
-    bal = float(a.get('current_balance') or 0)
-    type_balances2[at] = type_balances2.get(at, 0) + bal
-for t, b in sorted(type_balances2.items()):
-    print(f"  {t}: {b:,.2f}")
-ta2 = type_balances2.get('assets', 0)
-tl2 = type_balances2.get('liabilities', 0)
-te2 = type_balances2.get('equity', 0)
-print(f"  A={ta2:,.2f} L={tl2:,.2f} E={te2:,.2f} L+E={tl2+te2:,.2f}")
-print(f"  Diff: {abs(ta2-(tl2+te2)):,.2f}")
+    i = ledger.account_index.get(a['id'])
+    if i is not None and not ledger.account_is_header[i] and to_minor(a.get('current_balance'), ledger.scale) != tb.closing[i]:
+        mismatched += 1
+print(f"  Accounts still differing from the trial balance: {mismatched}")
 
 # Show accounts with non-zero balances
-print("\n=== Accounts with non-zero balances after update ===")
-for a in coa2:
-    bal = float(a.get('current_balance') or 0)
-    if abs(bal) > 0.01:
-        print(f"  {a['account_code']} {a['account_name']}: {bal:,.2f} ({a['account_type']})")
+print("\n=== Accounts with non-zero balances (from lines) ===")
+for row in tb.rows():
+    if row['closing']:
+        print(f"  {row['account_code']} {row['account_name']}: {row['closing']:,.2f} ({row['account_type']})")
@@ -8,15 +8,14 @@ Rules:
   4. Fix unpaid installment amounts to match contract.monthly_amount
   5. Fix unpaid invoice amounts to match their linked schedule
 """
-import psycopg2
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from db_connection import get_database_url
+from db_connection import connect, get_database_url
 
 DB_URL = get_database_url()
 
 def main():
-    conn = psycopg2.connect(DB_URL)
+    conn = connect(DB_URL)
     conn.autocommit = True
     cur = conn.cursor()
 
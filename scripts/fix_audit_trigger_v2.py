@@ -1,119 +1,75 @@
 #!/usr/bin/env python3
-import psycopg2
-from db_connection import get_database_url
+"""Install financial_audit_trigger_fn in changed-fields mode and measure the audit_logs saving.
 
-conn = psycopg2.connect(get_database_url())
-conn.autocommit = True
-cur = conn.cursor()
-
-cur.execute("""
-CREATE OR REPLACE FUNCTION public.financial_audit_trigger_fn()
-RETURNS trigger
-LANGUAGE plpgsql
-SECURITY DEFINER
-SET search_path = public
-AS $$
-DECLARE
-  v_action text;
-  v_company_id uuid;
-  v_resource_id uuid;
-  v_resource_type text;
-  v_details jsonb;
-  v_severity text := 'low';
-  v_status text := 'success';
-  v_old_row jsonb := NULL;
-  v_new_row jsonb := NULL;
-  v_user_id uuid := auth.uid();
-BEGIN
-  v_resource_type := TG_TABLE_NAME;
+The function definition lives in the migration below, which also keeps full
+images for payments. Before installing, the existing invoice and journal-entry
+*_updated audit rows are measured as stored (full row images) and as they would
+be stored in changed-fields mode (primary key + changed fields).
+"""
+from pathlib import Path
 
-  IF TG_OP IN ('UPDATE', 'DELETE') THEN
-    v_old_row := to_jsonb(OLD);
-  END IF;
+from db_connection import connect
 
-  IF TG_OP IN ('INSERT', 'UPDATE') THEN
-    v_new_row := to_jsonb(NEW);
-  END IF;
+MIGRATION = (
+    Path(__file__).resolve().parents[1]
+    / 'supabase' / 'migrations' / '20261019000001_financial_audit_changed_fields_mode.sql'
+)
 
-  IF TG_OP = 'INSERT' THEN
-    v_action := v_resource_type || '_created';
-    v_company_id := NEW.company_id;
-    v_resource_id := NEW.id;
-    v_details := jsonb_build_object('new_values', v_new_row);
-    IF TG_TABLE_NAME = 'payments' THEN
-      v_severity := 'medium';
-    END IF;
-  ELSIF TG_OP = 'UPDATE' THEN
-    v_action := v_resource_type || '_updated';
-    v_company_id := NEW.company_id;
-    v_resource_id := NEW.id;
-    v_details := jsonb_build_object(
-      'old_values', v_old_row,
-      'new_values', v_new_row,
-      'changed_fields', (
-        SELECT jsonb_object_agg(key, value)
-        FROM jsonb_each(v_new_row) AS n
-        WHERE n.value IS DISTINCT FROM (v_old_row -> n.key)
-      )
-    );
+# Routine updates are the rows the changed-fields mode shrinks; payments and
+# high-severity updates keep full images in both modes.
+SIZE_QUERY = """
+    SELECT
+        count(*),
+        COALESCE(sum(COALESCE(pg_column_size(old_values), 0) + COALESCE(pg_column_size(new_values), 0)), 0),
+        COALESCE(sum(
+            COALESCE(pg_column_size(
+                jsonb_build_object('id', old_values -> 'id') || COALESCE((
+                    SELECT jsonb_object_agg(key, old_values -> key)
+                    FROM jsonb_object_keys(metadata) AS key
+                ), '{}'::jsonb)
+            ), 0)
+            + COALESCE(pg_column_size(
+                jsonb_build_object('id', new_values -> 'id') || COALESCE(metadata, '{}'::jsonb)
+            ), 0)
+        ), 0)
+    FROM audit_logs
+    WHERE resource_type IN ('invoice', 'journal_entry')
+      AND action LIKE '%\\_updated'
+      AND COALESCE(severity, 'low') <> 'high'
+      AND jsonb_typeof(metadata) = 'object'
+"""
 
-    IF TG_TABLE_NAME = 'payments'
-       AND (v_old_row ->> 'payment_status') IS DISTINCT FROM (v_new_row ->> 'payment_status')
-    THEN
-      v_severity := 'high';
-    END IF;
-  ELSIF TG_OP = 'DELETE' THEN
-    v_action := v_resource_type || '_deleted';
-    v_company_id := OLD.company_id;
-    v_resource_id := OLD.id;
-    v_details := jsonb_build_object('old_values', v_old_row);
-    v_severity := 'critical';
-  END IF;
 
-  v_user_id := COALESCE(
-    NULLIF(v_new_row ->> 'created_by', '')::uuid,
-    NULLIF(v_old_row ->> 'created_by', '')::uuid,
-    auth.uid()
-  );
+def mb(size):
+    return f'{size / 1024 / 1024:,.1f} MB'
 
-  INSERT INTO public.audit_logs (
-    action,
-    severity,
-    company_id,
-    resource_type,
-    resource_id,
-    old_values,
-    new_values,
-    metadata,
-    status,
-    user_id
-  )
-  VALUES (
-    v_action,
-    v_severity,
-    v_company_id,
-    v_resource_type,
-    v_resource_id,
-    CASE WHEN v_details ? 'old_values' THEN v_details -> 'old_values' ELSE NULL END,
-    CASE WHEN v_details ? 'new_values' THEN v_details -> 'new_values' ELSE NULL END,
-    CASE WHEN v_details ? 'changed_fields' THEN v_details -> 'changed_fields' ELSE NULL END,
-    v_status,
-    v_user_id
-  );
 
-  IF TG_OP = 'DELETE' THEN
-    RETURN OLD;
-  END IF;
+conn = connect()
+conn.autocommit = True
+cur = conn.cursor()
 
-  RETURN NEW;
-END;
-$$;
+cur.execute("SELECT count(*), pg_total_relation_size('public.audit_logs') FROM audit_logs")
+total_rows, table_bytes = cur.fetchone()
+cur.execute(SIZE_QUERY)
+update_rows, full_bytes, reduced_bytes = cur.fetchone()
 
-COMMENT ON FUNCTION public.financial_audit_trigger_fn() IS
-'Audits financial table changes without assuming every attached table has payment_status.';
-""")
+print('=== AUDIT_LOGS SIZE ===')
+print(f'  Rows: {total_rows:,}  total relation size: {mb(table_bytes)}')
+print(f'  Routine update rows: {update_rows:,}')
+print(f'  old/new values stored today:      {mb(full_bytes)}')
+print(f'  old/new values, changed-fields:   {mb(reduced_bytes)}')
+if full_bytes:
+    saved = full_bytes - reduced_bytes
+    print(f'  Saving on routine updates:        {mb(saved)} ({saved / full_bytes:.0%})')
+    if update_rows:
+        print(f'  Per update row: {full_bytes / update_rows:,.0f} B -> {reduced_bytes / update_rows:,.0f} B')
 
-print('Fixed financial_audit_trigger_fn - uses JSONB instead of direct column references')
+conn.autocommit = False
+cur.execute(MIGRATION.read_text(encoding='utf-8'))
+conn.commit()
+print(f'\nInstalled financial_audit_trigger_fn from {MIGRATION.name}')
+print("  Invoice and journal-entry UPDATEs now store primary key + changed fields; payments keep full images")
+print("  Set app.financial_audit_mode = 'full' to keep full images everywhere")
 
 cur.close()
 conn.close()
@@ -3,9 +3,15 @@
 Also creates closing entry for Revenue -> Equity.
 """
 import json, uuid, time, sys
+from collections import Counter
 import requests
 from dotenv import dotenv_values
-from collections import defaultdict
+from balance_maintainer import sync as sync_balances
+from db_connection import connect, get_company_id
+from invoice_posting import post_invoices, unlinked_invoice_pages
+from ledger_engine import Ledger
+from money import format_minor, to_major, to_minor
+from trial_balance import compute_trial_balance
 
 vals = dotenv_values('.env')
 BASE_URL = vals.get('VITE_SUPABASE_URL', '').strip()
@@ -16,7 +22,7 @@ HEADERS = {
     'Content-Type': 'application/json',
     'Prefer': 'return=representation'
 }
-CID = '24bc0b21-4e2d-4413-9842-31719a3669f4'
+CID = get_company_id()
 PAGE_SIZE = 1000
 BATCH_SIZE = 25  # Insert in batches of 25
 
@@ -71,16 +77,6 @@ def batch_patch(table, ids, data, id_col='id'):
         requests.patch(url, data=body, headers=HEADERS)
 
 
-def rpc(name, payload=None):
-    url = f'{BASE_URL}/rpc/{name}'
-    body = json.dumps(payload or {}).encode('utf-8')
-    r = requests.post(url, data=body, headers=HEADERS)
-    if r.status_code == 200:
-        result = r.text
-        return json.loads(result) if result else None
-    return f"Error {r.status_code}: {r.text[:200]}"
-
-
 # ============================================================
 # Step 1: Get account mappings
 # ============================================================
@@ -128,103 +124,19 @@ print(f"  Cash: {cash_account[:8] if cash_account else 'NOT FOUND'}...")
 print(f"  Equity: {equity_account[:8] if equity_account else 'NOT FOUND'}...")
 
 # ============================================================
-# Step 2: Link unlinked invoices using batch inserts
+# Step 2: Create, post and link JEs for unlinked invoices (server-side, set-based)
 # ============================================================
 print("\n=== Step 2: Link unlinked invoices ===")
-invoices = rest_get_all('invoices',
-    'id,invoice_number,total_amount,invoice_date,journal_entry_id',
-    f'company_id=eq.{CID}&limit=5000')
-unlinked_inv = [i for i in invoices if not i.get('journal_entry_id') and float(i.get('total_amount') or 0) > 0]
-print(f"  {len(unlinked_inv)} non-zero invoices without JE link")
-
-total_inv_linked = 0
-batch_count = 0
-
-for i in range(0, len(unlinked_inv), BATCH_SIZE):
-    batch = unlinked_inv[i:i + BATCH_SIZE]
-    batch_count += 1
-
-    # Create JEs for this batch
-    je_rows = []
-    inv_to_je = {}
-    for inv in batch:
-        amt = float(inv['total_amount'])
-        if amt <= 0:
-            continue
-        je_num = f"JE-INV-{uuid.uuid4().hex[:12]}"
-        je_rows.append({
-            'company_id': CID,
-            'entry_number': je_num,
-            'entry_date': inv.get('invoice_date') or '2026-07-01',
-            'description': f'Auto-linked invoice {inv.get("invoice_number", "?")}',
-            'status': 'draft',
-            'total_debit': amt,
-            'total_credit': amt,
-            'reference_type': 'invoice',
-            'reference_id': inv['id'],
-        })
-
-    # Batch insert JEs
-    je_res = batch_insert('journal_entries', je_rows)
-    if not je_res:
-        print(f"  Batch {batch_count}: JE insert failed, skipping")
-        continue
-
-    # Map JE IDs to invoice IDs
-    for j, je in enumerate(je_res):
-        if j < len(batch):
-            inv_to_je[batch[j]['id']] = je['id']
-
-    # Create lines for all JEs in this batch
-    line_rows = []
-    for inv in batch:
-        amt = float(inv['total_amount'])
-        if amt <= 0:
-            continue
-        je_id = inv_to_je.get(inv['id'])
-        if not je_id:
-            continue
-        line_rows.append({
-            'journal_entry_id': je_id,
-            'account_id': ar_account,
-            'debit_amount': amt,
-            'credit_amount': 0,
-            'line_number': 1,
-            'line_description': f'AR - Invoice {inv.get("invoice_number", "?")}',
-        })
-        line_rows.append({
-            'journal_entry_id': je_id,
-            'account_id': rev_account,
-            'debit_amount': 0,
-            'credit_amount': amt,
-            'line_number': 2,
-            'line_description': f'Revenue - Invoice {inv.get("invoice_number", "?")}',
-        })
-
-    # Batch insert lines
-    line_res = batch_insert('journal_entry_lines', line_rows)
-    if not line_res:
-        print(f"  Batch {batch_count}: Line insert failed")
-        continue
-
-    # Post all JEs in this batch
-    je_ids = list(inv_to_je.values())
-    for je_id in je_ids:
-        url = f'{BASE_URL}/rest/v1/journal_entries?id=eq.{je_id}'
-        body = json.dumps({'status': 'posted', 'posted_at': '2026-07-01T12:00:00Z'}).encode('utf-8')
-        requests.patch(url, data=body, headers=HEADERS)
-
-    # Link invoices to JEs
-    for inv_id, je_id in inv_to_je.items():
-        url = f'{BASE_URL}/rest/v1/invoices?id=eq.{inv_id}'
-        body = json.dumps({'journal_entry_id': je_id}).encode('utf-8')
-        requests.patch(url, data=body, headers=HEADERS)
-
-    total_inv_linked += len(inv_to_je)
-    if batch_count % 10 == 0:
-        print(f"  Processed {batch_count} batches ({total_inv_linked} invoices linked)")
-
-print(f"  ✅ Linked {total_inv_linked} invoices to new JEs")
+inv_conn = connect(connect_timeout=10)
+try:
+    inv_outcomes = Counter()
+    for rows in post_invoices(inv_conn, unlinked_invoice_pages(inv_conn, CID)):
+        inv_outcomes.update(outcome for _, _, outcome in rows)
+finally:
+    inv_conn.close()
+total_inv_linked = inv_outcomes['posted'] + inv_outcomes['linked_existing']
+print(f"  Outcomes: {dict(inv_outcomes)}")
+print(f"  ✅ Linked {total_inv_linked} invoices to JEs")
 
 # ============================================================
 # Step 3: Link any remaining unlinked completed payments
@@ -310,8 +222,8 @@ print(f"  ✅ Linked {total_pay_linked} payments to new JEs")
 # Step 4: Update account balances
 # ============================================================
 print("\n=== Step 4: Update account balances ===")
-rpc_result = rpc('update_account_balances_from_entries')
-print(f"  RPC result: {rpc_result or 'OK'}")
+sync_result = sync_balances()
+print(f"  Incremental sync: {sync_result}")
 
 # ============================================================
 # Step 5: Create closing entry (Revenue -> Equity)
@@ -319,14 +231,15 @@ print(f"  RPC result: {rpc_result or 'OK'}")
 print("\n=== Step 5: Create closing entry ===")
 coa = rest_get_all('chart_of_accounts', 'id,account_type,current_balance,account_code,account_name',
                    f'company_id=eq.{CID}&limit=500')
-total_revenue = sum(float(a.get('current_balance') or 0) for a in coa if a['account_type'] == 'revenue')
-total_expenses = sum(float(a.get('current_balance') or 0) for a in coa if a['account_type'] == 'expenses')
+# Minor units (dirhams): exact sums, exact zero test
+total_revenue = sum(to_minor(a.get('current_balance')) for a in coa if a['account_type'] == 'revenue')
+total_expenses = sum(to_minor(a.get('current_balance')) for a in coa if a['account_type'] == 'expenses')
 net_income = total_revenue - total_expenses
-print(f"  Total Revenue:  {total_revenue:,.2f}")
-print(f"  Total Expenses: {total_expenses:,.2f}")
-print(f"  Net Income:     {net_income:,.2f}")
+print(f"  Total Revenue:  {format_minor(total_revenue)}")
+print(f"  Total Expenses: {format_minor(total_expenses)}")
+print(f"  Net Income:     {format_minor(net_income)}")
 
-if abs(net_income) > 0.01:
+if net_income:
     existing_closing = rest_get_all('journal_entries', 'id,entry_number',
         f'company_id=eq.{CID}&entry_number=like.JE-CLOSE-*&limit=10')
     if existing_closing:
@@ -339,8 +252,8 @@ if abs(net_income) > 0.01:
             'entry_date': '2026-07-01',
             'description': 'Closing entry: Transfer net income to Retained Earnings',
             'status': 'draft',
-            'total_debit': net_income,
-            'total_credit': net_income,
+            'total_debit': str(to_major(net_income)),
+            'total_credit': str(to_major(net_income)),
             'reference_type': 'closing',
         }
         je_res = batch_insert('journal_entries', [je_data])
@@ -350,12 +263,12 @@ if abs(net_income) > 0.01:
             line_num = 1
             for a in coa:
                 if a['account_type'] == 'revenue':
-                    bal = float(a.get('current_balance') or 0)
-                    if abs(bal) > 0.01:
+                    bal = to_minor(a.get('current_balance'))
+                    if bal:
                         lines.append({
                             'journal_entry_id': je_id,
                             'account_id': a['id'],
-                            'debit_amount': bal,
+                            'debit_amount': str(to_major(bal)),
                             'credit_amount': 0,
                             'line_number': line_num,
                             'line_description': f'Closing revenue account {a.get("account_code", "")}',
@@ -366,7 +279,7 @@ if abs(net_income) > 0.01:
                     'journal_entry_id': je_id,
                     'account_id': equity_account,
                     'debit_amount': 0,
-                    'credit_amount': net_income,
+                    'credit_amount': str(to_major(net_income)),
                     'line_number': line_num,
                     'line_description': 'Retained earnings - net income closing',
                 })
@@ -375,26 +288,30 @@ if abs(net_income) > 0.01:
                 url = f'{BASE_URL}/rest/v1/journal_entries?id=eq.{je_id}'
                 body = json.dumps({'status': 'posted', 'posted_at': '2026-07-01T12:00:00Z'}).encode('utf-8')
                 requests.patch(url, data=body, headers=HEADERS)
-                print(f"  ✅ Closing entry created: {je_num} ({len(lines)} lines, {net_income:,.2f} QAR)")
+                print(f"  ✅ Closing entry created: {je_num} ({len(lines)} lines, {format_minor(net_income)} QAR)")
             else:
                 print(f"  ⚠️ Failed to insert closing entry lines")
         else:
             print(f"  ⚠️ Failed to create closing entry")
 
-# Re-update balances
-rpc_result = rpc('update_account_balances_from_entries')
-print(f"  Balance update: {rpc_result or 'OK'}")
+# Apply the closing entry to the balances; verify against a full recompute once
+sync_result = sync_balances(verify=True)
+print(f"  Balance update: {sync_result}")
 
 # ============================================================
 # FINAL VERIFICATION
 # ============================================================
 print("\n=== FINAL VERIFICATION ===")
-coa2 = rest_get_all('chart_of_accounts', 'account_type,current_balance',
+# Trial balance straight from the posted lines, independent of current_balance
+coa2 = rest_get_all('chart_of_accounts',
+                    'id,company_id,account_code,account_name,account_type,balance_type,parent_account_id,is_header',
                     f'company_id=eq.{CID}&limit=500')
-tb = {}
-for a in coa2:
-    at = a.get('account_type', '?')
-    tb[at] = tb.get(at, 0) + float(a.get('current_balance') or 0)
+entries = rest_get_all('journal_entries', 'id,company_id,entry_date,status,total_debit,total_credit,entry_number',
+    f'company_id=eq.{CID}&limit=5000')
+lines = rest_get_all('journal_entry_lines', 'journal_entry_id,account_id,debit_amount,credit_amount',
+    f'limit=10000')
+ledger = Ledger.from_records(entries, lines, coa2)
+tb = compute_trial_balance(ledger, company_id=CID).equation()
 
 ta = tb.get('assets', 0)
 tl = tb.get('liabilities', 0)
@@ -408,31 +325,16 @@ print(f"  Revenue:     {tr:>15,.2f}")
 print(f"  Expenses:    {tex:>15,.2f}")
 print(f"  A = {ta:,.2f}")
 print(f"  L+E = {tl+te:,.2f}")
-diff = abs(ta - (tl + te))
+diff = abs(tb['difference'])
 print(f"  Diff: {diff:,.2f}")
-print(f"  {'PASS: A=L+E' if diff < 0.01 else f'FAIL: off by {diff:,.2f}'}")
+print(f"  {'PASS: A=L+E' if not diff else f'FAIL: off by {diff:,.2f}'}")
 
 # Re-check all 5 original issues
 print("\n=== Original 5 Issues Check ===")
-entries = rest_get_all('journal_entries', 'id,status,total_debit,total_credit,entry_number',
-    f'company_id=eq.{CID}&limit=5000')
-lines = rest_get_all('journal_entry_lines', 'journal_entry_id,debit_amount,credit_amount',
-    f'limit=10000')
-linked_ids = set(l['journal_entry_id'] for l in lines)
-
-empty = [e for e in entries if e['id'] not in linked_ids]
-print(f"  1. Empty entries: {len(empty)}")
-
-entry_totals = defaultdict(lambda: {'debit': 0, 'credit': 0})
-for l in lines:
-    eid = l['journal_entry_id']
-    entry_totals[eid]['debit'] += float(l.get('debit_amount') or 0)
-    entry_totals[eid]['credit'] += float(l.get('credit_amount') or 0)
-zero_ids = [eid for eid, t in entry_totals.items() if t['debit'] == 0 and t['credit'] == 0]
-print(f"  2. Zero-amount entries: {len(zero_ids)}")
+print(f"  1. Empty entries: {len(ledger.entries_without_lines())}")
+print(f"  2. Zero-amount entries: {len(ledger.zero_amount_entries())}")
 
-drafts = [e for e in entries if e.get('status') == 'draft']
-print(f"  3. Draft entries: {len(drafts)}")
+print(f"  3. Draft entries: {ledger.status_counts().get('draft', 0)}")
 
 pay2 = rest_get_all('payments', 'id,journal_entry_id,payment_status',
     f'company_id=eq.{CID}&limit=5000')
@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 """Fix remaining migration issues."""
-import psycopg2
-from db_connection import get_database_url
+from db_connection import connect, get_database_url
 
 DB_URL = get_database_url()
 
 def main():
-    conn = psycopg2.connect(DB_URL)
+    conn = connect(DB_URL)
     conn.autocommit = True
     cur = conn.cursor()
 
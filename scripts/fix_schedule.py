@@ -9,18 +9,17 @@ Problems fixed:
   - Missing 24th invoice for 2027-08 scheduled
   - Invoice linking corrected
 """
-import psycopg2
 from datetime import datetime, timedelta
-from db_connection import get_database_url
+from db_connection import connect, get_company_id, get_database_url
 
 DB_URL = get_database_url()
 
 def main():
-    conn = psycopg2.connect(DB_URL)
+    conn = connect(DB_URL)
     conn.autocommit = False
     cur = conn.cursor()
 
-    company_id = '24bc0b21-4e2d-4413-9842-31719a3669f4'
+    company_id = get_company_id()
     contract_id = '86bb0de4-11ef-4179-b928-10bb22c80bdb'
     contract_end = datetime(2027, 8, 1)
 
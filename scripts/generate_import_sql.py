@@ -6,6 +6,10 @@ to contracts table in Al-Arraf company
 
 import re
 
+from db_connection import get_company_id
+
+COMPANY_ID = get_company_id()
+
 # Read the agreements_with_details.sql file
 with open('.qoder/agreements_with_details.sql', 'r', encoding='utf-8') as f:
     content = f.read()
@@ -25,7 +29,7 @@ print()
 
 print("DO $$")
 print("DECLARE")
-print("  v_company_id UUID := '24bc0b21-4e2d-4413-9842-31719a3669f4';")
+print(f"  v_company_id UUID := '{COMPANY_ID}';")
 print("  v_updated INTEGER := 0;")
 print("  v_total_updated INTEGER := 0;")
 print("BEGIN")
@@ -89,7 +93,7 @@ print("SELECT ")
 print("  '✅ Contracts with vehicle data after import' as status,")
 print("  COUNT(*) as total")
 print("FROM contracts")
-print("WHERE company_id = '24bc0b21-4e2d-4413-9842-31719a3669f4'")
+print(f"WHERE company_id = '{COMPANY_ID}'")
 print("  AND license_plate IS NOT NULL")
 print("  AND TRIM(license_plate) != '';")
 
@@ -103,7 +107,7 @@ print("  make,")
 print("  model,")
 print("  year")
 print("FROM contracts")
-print("WHERE company_id = '24bc0b21-4e2d-4413-9842-31719a3669f4'")
+print(f"WHERE company_id = '{COMPANY_ID}'")
 print("  AND license_plate IS NOT NULL")
 print("ORDER BY created_at DESC")
 print("LIMIT 10;")
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""Per-account general-ledger index for account statements and drill-down.
+
+Posted lines are kept sorted by (account, entry date), with an offsets array
+per account and a running cumulative sum of debit - credit, so for one account:
+
+  slice of a date range          two binary searches, O(log n)
+  opening / running balance      a difference of two cumulative sums, O(1) per line
+  statement of k lines           O(log n + k)
+  top-N counterpart accounts     O(log n + k * lines per entry), via a second
+                                 offsets array of rows per entry
+
+The index is built once from a ledger snapshot and stored in .cache/gl-index.npz.
+`refresh` then reloads only the entries touched since the last build or refresh
+(entry or line updated_at, like balance_maintainer.py), drops their old rows
+and merges their current posted lines; the arrays are kept sorted, so the merge
+is a near-linear stable sort of two sorted runs. Deleted entries are only
+dropped by a rebuild.
+
+Usage:
+    python scripts/gl_index.py build [--company-id <uuid>]
+    python scripts/gl_index.py refresh
+    python scripts/gl_index.py statement 11211 --start 2025-01-01 --end 2025-01-31
+    python scripts/gl_index.py counterparts 11211 --start 2025-01-01 --top 10
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from balance_maintainer import OVERLAP
+from db_connection import connect, get_company_id
+from ledger_engine import ACCOUNT_COLUMNS, Ledger, load_ledger
+from money import format_minor, group_sum, minor_array, to_major
+from trial_balance import POSTED, balance_sign, natural_sign
+
+
+DEFAULT_PATH = Path(__file__).resolve().parents[1] / ".cache" / "gl-index.npz"
+DAY_OFFSET = 2**31  # keeps (account, day) sort keys non-negative for dates before 1970
+
+CHANGED_ENTRIES = f"""
+    SELECT je.id FROM journal_entries je
+    WHERE je.updated_at > %(since)s::timestamptz - interval '{OVERLAP}' {{company_filter}}
+    UNION
+    SELECT jel.journal_entry_id
+    FROM journal_entry_lines jel
+    JOIN journal_entries je ON je.id = jel.journal_entry_id
+    WHERE jel.updated_at > %(since)s::timestamptz - interval '{OVERLAP}' {{company_filter}}
+"""
+
+POSTED_LINES = """
+    SELECT jel.id, jel.journal_entry_id, je.entry_number, je.entry_date, jel.account_id,
+           jel.line_number, COALESCE(jel.line_description, je.description),
+           jel.debit_amount, jel.credit_amount
+    FROM journal_entry_lines jel
+    JOIN journal_entries je ON je.id = jel.journal_entry_id
+    WHERE je.id = ANY(%(entries)s::uuid[])
+      AND lower(je.status) = 'posted'
+      AND je.entry_date IS NOT NULL
+"""
+
+
+def index_path() -> Path:
+    return Path(os.environ.get("FLEETIFY_GL_INDEX_PATH") or DEFAULT_PATH)
+
+
+def _text(values) -> np.ndarray:
+    """Unicode array (None as ''), which np.savez stores without pickling."""
+    return np.array(["" if value is None else str(value) for value in values], dtype=str)
+
+
+class GLIndex:
+    """Posted lines sorted by (account, date) with per-account and per-entry offsets."""
+
+    def __init__(self, arrays: dict, meta: dict):
+        self.scale = int(meta["scale"])
+        self.watermark = meta.get("watermark") or None
+        self.company_ids = [c for c in str(meta.get("company_ids") or "").split(",") if c] or None
+
+        self.account_ids = list(arrays["account_ids"])
+        self.account_index = {account_id: i for i, account_id in enumerate(self.account_ids)}
+        self.account_company = arrays["account_company"]
+        self.account_code = arrays["account_code"]
+        self.account_name = arrays["account_name"]
+        self.account_sign = arrays["account_sign"].astype(np.int64)
+
+        self.entry_ids = list(arrays["entry_ids"])
+        self.entry_index = {entry_id: i for i, entry_id in enumerate(self.entry_ids)}
+        self.entry_number = arrays["entry_number"]
+
+        self.row_account = arrays["row_account"]
+        self.row_day = arrays["row_day"]
+        self.row_entry = arrays["row_entry"]
+        self.row_line_id = arrays["row_line_id"]
+        self.row_line_number = arrays["row_line_number"]
+        self.row_description = arrays["row_description"]
+        self.row_debit = arrays["row_debit"]
+        self.row_credit = arrays["row_credit"]
+        self._reindex()
+
+    # ------------------------------------------------------------------
+    # Construction and persistence
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_ledger(cls, ledger: Ledger, *, statuses=POSTED, watermark=None, company_ids=None) -> "GLIndex":
+        mask = ledger.line_mask(statuses=statuses) & (ledger.line_account >= 0)
+        if ledger.n_entries:
+            mask &= ~np.isnat(ledger.entry_date[np.maximum(ledger.line_entry, 0)])
+        lines = np.flatnonzero(mask)
+        entry = ledger.line_entry[lines]
+        descriptions = [
+            line_description or entry_description
+            for line_description, entry_description in zip(
+                ledger.line_description[lines], ledger.entry_description[entry]
+            )
+        ]
+        arrays = {
+            "account_ids": _text(ledger.account_ids),
+            "account_company": _text(str(ledger.companies[c]) for c in ledger.account_company),
+            "account_code": _text(ledger.account_code),
+            "account_name": _text(ledger.account_name),
+            "account_sign": natural_sign(ledger).astype(np.int8),
+            "entry_ids": _text(ledger.entry_ids),
+            "entry_number": _text(ledger.entry_number),
+            "row_account": ledger.line_account[lines],
+            "row_day": ledger.entry_date[entry].astype(np.int64).astype(np.int32),
+            "row_entry": entry,
+            "row_line_id": _text(ledger.line_ids[lines]),
+            "row_line_number": ledger.line_number[lines],
+            "row_description": _text(descriptions),
+            "row_debit": ledger.line_debit[lines],
+            "row_credit": ledger.line_credit[lines],
+        }
+        meta = {"scale": ledger.scale, "watermark": watermark, "company_ids": ",".join(company_ids or ())}
+        return cls(arrays, meta)
+
+    @classmethod
+    def build(cls, company_ids: list[str] | None = None) -> "GLIndex":
+        """Index a fresh snapshot; the watermark is taken before loading so nothing is missed."""
+        connection = connect(connect_timeout=10)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT now()")
+                watermark = cursor.fetchone()[0]
+        finally:
+            connection.close()
+        return cls.from_ledger(load_ledger(company_ids), watermark=str(watermark), company_ids=company_ids)
+
+    def save(self, path: Path | None = None) -> Path:
+        path = path or index_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = path.with_suffix(".tmp.npz")
+        np.savez(
+            staging,
+            account_ids=_text(self.account_ids),
+            account_company=self.account_company,
+            account_code=self.account_code,
+            account_name=self.account_name,
+            account_sign=self.account_sign.astype(np.int8),
+            entry_ids=_text(self.entry_ids),
+            entry_number=self.entry_number,
+            row_account=self.row_account,
+            row_day=self.row_day,
+            row_entry=self.row_entry,
+            row_line_id=self.row_line_id,
+            row_line_number=self.row_line_number,
+            row_description=self.row_description,
+            row_debit=self.row_debit,
+            row_credit=self.row_credit,
+            meta_scale=np.array(self.scale),
+            meta_watermark=np.array(self.watermark or ""),
+            meta_company_ids=np.array(",".join(self.company_ids or ())),
+        )
+        os.replace(staging, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "GLIndex":
+        with np.load(path or index_path()) as stored:
+            arrays = {name: stored[name] for name in stored.files if not name.startswith("meta_")}
+            meta = {name[5:]: stored[name].item() for name in stored.files if name.startswith("meta_")}
+        return cls(arrays, meta)
+
+    # ------------------------------------------------------------------
+    # Sorting and offsets
+    # ------------------------------------------------------------------
+    def _reindex(self) -> None:
+        # Rows arrive as sorted runs (existing rows, then new ones), which the
+        # stable sort merges in near-linear time.
+        key = (self.row_account.astype(np.int64) << 32) | (self.row_day.astype(np.int64) + DAY_OFFSET)
+        order = np.argsort(key, kind="stable")
+        for name in (
+            "row_account", "row_day", "row_entry", "row_line_id", "row_line_number",
+            "row_description", "row_debit", "row_credit",
+        ):
+            setattr(self, name, getattr(self, name)[order])
+        n_accounts = len(self.account_ids)
+        self.offsets = np.searchsorted(self.row_account, np.arange(n_accounts + 1))
+        self.cumulative = np.concatenate(([0], np.cumsum(self.row_debit - self.row_credit))).astype(np.int64)
+        self.entry_order = np.argsort(self.row_entry, kind="stable")
+        self.entry_offsets = np.searchsorted(self.row_entry[self.entry_order], np.arange(len(self.entry_ids) + 1))
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.row_account)
+
+    # ------------------------------------------------------------------
+    # Incremental maintenance
+    # ------------------------------------------------------------------
+    def add_accounts(self, rows: list[tuple]) -> None:
+        """Register accounts (ACCOUNT_COLUMNS rows) created since the index was built."""
+        fields = [dict(zip(ACCOUNT_COLUMNS, row)) for row in rows if str(row[0]) not in self.account_index]
+        if not fields:
+            return
+        for account in fields:
+            self.account_index[str(account["id"])] = len(self.account_ids)
+            self.account_ids.append(str(account["id"]))
+        self.account_company = np.concatenate((self.account_company, _text(a["company_id"] for a in fields)))
+        self.account_code = np.concatenate((self.account_code, _text(a["account_code"] for a in fields)))
+        self.account_name = np.concatenate((self.account_name, _text(a["account_name"] for a in fields)))
+        self.account_sign = np.concatenate((
+            self.account_sign, np.array([balance_sign(a["balance_type"]) for a in fields], dtype=np.int64)
+        ))
+
+    def replace_entries(self, entry_ids: list[str], lines: list[tuple]) -> None:
+        """Drop every row of the given entries and merge their current posted lines (POSTED_LINES rows)."""
+        stale = [self.entry_index[e] for e in entry_ids if e in self.entry_index]
+        keep = ~np.isin(self.row_entry, stale)
+        for line in lines:
+            entry_id = str(line[1])
+            if entry_id not in self.entry_index:
+                self.entry_index[entry_id] = len(self.entry_ids)
+                self.entry_ids.append(entry_id)
+                self.entry_number = np.concatenate((self.entry_number, _text([line[2]])))
+        lines = [line for line in lines if str(line[4]) in self.account_index]
+        lines.sort(key=lambda line: (self.account_index[str(line[4])], line[3], line[2] or "", line[5] or 0))
+        new = {
+            "row_account": np.array([self.account_index[str(line[4])] for line in lines], dtype=np.int32),
+            "row_day": np.array([str(line[3])[:10] for line in lines], dtype="datetime64[D]").astype(np.int64).astype(np.int32),
+            "row_entry": np.array([self.entry_index[str(line[1])] for line in lines], dtype=np.int32),
+            "row_line_id": _text(line[0] for line in lines),
+            "row_line_number": np.array([line[5] or 0 for line in lines], dtype=np.int32),
+            "row_description": _text(line[6] for line in lines),
+            "row_debit": minor_array([line[7] for line in lines], self.scale),
+            "row_credit": minor_array([line[8] for line in lines], self.scale),
+        }
+        for name, values in new.items():
+            setattr(self, name, np.concatenate((getattr(self, name)[keep], values)))
+        self._reindex()
+
+    def refresh(self, connection=None) -> dict:
+        """Re-read the entries touched since the watermark and merge them."""
+        own_connection = connection is None
+        connection = connection or connect(connect_timeout=10)
+        started = time.perf_counter()
+        company_filter = "AND je.company_id = ANY(%(companies)s::uuid[])" if self.company_ids else ""
+        params = {"since": self.watermark, "companies": self.company_ids}
+        try:
+            connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT now()")
+                watermark = cursor.fetchone()[0]
+                cursor.execute(CHANGED_ENTRIES.format(company_filter=company_filter), params)
+                changed = [str(row[0]) for row in cursor.fetchall()]
+                cursor.execute(POSTED_LINES, {"entries": changed})
+                lines = cursor.fetchall()
+                unknown = sorted({str(line[4]) for line in lines} - self.account_index.keys())
+                if unknown:
+                    cursor.execute(
+                        f"SELECT {', '.join(ACCOUNT_COLUMNS)} FROM chart_of_accounts WHERE id = ANY(%s::uuid[])",
+                        (unknown,),
+                    )
+                    self.add_accounts(cursor.fetchall())
+        finally:
+            connection.rollback()
+            if own_connection:
+                connection.close()
+        self.replace_entries(changed, lines)
+        self.watermark = str(watermark)
+        return {"changed_entries": len(changed), "lines": len(lines), "seconds": round(time.perf_counter() - started, 3)}
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def account_of(self, reference: str, company_id: str | None = None) -> int:
+        """Account index of an account id, or of an account code within a company."""
+        if reference in self.account_index:
+            return self.account_index[reference]
+        matches = np.flatnonzero(
+            (self.account_code == reference) & ((self.account_company == company_id) if company_id else True)
+        )
+        if len(matches) != 1:
+            raise LookupError(f"{len(matches)} accounts match {reference!r}" + (f" in {company_id}" if company_id else ""))
+        return int(matches[0])
+
+    def span(self, account: int, start=None, end=None) -> tuple[int, int]:
+        """Row positions [lo, hi) of an account's lines dated start..end, by binary search."""
+        first, last = int(self.offsets[account]), int(self.offsets[account + 1])
+        days = self.row_day[first:last]
+        lo = first if start is None else first + int(np.searchsorted(days, _day(start), side="left"))
+        hi = last if end is None else first + int(np.searchsorted(days, _day(end), side="right"))
+        return lo, max(lo, hi)
+
+    def balance_at(self, account: int, position: int) -> int:
+        """Natural-sign balance of the account's rows before `position`, in minor units."""
+        return int(self.account_sign[account] * (self.cumulative[position] - self.cumulative[self.offsets[account]]))
+
+    def statement(self, account: int, start=None, end=None) -> dict:
+        lo, hi = self.span(account, start, end)
+        sign = self.account_sign[account]
+        base = self.cumulative[self.offsets[account]]
+        running = sign * (self.cumulative[lo + 1:hi + 1] - base)
+        rows = [
+            {
+                "date": str(np.datetime64(int(self.row_day[i]), "D")),
+                "entry_number": str(self.entry_number[self.row_entry[i]]),
+                "line_number": int(self.row_line_number[i]),
+                "description": str(self.row_description[i]),
+                "debit": int(self.row_debit[i]),
+                "credit": int(self.row_credit[i]),
+                "balance": int(balance),
+            }
+            for i, balance in zip(range(lo, hi), running.tolist())
+        ]
+        return {
+            "account_id": self.account_ids[account],
+            "account_code": str(self.account_code[account]),
+            "account_name": str(self.account_name[account]),
+            "opening": self.balance_at(account, lo),
+            "debit": int(self.row_debit[lo:hi].sum()),
+            "credit": int(self.row_credit[lo:hi].sum()),
+            "closing": self.balance_at(account, hi),
+            "rows": rows,
+        }
+
+    def counterparts(self, account: int, start=None, end=None, top: int = 10) -> list[dict]:
+        """Accounts on the other side of the account's entries in the range, by amount."""
+        lo, hi = self.span(account, start, end)
+        entries = np.unique(self.row_entry[lo:hi])
+        if not len(entries):
+            return []
+        starts, stops = self.entry_offsets[entries], self.entry_offsets[entries + 1]
+        lengths = stops - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        rows = self.entry_order[positions]
+        rows = rows[self.row_account[rows] != account]
+        other, group = np.unique(self.row_account[rows], return_inverse=True)
+        counts = np.bincount(group, minlength=len(other))
+        debit = group_sum(group, self.row_debit[rows], len(other))
+        credit = group_sum(group, self.row_credit[rows], len(other))
+        best = np.argsort(-(debit + credit), kind="stable")[:top]
+        return [
+            {
+                "account_id": self.account_ids[other[k]],
+                "account_code": str(self.account_code[other[k]]),
+                "account_name": str(self.account_name[other[k]]),
+                "lines": int(counts[k]),
+                "debit": int(debit[k]),
+                "credit": int(credit[k]),
+            }
+            for k in best.tolist()
+        ]
+
+    def fmt(self, minor: int) -> str:
+        return format_minor(minor, self.scale)
+
+
+def _day(value) -> int:
+    return int(np.datetime64(str(value)[:10], "D").astype(np.int64))
+
+
+def print_statement(index: GLIndex, statement: dict, out) -> None:
+    fmt = index.fmt
+    print(f"{statement['account_code']} {statement['account_name']}", file=out)
+    print(f"{'Date':<11} {'Entry':<22} {'Description':<40} {'Debit':>15} {'Credit':>15} {'Balance':>15}", file=out)
+    print(f"{'':<11} {'Opening balance':<63} {'':>15} {'':>15} {fmt(statement['opening']):>15}", file=out)
+    for row in statement["rows"]:
+        print(
+            f"{row['date']:<11} {str(row['entry_number'])[:22]:<22} {str(row['description'])[:40]:<40} "
+            f"{fmt(row['debit']):>15} {fmt(row['credit']):>15} {fmt(row['balance']):>15}",
+            file=out,
+        )
+    print(
+        f"{'':<11} {'Closing balance':<63} {fmt(statement['debit']):>15} {fmt(statement['credit']):>15} "
+        f"{fmt(statement['closing']):>15}",
+        file=out,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", type=Path, help=f"Index file (default {DEFAULT_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index a fresh ledger snapshot")
+    build.add_argument("--company-id", action="append", help="Company to index (repeatable; default every company)")
+    commands.add_parser("refresh", help="Merge the entries changed since the last build or refresh")
+    commands.add_parser("info", help="Show the size and watermark of the index")
+    for name in ("statement", "counterparts"):
+        command = commands.add_parser(name)
+        command.add_argument("account", help="Account id, or account code with --company-id")
+        command.add_argument("--company-id", help="Company of an account code (default FLEETIFY_COMPANY_ID)")
+        command.add_argument("--start", help="First entry date (YYYY-MM-DD)")
+        command.add_argument("--end", help="Last entry date (YYYY-MM-DD)")
+        command.add_argument("--refresh", action="store_true", help="Refresh the index first")
+    commands.choices["statement"].add_argument("--format", choices=("console", "csv"), default="console")
+    commands.choices["counterparts"].add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        index = GLIndex.build(args.company_id)
+        path = index.save(args.path)
+        print(f"Indexed {index.n_rows} lines on {len(index.account_ids)} accounts into {path} "
+              f"in {time.perf_counter() - started:.1f}s")
+        return
+
+    index = GLIndex.load(args.path)
+    if args.command == "refresh" or getattr(args, "refresh", False):
+        stats = index.refresh()
+        index.save(args.path)
+        if args.command == "refresh":
+            print(f"Merged {stats['lines']} lines of {stats['changed_entries']} changed entries in {stats['seconds']}s")
+            return
+
+    if args.command == "info":
+        print(f"lines: {index.n_rows}")
+        print(f"accounts: {len(index.account_ids)}")
+        print(f"entries: {len(index.entry_ids)}")
+        print(f"companies: {', '.join(index.company_ids) if index.company_ids else 'all'}")
+        print(f"watermark: {index.watermark}")
+        return
+
+    try:
+        account = index.account_of(args.account, args.company_id or (None if args.account in index.account_index else get_company_id()))
+    except LookupError as error:
+        parser.error(str(error))
+    if args.command == "statement":
+        statement = index.statement(account, args.start, args.end)
+        if args.format == "csv":
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(statement["rows"][0]) if statement["rows"] else ["date"])
+            writer.writeheader()
+            for row in statement["rows"]:
+                writer.writerow({
+                    **row, **{k: to_major(row[k], index.scale) for k in ("debit", "credit", "balance")}
+                })
+        else:
+            print_statement(index, statement, sys.stdout)
+    else:
+        print(f"{'Code':<12} {'Account':<40} {'Lines':>7} {'Debit':>15} {'Credit':>15}")
+        for row in index.counterparts(account, args.start, args.end, args.top):
+            print(f"{row['account_code']:<12} {row['account_name'][:40]:<40} {row['lines']:>7} "
+                  f"{index.fmt(row['debit']):>15} {index.fmt(row['credit']):>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Create, post and link journal entries for unlinked invoices through post_invoice_journal_entries.
+
+Invoice ids are read in keyset pages and sent to the server-side function
+(migration 20261019000003) in chunks of CHUNK_SIZE, one transaction per chunk.
+The function matches every created entry to its invoice by reference_id and
+reports one outcome per id, so skipped invoices (zero amount, missing account
+mappings, locked periods) never shift another invoice's link. An invoice with
+several existing reference journals comes back as ambiguous_existing and stays
+unlinked until someone picks the right journal.
+
+Usage:
+    python scripts/invoice_posting.py                      # FLEETIFY_COMPANY_ID
+    python scripts/invoice_posting.py --chunk-size 5000 --dry-run
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from collections.abc import Iterable, Iterator
+
+from db_connection import connect, get_company_id
+
+
+CHUNK_SIZE = 2000
+
+UNLINKED_PAGE = """
+    SELECT id
+    FROM invoices
+    WHERE company_id = %(company)s
+      AND journal_entry_id IS NULL
+      AND total_amount > 0
+      AND id > %(after)s
+    ORDER BY id
+    LIMIT %(limit)s
+"""
+
+
+def unlinked_invoice_pages(connection, company_id: str, page_size: int = CHUNK_SIZE) -> Iterator[list[str]]:
+    """Pages of ids of non-zero invoices without a journal entry, in id order."""
+    after = "00000000-0000-0000-0000-000000000000"
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(UNLINKED_PAGE, {"company": company_id, "after": after, "limit": page_size})
+            page = [str(row[0]) for row in cursor.fetchall()]
+        connection.commit()
+        if not page:
+            return
+        yield page
+        after = page[-1]
+
+
+def post_invoices(connection, pages: Iterable[list[str]]) -> Iterator[list[tuple]]:
+    """Send each page to the server and commit it; yields the (invoice, entry, outcome) rows per page."""
+    for page in pages:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT invoice_id, journal_entry_id, outcome FROM post_invoice_journal_entries(%s::jsonb)",
+                    (json.dumps(page),),
+                )
+                rows = cursor.fetchall()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        yield rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company to post (default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Invoices per server call")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the unlinked invoices")
+    args = parser.parse_args()
+
+    company_id = args.company_id or get_company_id()
+    connection = connect(connect_timeout=10)
+    started = time.perf_counter()
+    try:
+        pages = unlinked_invoice_pages(connection, company_id, args.chunk_size)
+        if args.dry_run:
+            print(f"{sum(len(page) for page in pages)} non-zero invoices without a journal entry")
+            return
+        outcomes = Counter()
+        for number, rows in enumerate(post_invoices(connection, pages), start=1):
+            outcomes.update(outcome for _, _, outcome in rows)
+            print(f"  chunk {number}: {len(rows)} invoices ({time.perf_counter() - started:.1f}s)")
+    finally:
+        connection.close()
+    print("Outcomes: " + (", ".join(f"{name}={count}" for name, count in outcomes.most_common()) or "nothing to post"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""In-memory double-entry ledger shared by the audit and repair scripts.
+
+journal_entries, journal_entry_lines and chart_of_accounts are loaded once and
+interned into NumPy arrays: every uuid becomes an integer index, so lines carry
+the index of their entry and account, entries carry their company and period.
+Totals, balances and rollups are then single bincount passes over the line
+arrays instead of per-script defaultdict loops over lists of dicts. Amounts are
+int64 minor units (see money.py), so balance checks compare exact integers.
+
+Load from the database:
+    ledger = load_ledger(company_ids=[get_company_id()])
+or from the JSON dumps written by fetch_all_paginated.py and friends:
+    ledger = Ledger.from_records(je, jel, coa)
+"""
+import json
+from collections.abc import Iterable
+from decimal import Decimal
+
+import numpy as np
+
+from money import format_minor, group_sum, minor_array, scale_of, to_major
+
+
+# In minor units: balanced means equal.
+TOLERANCE = 0
+NO_PERIOD = -1
+
+ENTRY_COLUMNS = (
+    "id", "company_id", "entry_number", "entry_date", "status", "total_debit", "total_credit",
+    "reference_type", "reference_id", "description",
+)
+LINE_COLUMNS = (
+    "id", "journal_entry_id", "account_id", "debit_amount", "credit_amount", "line_number", "line_description",
+)
+ACCOUNT_COLUMNS = (
+    "id", "company_id", "account_code", "account_name", "account_type", "parent_account_id",
+    "parent_account_code", "account_level", "is_header", "is_active", "balance_type", "current_balance",
+)
+
+
+def _dates(values: Iterable) -> np.ndarray:
+    return np.array([str(value)[:10] if value else None for value in values], dtype="datetime64[D]")
+
+
+def _codes(values: Iterable, vocabulary: list, index: dict) -> np.ndarray:
+    """Intern repeated strings (status, account type, ...) as small integer codes."""
+    codes = []
+    for value in values:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(vocabulary)
+            vocabulary.append(value)
+        codes.append(code)
+    return np.array(codes, dtype=np.int32)
+
+
+def period_of(dates: np.ndarray) -> np.ndarray:
+    """year * 12 + month - 1 for each date; NO_PERIOD where the date is missing."""
+    months = dates.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    return np.where(np.isnat(dates), NO_PERIOD, months).astype(np.int32)
+
+
+def period_label(period: int) -> str:
+    return "no-date" if period == NO_PERIOD else f"{period // 12:04d}-{period % 12 + 1:02d}"
+
+
+class Ledger:
+    """Columnar, interned snapshot of journal entries, their lines and the chart of accounts."""
+
+    def __init__(self, entries: dict, lines: dict, accounts: dict, scale: int = 2):
+        self.scale = scale
+        self.companies: list = []
+        self.company_index: dict = {}
+        self.statuses: list = []
+        self.account_types: list = []
+
+        # Accounts
+        self.account_ids = list(accounts["id"])
+        self.account_index = {account_id: i for i, account_id in enumerate(self.account_ids)}
+        self.account_company = _codes(accounts["company_id"], self.companies, self.company_index)
+        self.account_code = np.array(accounts["account_code"], dtype=object)
+        self.account_name = np.array(accounts["account_name"], dtype=object)
+        self.account_type = _codes(accounts["account_type"], self.account_types, {})
+        self.account_parent = np.array(
+            [self.account_index.get(parent, -1) for parent in accounts["parent_account_id"]], dtype=np.int32
+        )
+        self.account_parent_id = np.array(accounts["parent_account_id"], dtype=object)
+        self.account_parent_code = np.array(accounts["parent_account_code"], dtype=object)
+        self.account_level = np.array([level or 0 for level in accounts["account_level"]], dtype=np.int16)
+        self.account_is_header = np.array([bool(flag) for flag in accounts["is_header"]], dtype=bool)
+        self.account_is_active = np.array([flag is not False for flag in accounts["is_active"]], dtype=bool)
+        self.account_balance_type = np.array(accounts["balance_type"], dtype=object)
+        self.account_current_balance = minor_array(accounts["current_balance"], scale)
+
+        # Entries
+        self.entry_ids = list(entries["id"])
+        self.entry_index = {entry_id: i for i, entry_id in enumerate(self.entry_ids)}
+        self.entry_company = _codes(entries["company_id"], self.companies, self.company_index)
+        self.entry_number = np.array(entries["entry_number"], dtype=object)
+        self.entry_date = _dates(entries["entry_date"])
+        self.entry_period = period_of(self.entry_date)
+        self.entry_status = _codes(entries["status"], self.statuses, {})
+        self.entry_debit = minor_array(entries["total_debit"], scale)
+        self.entry_credit = minor_array(entries["total_credit"], scale)
+        self.entry_reference_type = np.array(entries["reference_type"], dtype=object)
+        self.entry_reference_id = np.array(entries["reference_id"], dtype=object)
+        self.entry_description = np.array(entries["description"], dtype=object)
+
+        # Lines: -1 marks an entry or account that is not in the snapshot.
+        self.line_ids = np.array(lines["id"], dtype=object)
+        self.line_entry_id = np.array(lines["journal_entry_id"], dtype=object)
+        self.line_account_id = np.array(lines["account_id"], dtype=object)
+        self.line_entry = np.array([self.entry_index.get(e, -1) for e in lines["journal_entry_id"]], dtype=np.int32)
+        self.line_account = np.array([self.account_index.get(a, -1) for a in lines["account_id"]], dtype=np.int32)
+        self.line_debit = minor_array(lines["debit_amount"], scale)
+        self.line_credit = minor_array(lines["credit_amount"], scale)
+        self.line_number = np.array([number or 0 for number in lines["line_number"]], dtype=np.int32)
+        self.line_description = np.array(lines["line_description"], dtype=object)
+
+        self._entry_totals = None
+        self._entry_offsets = None
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_records(
+        cls, entries: list[dict], lines: list[dict], accounts: list[dict] = (), scale: int = 2
+    ) -> "Ledger":
+        """Build from lists of REST/JSON dicts; missing columns become None."""
+        def columns(records, names):
+            return {name: [record.get(name) for record in records] for name in names}
+
+        return cls(
+            columns(entries, ENTRY_COLUMNS), columns(lines, LINE_COLUMNS), columns(accounts, ACCOUNT_COLUMNS), scale
+        )
+
+    @classmethod
+    def from_json_files(cls, entries_path, lines_path, accounts_path=None, scale: int = 2) -> "Ledger":
+        """Build from JSON dumps such as je_all.json / jel_all.json."""
+        def read(path):
+            if path is None:
+                return []
+            with open(path, encoding="utf-8") as handle:
+                return json.load(handle)
+
+        return cls.from_records(read(entries_path), read(lines_path), read(accounts_path), scale)
+
+    @classmethod
+    def from_rows(cls, entries: list[tuple], lines: list[tuple], accounts: list[tuple], scale: int = 2) -> "Ledger":
+        """Build from cursor rows selected in ENTRY/LINE/ACCOUNT_COLUMNS order."""
+        def columns(rows, names):
+            if not rows:
+                return {name: [] for name in names}
+            return dict(zip(names, (list(column) for column in zip(*rows))))
+
+        return cls(
+            columns(entries, ENTRY_COLUMNS), columns(lines, LINE_COLUMNS), columns(accounts, ACCOUNT_COLUMNS), scale
+        )
+
+    # ------------------------------------------------------------------
+    # Sizes and lookups
+    # ------------------------------------------------------------------
+    @property
+    def n_entries(self) -> int:
+        return len(self.entry_ids)
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_ids)
+
+    @property
+    def n_accounts(self) -> int:
+        return len(self.account_ids)
+
+    def status_code(self, status: str) -> int:
+        return self.statuses.index(status) if status in self.statuses else -1
+
+    def status_codes(self, statuses: Iterable[str]) -> list[int]:
+        """Codes of the given statuses, compared case-insensitively like the balance RPCs do."""
+        wanted = {status.lower() for status in statuses}
+        return [code for code, status in enumerate(self.statuses) if str(status or "").lower() in wanted]
+
+    def type_code(self, account_type: str) -> int:
+        return self.account_types.index(account_type) if account_type in self.account_types else -1
+
+    def company_code(self, company_id: str) -> int:
+        return self.company_index.get(company_id, -1)
+
+    def entry_status_name(self, entry: int) -> str:
+        return self.statuses[self.entry_status[entry]]
+
+    def major(self, minor) -> Decimal:
+        """Minor units back to an exact currency amount."""
+        return to_major(minor, self.scale)
+
+    def fmt(self, minor) -> str:
+        return format_minor(minor, self.scale)
+
+    def account_type_name(self, account: int) -> str:
+        return "UNKNOWN" if account < 0 else self.account_types[self.account_type[account]]
+
+    # ------------------------------------------------------------------
+    # Per-entry aggregates
+    # ------------------------------------------------------------------
+    def entry_totals(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(line debit, line credit, line count) per entry, in one pass over the lines."""
+        if self._entry_totals is None:
+            known = self.line_entry >= 0
+            entry = self.line_entry[known]
+            self._entry_totals = (
+                group_sum(entry, self.line_debit[known], self.n_entries),
+                group_sum(entry, self.line_credit[known], self.n_entries),
+                np.bincount(entry, minlength=self.n_entries),
+            )
+        return self._entry_totals
+
+    def lines_per_entry(self) -> np.ndarray:
+        return self.entry_totals()[2]
+
+    def unbalanced_entries(self, tolerance: int = TOLERANCE) -> np.ndarray:
+        """Entries whose lines do not balance."""
+        debit, credit, count = self.entry_totals()
+        return np.flatnonzero((count > 0) & (np.abs(debit - credit) > tolerance))
+
+    def header_unbalanced_entries(self, tolerance: int = TOLERANCE) -> np.ndarray:
+        return np.flatnonzero(np.abs(self.entry_debit - self.entry_credit) > tolerance)
+
+    def header_line_mismatches(self, tolerance: int = TOLERANCE) -> np.ndarray:
+        """Entries whose header totals disagree with the sum of their lines."""
+        debit, credit, count = self.entry_totals()
+        return np.flatnonzero(
+            (count > 0)
+            & ((np.abs(self.entry_debit - debit) > tolerance) | (np.abs(self.entry_credit - credit) > tolerance))
+        )
+
+    def entries_without_lines(self) -> np.ndarray:
+        return np.flatnonzero(self.lines_per_entry() == 0)
+
+    def single_line_entries(self) -> np.ndarray:
+        return np.flatnonzero(self.lines_per_entry() == 1)
+
+    def zero_amount_entries(self) -> np.ndarray:
+        """Entries that have lines, none of which moves any money."""
+        debit, credit, count = self.entry_totals()
+        return np.flatnonzero((count > 0) & (debit == 0) & (credit == 0))
+
+    def orphan_lines(self) -> np.ndarray:
+        """Lines whose journal entry is not in the snapshot."""
+        return np.flatnonzero(self.line_entry < 0)
+
+    def status_counts(self) -> dict[str, int]:
+        counts = np.bincount(self.entry_status, minlength=len(self.statuses))
+        return {status: int(count) for status, count in zip(self.statuses, counts)}
+
+    def entry_line_offsets(self) -> tuple[np.ndarray, np.ndarray]:
+        """CSR index: lines of entry i are order[offsets[i]:offsets[i + 1]], by line_number."""
+        if self._entry_offsets is None:
+            known = np.flatnonzero(self.line_entry >= 0)
+            order = known[np.lexsort((self.line_number[known], self.line_entry[known]))]
+            counts = np.bincount(self.line_entry[order], minlength=self.n_entries)
+            offsets = np.zeros(self.n_entries + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            self._entry_offsets = (order, offsets)
+        return self._entry_offsets
+
+    def lines_of(self, entry: int) -> np.ndarray:
+        order, offsets = self.entry_line_offsets()
+        return order[offsets[entry]:offsets[entry + 1]]
+
+    # ------------------------------------------------------------------
+    # Line filters and account aggregates
+    # ------------------------------------------------------------------
+    def line_mask(
+        self,
+        *,
+        statuses: Iterable[str] | None = None,
+        start=None,
+        end=None,
+        company_id: str | None = None,
+    ) -> np.ndarray:
+        """Boolean mask over lines, filtered by their entry's status, date range and company."""
+        mask = self.line_entry >= 0
+        if not self.n_entries:
+            return mask
+        entry = np.where(mask, self.line_entry, 0)
+        if statuses is not None:
+            mask &= np.isin(self.entry_status[entry], self.status_codes(statuses))
+        if start is not None:
+            mask &= self.entry_date[entry] >= np.datetime64(str(start), "D")
+        if end is not None:
+            mask &= self.entry_date[entry] <= np.datetime64(str(end), "D")
+        if company_id is not None:
+            mask &= self.entry_company[entry] == self.company_code(company_id)
+        return mask
+
+    def account_balances(self, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """(debit, credit) per account over the masked lines; unknown accounts are dropped."""
+        selected = self.line_account >= 0
+        if mask is not None:
+            selected &= mask
+        account = self.line_account[selected]
+        return (
+            group_sum(account, self.line_debit[selected], self.n_accounts),
+            group_sum(account, self.line_credit[selected], self.n_accounts),
+        )
+
+    def type_rollup(self, mask: np.ndarray | None = None) -> dict[str, dict]:
+        """Lines, debit and credit per account type; lines on unknown accounts roll up as UNKNOWN."""
+        selected = np.ones(self.n_lines, dtype=bool) if mask is None else mask
+        known = self.line_account >= 0
+        unknown_code = len(self.account_types)
+        type_of_line = np.full(self.n_lines, unknown_code, dtype=np.int32)
+        type_of_line[known] = self.account_type[self.line_account[known]]
+        type_of_line = type_of_line[selected]
+        size = unknown_code + 1
+        counts = np.bincount(type_of_line, minlength=size)
+        debit = group_sum(type_of_line, self.line_debit[selected], size)
+        credit = group_sum(type_of_line, self.line_credit[selected], size)
+        names = [*self.account_types, "UNKNOWN"]
+        return {
+            str(names[code]): {"lines": int(counts[code]), "debit": int(debit[code]), "credit": int(credit[code])}
+            for code in np.flatnonzero(counts)
+        }
+
+    def period_rollup(self, mask: np.ndarray | None = None) -> dict[str, dict]:
+        """Debit and credit per entry month."""
+        selected = self.line_entry >= 0
+        if mask is not None:
+            selected &= mask
+        periods = self.entry_period[self.line_entry[selected]]
+        keys, inverse = np.unique(periods, return_inverse=True)
+        debit = group_sum(inverse, self.line_debit[selected], len(keys))
+        credit = group_sum(inverse, self.line_credit[selected], len(keys))
+        return {
+            period_label(int(key)): {"debit": int(debit[i]), "credit": int(credit[i])}
+            for i, key in enumerate(keys)
+        }
+
+
+def load_ledger(
+    company_ids: list[str] | None = None, database_url: str | None = None, *, all_accounts: bool = False
+) -> Ledger:
+    """Read entries, lines and accounts for the given companies (all when None) in one snapshot.
+
+    With all_accounts, every company's chart of accounts is loaded, so lines
+    pointing at another company's account still resolve to it.
+    """
+    from db_connection import connect
+
+    entry_filter = "WHERE je.company_id = ANY(%(companies)s::uuid[])" if company_ids else ""
+    account_filter = "WHERE company_id = ANY(%(companies)s::uuid[])" if company_ids and not all_accounts else ""
+    params = {"companies": company_ids}
+    connection = connect(database_url, connect_timeout=10)
+    connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {', '.join('je.' + c for c in ENTRY_COLUMNS)} FROM journal_entries je {entry_filter}",
+                params,
+            )
+            entries = cursor.fetchall()
+            cursor.execute(
+                f"""
+                SELECT {', '.join('jel.' + c for c in LINE_COLUMNS)}
+                FROM journal_entry_lines jel
+                JOIN journal_entries je ON je.id = jel.journal_entry_id
+                {entry_filter}
+                """,
+                params,
+            )
+            lines = cursor.fetchall()
+            cursor.execute(f"SELECT {', '.join(ACCOUNT_COLUMNS)} FROM chart_of_accounts {account_filter}", params)
+            accounts = cursor.fetchall()
+            company_filter = "WHERE c.id = ANY(%(companies)s::uuid[])" if company_ids else ""
+            cursor.execute(
+                f"""
+                SELECT DISTINCT COALESCE(cc.base_currency, c.currency)
+                FROM companies c
+                LEFT JOIN currency_configurations cc ON cc.company_id = c.id
+                {company_filter}
+                """,
+                params,
+            )
+            currencies = [row[0] for row in cursor.fetchall()]
+    finally:
+        connection.rollback()
+        connection.close()
+    # One scale per ledger: the finest of the companies' currencies keeps every amount exact.
+    scale = max((scale_of(currency) for currency in currencies), default=scale_of(None))
+    return Ledger.from_rows(entries, lines, accounts, scale)
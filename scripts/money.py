@@ -0,0 +1,145 @@
+"""Exact money: integer minor units (dirham, fils) as Python ints and int64 arrays.
+
+Amounts are converted once, at load time, from the numeric/JSON value to an
+integer count of minor units of their currency, rounding half away from zero
+like numeric round(). Sums and balance checks are then integer arithmetic, so
+a ledger-wide total is exact and "balanced" means equal, not "within 0.01".
+
+The number of minor units per currency mirrors src/utils/currencyConfig.ts;
+a company's currency is currency_configurations.base_currency (falling back to
+companies.currency, then QAR).
+
+    scale = company_scale(cursor, company_id)     # 2 for QAR, 3 for KWD
+    debit = minor_array(amounts, scale)           # np.int64
+    print(format_minor(debit.sum(), scale))
+"""
+from collections.abc import Iterable
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+
+DEFAULT_CURRENCY = "QAR"
+FRACTION_DIGITS = {
+    "KWD": 3,
+    "QAR": 2,
+    "SAR": 2,
+    "AED": 2,
+    "OMR": 3,
+    "BHD": 3,
+    "USD": 2,
+    "EUR": 2,
+}
+# float64 holds every integer below 2**53 exactly, so a bincount over minor
+# units is exact while the absolute total of its inputs stays below that.
+EXACT_FLOAT_LIMIT = 2**53
+
+
+def scale_of(currency: str | None) -> int:
+    return FRACTION_DIGITS.get((currency or DEFAULT_CURRENCY).upper(), FRACTION_DIGITS[DEFAULT_CURRENCY])
+
+
+def to_minor(value, scale: int = 2) -> int:
+    """Integer minor units of a numeric, string or float amount; None counts as zero."""
+    if value is None or value == "":
+        return 0
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int(value.scaleb(scale).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def minor_array(values: Iterable, scale: int = 2) -> np.ndarray:
+    """int64 minor units for a column of amounts.
+
+    Amounts already on the minor-unit grid (the normal case for numeric(15, 2)
+    columns) are converted in one float pass, which is exact for them; only the
+    off-grid or very large ones go through Decimal rounding.
+    """
+    values = [0 if value is None or value == "" else value for value in values]
+    try:
+        scaled = np.array(values, dtype=np.float64) * 10**scale
+    except (TypeError, ValueError):
+        return np.fromiter((to_minor(value, scale) for value in values), dtype=np.int64, count=len(values))
+    minor = np.rint(scaled)
+    slow = np.flatnonzero((np.abs(scaled - minor) > 1e-6) | (np.abs(minor) >= EXACT_FLOAT_LIMIT))
+    result = minor.astype(np.int64)
+    for i in slow.tolist():
+        result[i] = to_minor(values[i], scale)
+    return result
+
+
+def to_major(minor: int, scale: int = 2) -> Decimal:
+    return Decimal(int(minor)).scaleb(-scale)
+
+
+def format_minor(minor: int, scale: int = 2, currency: str | None = None) -> str:
+    text = f"{to_major(minor, scale):,.{scale}f}"
+    return f"{currency} {text}" if currency else text
+
+
+def group_sum(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """Exact int64 sum of `values` per group index (0 <= group < size)."""
+    if int(np.abs(values).sum()) < EXACT_FLOAT_LIMIT:
+        return np.rint(np.bincount(groups, weights=values, minlength=size)).astype(np.int64)
+    totals = np.zeros(size, dtype=np.int64)
+    np.add.at(totals, groups, values)
+    return totals
+
+
+@dataclass(frozen=True, order=True)
+class Money:
+    """A single amount in minor units of one currency."""
+
+    minor: int
+    currency: str = DEFAULT_CURRENCY
+
+    @classmethod
+    def of(cls, value, currency: str = DEFAULT_CURRENCY) -> "Money":
+        return cls(to_minor(value, scale_of(currency)), currency)
+
+    @property
+    def scale(self) -> int:
+        return scale_of(self.currency)
+
+    def _check(self, other: "Money") -> None:
+        if self.currency != other.currency:
+            raise ValueError(f"Cannot combine {self.currency} and {other.currency} amounts")
+
+    def __add__(self, other: "Money") -> "Money":
+        self._check(other)
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other: "Money") -> "Money":
+        self._check(other)
+        return Money(self.minor - other.minor, self.currency)
+
+    def __neg__(self) -> "Money":
+        return Money(-self.minor, self.currency)
+
+    def __bool__(self) -> bool:
+        return self.minor != 0
+
+    def to_decimal(self) -> Decimal:
+        return to_major(self.minor, self.scale)
+
+    def __str__(self) -> str:
+        return format_minor(self.minor, self.scale, self.currency)
+
+
+def company_currency(cursor, company_id: str) -> str:
+    cursor.execute(
+        """
+        SELECT COALESCE(
+            (SELECT base_currency FROM currency_configurations WHERE company_id = %(company)s LIMIT 1),
+            (SELECT currency FROM companies WHERE id = %(company)s),
+            %(default)s
+        )
+        """,
+        {"company": company_id, "default": DEFAULT_CURRENCY},
+    )
+    return cursor.fetchone()[0]
+
+
+def company_scale(cursor, company_id: str) -> int:
+    return scale_of(company_currency(cursor, company_id))
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Allocate unallocated customer receipts to open invoices by rule, for review or posting.
+
+Open invoices (total minus what canonical_invoice_paid_amount counts: active
+invoice allocations of completed receipts, plus legacy payments.invoice_id links
+of receipts without an active invoice allocation) sit in two kinds of
+priority queues: one per (customer, contract) and one per customer, both
+ordered by the rule's key. Payments are taken in (payment_date, created_at) order. An invoice
+enters its queues once its invoice_date is reached, so a receipt never settles
+an invoice issued after it (unless --allow-future). Each receipt drains its
+contract's queue first and then its customer's queue; the two queues share the
+open amounts. A heap push or pop per allocation gives O((P + I) log I)
+overall. Rules:
+
+  fifo    earliest due date first (invoice_date when there is no due date)
+  oldest  earliest invoice_date first
+  exact   an open invoice whose open amount equals the receipt's remaining
+          amount, earliest due first; otherwise fifo
+
+Receipts linked to an invoice only through payments.invoice_id are left out:
+the canonical rule already counts them against that invoice, and replacing
+their allocations would move the money off it.
+
+Allocations are written to CSV or JSONL for review. --apply posts them through
+replace_payment_invoice_allocations, one payment per savepoint, with the
+payment's current allocations as the expected state: a payment that changed
+since the snapshot is rejected instead of being over-allocated. The function
+keeps the existing allocations, voids and re-inserts them with the new ones,
+and writes payment_allocation_change_log.
+
+Usage:
+    python scripts/payment_allocator.py --rule fifo --output allocations.csv
+    python scripts/payment_allocator.py --rule exact --scope customer --format jsonl --output allocations.jsonl
+    python scripts/payment_allocator.py --rule fifo --apply --reason "Month-end FIFO allocation"
+"""
+import argparse
+import csv
+import heapq
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+
+import numpy as np
+
+from db_connection import connect, get_company_id
+from money import company_scale, minor_array, to_major
+
+
+RULES = ("fifo", "oldest", "exact")
+SCOPES = ("contract-then-customer", "customer", "contract")
+CHUNK_SIZE = 500
+
+# The receipts canonical_invoice_paid_amount (migration 20260712052000) counts.
+COMPLETED_RECEIPT = """\
+      AND lower(COALESCE(p.payment_status, '')) IN ('completed', 'paid', 'success', 'succeeded')
+      AND lower(COALESCE(p.transaction_type::text, 'receipt')) = 'receipt'
+"""
+OPEN_INVOICES = """
+    SELECT i.id, i.invoice_number, i.customer_id, i.contract_id, i.invoice_date,
+           COALESCE(i.due_date, i.invoice_date), i.total_amount - COALESCE(a.paid, 0)
+    FROM invoices i
+    LEFT JOIN (
+        SELECT invoice_id, sum(amount) AS paid
+        FROM (
+            SELECT pa.target_id AS invoice_id, pa.amount
+            FROM payment_allocations pa
+            JOIN payments p ON p.id = pa.payment_id
+            WHERE pa.company_id = %(company)s AND pa.allocation_type = 'invoice' AND pa.is_active
+              {receipt}
+            UNION ALL
+            SELECT p.invoice_id, p.amount
+            FROM payments p
+            WHERE p.company_id = %(company)s AND p.invoice_id IS NOT NULL
+              {receipt}
+              AND NOT EXISTS (
+                  SELECT 1 FROM payment_allocations pa
+                  WHERE pa.payment_id = p.id AND pa.allocation_type = 'invoice' AND pa.is_active
+              )
+        ) settled
+        GROUP BY invoice_id
+    ) a ON a.invoice_id = i.id
+    WHERE i.company_id = %(company)s
+      AND i.customer_id IS NOT NULL
+      AND COALESCE(i.status, '') NOT IN ('cancelled', 'voided')
+      AND i.total_amount > COALESCE(a.paid, 0)
+""".format(receipt=COMPLETED_RECEIPT.strip())
+# Same receipts replace_payment_invoice_allocations accepts; payments with active
+# non-invoice allocations are refused by it, so they are left out here, and so
+# are payments settled only through their legacy invoice_id link.
+UNALLOCATED_PAYMENTS = """
+    SELECT p.id, p.payment_number, p.customer_id, p.contract_id, p.payment_date, p.created_at,
+           p.amount - COALESCE(a.allocated, 0), COALESCE(a.expected, '[]')
+    FROM payments p
+    LEFT JOIN LATERAL (
+        SELECT sum(amount) AS allocated,
+               bool_or(allocation_type <> 'invoice') AS other_types,
+               (jsonb_agg(jsonb_build_object('invoice_id', target_id, 'amount', amount) ORDER BY allocation_order)
+                   FILTER (WHERE allocation_type = 'invoice'))::text AS expected
+        FROM payment_allocations
+        WHERE payment_id = p.id AND is_active
+    ) a ON true
+    WHERE p.company_id = %(company)s
+      AND p.customer_id IS NOT NULL
+      AND NOT COALESCE(a.other_types, false)
+      AND (p.invoice_id IS NULL OR a.expected IS NOT NULL)
+      AND p.amount > COALESCE(a.allocated, 0)
+""" + COMPLETED_RECEIPT
+REPLACE_ALLOCATIONS = """
+    SELECT replace_payment_invoice_allocations(
+        %(payment)s, %(company)s, %(allocations)s::jsonb, %(reason)s, %(expected)s::jsonb, %(actor)s
+    )
+"""
+
+
+@dataclass
+class Allocation:
+    payment_id: str
+    payment_number: str
+    payment_date: str
+    invoice_id: str
+    invoice_number: str
+    due_date: str
+    customer_id: str
+    contract_id: str | None
+    amount: Decimal
+    queue: str
+    match: str
+    allocation_order: int
+
+
+def _day(value) -> int:
+    return int(np.datetime64(str(value)[:10], "D").astype(np.int64))
+
+
+def allocate(invoices: list[tuple], payments: list[tuple], *, rule: str = "fifo",
+             scope: str = "contract-then-customer", allow_future: bool = False, scale: int = 2) -> list[Allocation]:
+    """Allocations of `payments` (UNALLOCATED_PAYMENTS rows) to `invoices` (OPEN_INVOICES rows)."""
+    n = len(invoices)
+    issued = np.array([_day(row[4]) for row in invoices], dtype=np.int64)
+    due = np.array([_day(row[5]) for row in invoices], dtype=np.int64)
+    number = np.array([str(row[1] or "") for row in invoices], dtype=object)
+    # Rank of every invoice under the rule; heaps hold ranks, so ties break the same way everywhere.
+    primary, secondary = (issued, due) if rule == "oldest" else (due, issued)
+    by_rank = np.lexsort((number, secondary, primary)) if n else np.zeros(0, dtype=np.int64)
+    open_amount = minor_array([row[6] for row in invoices], scale).tolist()
+    keys = [
+        ([("contract", str(row[2]), str(row[3]))] if row[3] and scope != "customer" else [])
+        + ([("customer", str(row[2]))] if scope != "contract" else [])
+        for row in invoices
+    ]
+
+    queues = defaultdict(list)
+    exact = defaultdict(list)
+
+    def admit(rank: int) -> None:
+        invoice = int(by_rank[rank])
+        for key in keys[invoice]:
+            heapq.heappush(queues[key], rank)
+            if rule == "exact":
+                heapq.heappush(exact[key, open_amount[invoice]], rank)
+
+    def exact_match(key, amount: int) -> int | None:
+        heap = exact.get((key, amount))
+        while heap:
+            invoice = int(by_rank[heap[0]])
+            if open_amount[invoice] == amount:
+                return invoice
+            heapq.heappop(heap)  # settled or partly paid since it was pushed
+        return None
+
+    rank_of = np.empty(n, dtype=np.int64)
+    rank_of[by_rank] = np.arange(n)
+    admission = np.argsort(issued, kind="stable")
+    admitted = 0
+    if allow_future:
+        for rank in range(n):
+            admit(rank)
+        admitted = n
+
+    payment_order = sorted(range(len(payments)), key=lambda p: (str(payments[p][4]), str(payments[p][5] or ""), str(payments[p][1] or "")))
+    allocations = []
+    for p in payment_order:
+        payment_id, payment_number, customer_id, contract_id, paid_on, _, unallocated = payments[p][:7]
+        payment_day = _day(paid_on)
+        while admitted < n and issued[admission[admitted]] <= payment_day:
+            admit(int(rank_of[admission[admitted]]))
+            admitted += 1
+        remaining = int(minor_array([unallocated], scale)[0])
+        payment_keys = (
+            ([("contract", str(customer_id), str(contract_id))] if contract_id and scope != "customer" else [])
+            + ([("customer", str(customer_id))] if scope != "contract" else [])
+        )
+        order = 0
+
+        def take(invoice: int, amount: int, queue: str, match: str) -> None:
+            nonlocal remaining, order
+            open_amount[invoice] -= amount
+            remaining -= amount
+            order += 1
+            row = invoices[invoice]
+            allocations.append(Allocation(
+                str(payment_id), payment_number, str(paid_on)[:10], str(row[0]), row[1], str(row[5])[:10],
+                str(row[2]), str(row[3]) if row[3] else None, to_major(amount, scale), queue, match, order,
+            ))
+            if rule == "exact" and open_amount[invoice]:
+                for key in keys[invoice]:
+                    heapq.heappush(exact[key, open_amount[invoice]], int(rank_of[invoice]))
+
+        for key in payment_keys:
+            if rule == "exact" and remaining:
+                invoice = exact_match(key, remaining)
+                if invoice is not None:
+                    take(invoice, remaining, key[0], "exact")
+            heap = queues.get(key)
+            while remaining and heap:
+                invoice = int(by_rank[heap[0]])
+                if not open_amount[invoice]:
+                    heapq.heappop(heap)
+                    continue
+                take(invoice, min(remaining, open_amount[invoice]), key[0], "fifo" if rule == "exact" else rule)
+            if not remaining:
+                break
+    return merge_allocations(allocations)
+
+
+def merge_allocations(allocations: list[Allocation]) -> list[Allocation]:
+    """One allocation per (payment, invoice): a split across queues is summed into the first."""
+    merged = {}
+    for allocation in allocations:
+        key = (allocation.payment_id, allocation.invoice_id)
+        if key in merged:
+            merged[key].amount += allocation.amount
+        else:
+            merged[key] = allocation
+    return list(merged.values())
+
+
+def apply_allocations(connection, company_id: str, payments: list[tuple], allocations: list[Allocation],
+                      reason: str, actor_id: str | None = None) -> Counter:
+    """Post per payment through replace_payment_invoice_allocations; one savepoint per payment."""
+    expected = {str(row[0]): row[7] for row in payments}
+    by_payment = defaultdict(list)
+    for allocation in allocations:
+        by_payment[allocation.payment_id].append(allocation)
+    outcomes = Counter()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('request.jwt.claim.role', 'service_role', false)")
+        for number, (payment_id, new) in enumerate(by_payment.items(), start=1):
+            current = json.loads(expected[payment_id], parse_float=Decimal, parse_int=Decimal)
+            amounts = {row["invoice_id"]: row["amount"] for row in current}
+            for allocation in new:
+                amounts[allocation.invoice_id] = amounts.get(allocation.invoice_id, Decimal(0)) + allocation.amount
+            cursor.execute("SAVEPOINT allocate_payment")
+            try:
+                cursor.execute(REPLACE_ALLOCATIONS, {
+                    "payment": payment_id,
+                    "company": company_id,
+                    "allocations": json.dumps([{"invoice_id": k, "amount": str(v)} for k, v in amounts.items()]),
+                    "reason": reason,
+                    "expected": expected[payment_id],
+                    "actor": actor_id,
+                })
+                cursor.execute("RELEASE SAVEPOINT allocate_payment")
+                outcomes["posted"] += 1
+            except Exception as error:
+                cursor.execute("ROLLBACK TO SAVEPOINT allocate_payment")
+                outcomes["rejected"] += 1
+                if outcomes["rejected"] <= 5:
+                    print(f"  payment {payment_id[:8]} rejected: {str(error).strip().splitlines()[0]}", file=sys.stderr)
+            if number % CHUNK_SIZE == 0:
+                connection.commit()
+    connection.commit()
+    return outcomes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company (default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--rule", choices=RULES, default="fifo")
+    parser.add_argument("--scope", choices=SCOPES, default=SCOPES[0], help="Queues a receipt draws from")
+    parser.add_argument("--allow-future", action="store_true", help="Also settle invoices issued after the receipt")
+    parser.add_argument("--format", choices=("console", "csv", "jsonl"), default="console")
+    parser.add_argument("--output", help="Write csv or jsonl here instead of stdout")
+    parser.add_argument("--apply", action="store_true", help="Post the allocations (default is a dry run)")
+    parser.add_argument("--reason", help="Allocation reason recorded with --apply")
+    parser.add_argument("--actor-id", help="User recorded as the actor with --apply")
+    args = parser.parse_args()
+
+    company_id = args.company_id or get_company_id()
+    started = time.perf_counter()
+    connection = connect(connect_timeout=10)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cursor.execute(OPEN_INVOICES, {"company": company_id})
+            invoices = cursor.fetchall()
+            cursor.execute(UNALLOCATED_PAYMENTS, {"company": company_id})
+            payments = cursor.fetchall()
+            scale = company_scale(cursor, company_id)
+        connection.rollback()
+        loaded = time.perf_counter() - started
+
+        allocations = allocate(invoices, payments, rule=args.rule, scope=args.scope,
+                               allow_future=args.allow_future, scale=scale)
+        computed = time.perf_counter() - started - loaded
+
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            if args.format == "csv":
+                writer = csv.DictWriter(out, fieldnames=list(Allocation.__dataclass_fields__))
+                writer.writeheader()
+                writer.writerows(asdict(allocation) for allocation in allocations)
+            elif args.format == "jsonl":
+                for allocation in allocations:
+                    out.write(json.dumps(asdict(allocation), ensure_ascii=False, default=str) + "\n")
+        finally:
+            if args.output:
+                out.close()
+
+        allocated = sum((allocation.amount for allocation in allocations), Decimal(0))
+        unallocated = sum((Decimal(str(row[6])) for row in payments), Decimal(0))
+        paid = {allocation.payment_id for allocation in allocations}
+        matches = Counter(allocation.match for allocation in allocations)
+        queues = Counter(allocation.queue for allocation in allocations)
+        print(
+            f"{len(payments)} receipts with unallocated amounts, {len(invoices)} open invoices "
+            f"(loaded in {loaded:.1f}s, allocated in {computed:.2f}s)\n"
+            f"{len(allocations)} allocations for {len(paid)} receipts: {allocated:,} of {unallocated:,} unallocated\n"
+            f"  by match: {dict(matches)}; by queue: {dict(queues)}",
+            file=sys.stderr if args.format != "console" and not args.output else sys.stdout,
+        )
+
+        if args.apply:
+            if not args.reason:
+                parser.error("--apply needs --reason")
+            outcomes = apply_allocations(connection, company_id, payments, allocations, args.reason, args.actor_id)
+            print(f"Posted {outcomes['posted']} payments; {outcomes['rejected']} rejected")
+        elif allocations:
+            print("Dry run: nothing written (use --apply)")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
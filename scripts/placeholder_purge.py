@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Purge PYINV* placeholder invoices and their journal entries with one bulk statement per step.
+
+The invoices are selected by invoice_number prefix (--prefix, default PYINV-,
+PYINV2- and PYINV3-). Each step of the old per-invoice REST chain then runs
+once over every affected id, in a single transaction:
+
+  unlink invoice journals   invoices.journal_entry_id = NULL
+  move entries to draft     so the posted-line guard lets the lines go
+  delete journal lines
+  delete journal entries    the invoices' journal_entry_id entries and the
+                            entries with reference_type 'invoice' on them
+  unlink payments           payments.invoice_id of cancelled payments
+  unlink payment schedules  contract_payment_schedules.invoice_id
+  delete invoice items
+  delete invoices
+
+Placeholders still in use are left out and reported. This covers invoices
+with active allocations or payments that are not cancelled (release them with
+stuck_payment_planner.py first), and invoices referenced by another table's
+RESTRICT / NO ACTION foreign key. Foreign keys are read from pg_constraint. A
+journal entry that anything outside the purge still references is unlinked
+but kept.
+
+Closed books are left alone too: a placeholder dated in a closed or locked
+accounting period, or whose journal entry is, is left out, and such an entry is
+kept. The last four steps run under app.allow_invoice_hard_delete and the
+financial-controls bypass, the way delete_contract_out_of_period_invoice does.
+--allow-closed-periods purges those placeholders as well and runs every step
+under the bypass, since the invoice and journal-entry update triggers would
+otherwise reject them; the dry run lists how many fall in such periods.
+
+The dry run (default) plans in a read-only snapshot and prints the row count
+of every step. --apply locks the invoices, plans again in the write
+transaction, and runs the steps. It commits only if every step touched
+exactly the planned rows. Deleted lines reach chart_of_accounts balances on
+the next balance_maintainer.py --verify --repair (or
+update_account_balances_from_entries).
+
+Usage:
+    python scripts/placeholder_purge.py                      # dry run, FLEETIFY_COMPANY_ID
+    python scripts/placeholder_purge.py --all-companies --prefix PYINV3-
+    python scripts/placeholder_purge.py --apply
+    python scripts/placeholder_purge.py --apply --allow-closed-periods
+"""
+import argparse
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from psycopg2 import sql
+
+from db_connection import connect, get_company_id
+
+
+PLACEHOLDER_PREFIXES = ("PYINV-", "PYINV2-", "PYINV3-")
+INACTIVE_PAYMENT_STATUSES = ("cancelled", "canceled", "void", "voided", "deleted", "failed", "reversed", "refunded")
+FK_ACTIONS = {"a": "no action", "r": "restrict", "c": "cascade", "n": "set null", "d": "set default"}
+# References the chain itself clears, per referenced table.
+HANDLED = {
+    "invoices": {("payments", "invoice_id"), ("contract_payment_schedules", "invoice_id"), ("invoice_items", "invoice_id")},
+    "journal_entries": {("journal_entry_lines", "journal_entry_id")},
+}
+
+TARGETS = """
+    SELECT id, invoice_number
+    FROM invoices
+    WHERE COALESCE(invoice_number, '') LIKE ANY(%(patterns)s)
+      AND (%(companies)s::uuid[] IS NULL OR company_id = ANY(%(companies)s::uuid[]))
+    ORDER BY invoice_number
+"""
+LOCK_TARGETS = "SELECT id FROM invoices WHERE id = ANY(%(invoices)s::uuid[]) FOR UPDATE"
+ALLOCATED = """
+    SELECT DISTINCT target_id FROM payment_allocations
+    WHERE allocation_type = 'invoice' AND is_active AND target_id = ANY(%(invoices)s::uuid[])
+"""
+PAID = """
+    SELECT DISTINCT invoice_id FROM payments
+    WHERE invoice_id = ANY(%(invoices)s::uuid[])
+      AND lower(COALESCE(payment_status, '')) <> ALL(%(inactive)s)
+"""
+REFERENCING_KEYS = """
+    SELECT rel.relname, att.attname, con.confdeltype
+    FROM pg_constraint con
+    JOIN pg_class rel ON rel.oid = con.conrelid
+    JOIN pg_namespace ns ON ns.oid = rel.relnamespace
+    JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+    WHERE con.contype = 'f'
+      AND con.confrelid = %(table)s::regclass
+      AND ns.nspname = 'public'
+      AND array_length(con.conkey, 1) = 1
+    ORDER BY 1, 2
+"""
+ENTRIES = """
+    SELECT id FROM journal_entries
+    WHERE id IN (SELECT journal_entry_id FROM invoices WHERE id = ANY(%(invoices)s::uuid[]))
+       OR (reference_type = 'invoice' AND reference_id = ANY(%(invoices)s::uuid[]))
+"""
+IN_CLOSED_PERIOD = """EXISTS (
+        SELECT 1 FROM accounting_periods ap
+        WHERE ap.company_id = {row}.company_id AND {row}.{date} BETWEEN ap.start_date AND ap.end_date
+          AND lower(ap.status) IN ('closed', 'locked'))"""
+CLOSED_INVOICES = """
+    SELECT i.id, {invoice_closed} AS dated_closed
+    FROM invoices i
+    WHERE i.id = ANY(%(invoices)s::uuid[])
+      AND ({invoice_closed} OR EXISTS (
+        SELECT 1 FROM journal_entries je
+        WHERE (je.id = i.journal_entry_id OR (je.reference_type = 'invoice' AND je.reference_id = i.id))
+          AND {entry_closed}))
+""".format(invoice_closed=IN_CLOSED_PERIOD.format(row="i", date="invoice_date"),
+           entry_closed=IN_CLOSED_PERIOD.format(row="je", date="entry_date"))
+CLOSED_ENTRIES = """
+    SELECT je.id FROM journal_entries je
+    WHERE je.id = ANY(%(entries)s::uuid[]) AND {entry_closed}
+""".format(entry_closed=IN_CLOSED_PERIOD.format(row="je", date="entry_date"))
+CLOSED_PERIODS = """
+    SELECT 'invoices', count(*) FROM invoices i
+    WHERE i.id = ANY(%(invoices)s::uuid[]) AND {invoice_closed}
+    UNION ALL
+    SELECT 'journal entries', count(*) FROM journal_entries je
+    WHERE je.id = ANY(%(entries)s::uuid[]) AND {entry_closed}
+""".format(invoice_closed=IN_CLOSED_PERIOD.format(row="i", date="invoice_date"),
+           entry_closed=IN_CLOSED_PERIOD.format(row="je", date="entry_date"))
+BYPASS = """
+    SELECT set_config('app.financial_controls_bypass', %(value)s, true),
+           set_config('app.allow_invoice_hard_delete', %(value)s, true)
+"""
+
+# (step, rows it will touch, statement, needs the hard-delete bypass)
+STEPS = (
+    ("unlink invoice journals",
+     "SELECT count(*) FROM invoices WHERE id = ANY(%(invoices)s::uuid[]) AND journal_entry_id IS NOT NULL",
+     "UPDATE invoices SET journal_entry_id = NULL, updated_at = now() "
+     "WHERE id = ANY(%(invoices)s::uuid[]) AND journal_entry_id IS NOT NULL",
+     False),
+    ("move entries to draft",
+     "SELECT count(*) FROM journal_entries WHERE id = ANY(%(entries)s::uuid[]) AND status IS DISTINCT FROM 'draft'",
+     "UPDATE journal_entries SET status = 'draft', updated_at = now() "
+     "WHERE id = ANY(%(entries)s::uuid[]) AND status IS DISTINCT FROM 'draft'",
+     False),
+    ("delete journal lines",
+     "SELECT count(*) FROM journal_entry_lines WHERE journal_entry_id = ANY(%(entries)s::uuid[])",
+     "DELETE FROM journal_entry_lines WHERE journal_entry_id = ANY(%(entries)s::uuid[])",
+     False),
+    ("delete journal entries",
+     "SELECT count(*) FROM journal_entries WHERE id = ANY(%(entries)s::uuid[])",
+     "DELETE FROM journal_entries WHERE id = ANY(%(entries)s::uuid[])",
+     False),
+    ("unlink payments",
+     "SELECT count(*) FROM payments WHERE invoice_id = ANY(%(invoices)s::uuid[])",
+     "UPDATE payments SET invoice_id = NULL, updated_at = now() WHERE invoice_id = ANY(%(invoices)s::uuid[])",
+     True),
+    ("unlink payment schedules",
+     "SELECT count(*) FROM contract_payment_schedules WHERE invoice_id = ANY(%(invoices)s::uuid[])",
+     "UPDATE contract_payment_schedules SET invoice_id = NULL, updated_at = now() "
+     "WHERE invoice_id = ANY(%(invoices)s::uuid[])",
+     True),
+    ("delete invoice items",
+     "SELECT count(*) FROM invoice_items WHERE invoice_id = ANY(%(invoices)s::uuid[])",
+     "DELETE FROM invoice_items WHERE invoice_id = ANY(%(invoices)s::uuid[])",
+     True),
+    ("delete invoices",
+     "SELECT count(*) FROM invoices WHERE id = ANY(%(invoices)s::uuid[])",
+     "DELETE FROM invoices WHERE id = ANY(%(invoices)s::uuid[])",
+     True),
+)
+
+
+@dataclass
+class PurgePlan:
+    invoices: list[str]
+    entries: list[str]
+    blocked: dict[str, str] = field(default_factory=dict)
+    kept_entries: dict[str, str] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+    side_effects: list[tuple[str, str, int]] = field(default_factory=list)
+    closed_periods: dict[str, int] = field(default_factory=dict)
+    allow_closed_periods: bool = False
+
+    @property
+    def params(self) -> dict:
+        return {"invoices": self.invoices, "entries": self.entries}
+
+
+def referenced(cursor, table: str, ids: list[str], exclude: dict[str, list[str]]) -> list[tuple[str, str, str, set]]:
+    """(table, column, on-delete action, referenced ids) for every single-column FK to `table` that hits `ids`.
+
+    Rows of a table in `exclude` whose id is listed there are being purged too and do not count.
+    """
+    cursor.execute(REFERENCING_KEYS, {"table": f"public.{table}"})
+    hits = []
+    for ref_table, column, action in cursor.fetchall():
+        if (ref_table, column) in HANDLED.get(table, ()):
+            continue
+        query = sql.SQL("SELECT DISTINCT {column} FROM {table} WHERE {column} = ANY(%(ids)s::uuid[])").format(
+            column=sql.Identifier(column), table=sql.Identifier(ref_table))
+        if ref_table in exclude:
+            query += sql.SQL(" AND NOT (id = ANY(%(exclude)s::uuid[]))")
+        cursor.execute(query, {"ids": ids, "exclude": exclude.get(ref_table, [])})
+        found = {str(row[0]) for row in cursor.fetchall()}
+        if found:
+            hits.append((ref_table, column, FK_ACTIONS.get(action, action), found))
+    return hits
+
+
+def plan_purge(cursor, prefixes=PLACEHOLDER_PREFIXES, companies: list[str] | None = None, lock: bool = False,
+               allow_closed_periods: bool = False) -> PurgePlan:
+    """The placeholders that can go, what keeps the others, and the row count of every step.
+
+    Unless `allow_closed_periods`, placeholders and entries in closed or locked periods are left out.
+    """
+    cursor.execute(TARGETS, {"patterns": [prefix + "%" for prefix in prefixes], "companies": companies})
+    candidates = [str(row[0]) for row in cursor.fetchall()]
+    if lock and candidates:
+        cursor.execute(LOCK_TARGETS, {"invoices": candidates})
+
+    blocked = {}
+    cursor.execute(ALLOCATED, {"invoices": candidates})
+    blocked.update((str(row[0]), "active payment allocations") for row in cursor.fetchall())
+    cursor.execute(PAID, {"invoices": candidates, "inactive": list(INACTIVE_PAYMENT_STATUSES)})
+    blocked.update((str(row[0]), "payments that are not cancelled") for row in cursor.fetchall() if str(row[0]) not in blocked)
+    for ref_table, column, action, found in referenced(cursor, "invoices", candidates, {"invoices": candidates}):
+        if action in ("no action", "restrict"):
+            for invoice_id in found - blocked.keys():
+                blocked[invoice_id] = f"referenced by {ref_table}.{column}"
+    if not allow_closed_periods:
+        cursor.execute(CLOSED_INVOICES, {"invoices": candidates})
+        for invoice_id, dated_closed in cursor.fetchall():
+            if str(invoice_id) not in blocked:
+                blocked[str(invoice_id)] = ("dated in a closed or locked period" if dated_closed
+                                            else "journal entry in a closed or locked period")
+    invoices = [invoice_id for invoice_id in candidates if invoice_id not in blocked]
+
+    cursor.execute(ENTRIES, {"invoices": invoices})
+    entries = [str(row[0]) for row in cursor.fetchall()]
+    kept = {}
+    for ref_table, column, _, found in referenced(cursor, "journal_entries", entries,
+                                                 {"invoices": invoices, "journal_entries": entries}):
+        for entry_id in found - kept.keys():
+            kept[entry_id] = f"referenced by {ref_table}.{column}"
+    if not allow_closed_periods:
+        cursor.execute(CLOSED_ENTRIES, {"entries": entries})
+        for row in cursor.fetchall():
+            kept.setdefault(str(row[0]), "dated in a closed or locked period")
+    plan = PurgePlan(invoices, [entry_id for entry_id in entries if entry_id not in kept], blocked, kept,
+                     allow_closed_periods=allow_closed_periods)
+
+    for step, count_sql, _, _ in STEPS:
+        cursor.execute(count_sql, plan.params)
+        plan.counts[step] = cursor.fetchone()[0]
+    cursor.execute(CLOSED_PERIODS, plan.params)
+    plan.closed_periods = dict(cursor.fetchall())
+    for ref_table, column, action, found in referenced(cursor, "invoices", invoices, {"invoices": invoices}):
+        plan.side_effects.append((f"{ref_table}.{column}", action, len(found)))
+    return plan
+
+
+def run_purge(cursor, plan: PurgePlan) -> dict[str, int]:
+    """Run every step once over the plan's ids; raises if a step touches other than the planned rows."""
+    done = {}
+    bypassed = False
+    for step, _, statement, bypass in STEPS:
+        if (bypass or plan.allow_closed_periods) and not bypassed:
+            cursor.execute(BYPASS, {"value": "on"})
+            bypassed = True
+        cursor.execute(statement, plan.params)
+        done[step] = cursor.rowcount
+        if done[step] != plan.counts[step]:
+            raise RuntimeError(f"{step}: {done[step]} rows, planned {plan.counts[step]}")
+    if bypassed:
+        cursor.execute(BYPASS, {"value": ""})
+    return done
+
+
+def print_plan(plan: PurgePlan, prefixes) -> None:
+    print(f"{len(plan.invoices) + len(plan.blocked)} invoices matching {', '.join(p + '*' for p in prefixes)}: "
+          f"{len(plan.invoices)} to purge, {len(plan.blocked)} left out")
+    for reason, count in Counter(plan.blocked.values()).most_common():
+        print(f"  left out, {reason}: {count}")
+    print(f"{len(plan.entries)} journal entries to delete, {len(plan.kept_entries)} kept")
+    for reason, count in Counter(plan.kept_entries.values()).most_common():
+        print(f"  kept, {reason}: {count}")
+    for column, action, count in plan.side_effects:
+        print(f"  {column} ({action} on delete) references {count} of them")
+    closed = [f"{count} {kind}" for kind, count in plan.closed_periods.items() if count]
+    if closed:
+        print(f"  dated in closed or locked periods (purged under the bypass): {', '.join(closed)}")
+    print(f"\n{'Step':<28} {'Rows':>10}")
+    for step, _, _, _ in STEPS:
+        print(f"{step:<28} {plan.counts[step]:>10,}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", action="append", help="Company to purge (repeatable; default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--all-companies", action="store_true", help="Purge placeholders of every company")
+    parser.add_argument("--prefix", action="append", help=f"invoice_number prefix (repeatable; default {', '.join(PLACEHOLDER_PREFIXES)})")
+    parser.add_argument("--apply", action="store_true", help="Delete (default is a dry run)")
+    parser.add_argument("--allow-closed-periods", action="store_true",
+                        help="Also purge placeholders and entries dated in closed or locked periods")
+    args = parser.parse_args()
+
+    prefixes = tuple(args.prefix or PLACEHOLDER_PREFIXES)
+    companies = None if args.all_companies else (args.company_id or [get_company_id()])
+    started = time.perf_counter()
+    connection = connect(connect_timeout=10)
+    try:
+        with connection.cursor() as cursor:
+            if not args.apply:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            plan = plan_purge(cursor, prefixes, companies, lock=args.apply,
+                              allow_closed_periods=args.allow_closed_periods)
+            print_plan(plan, prefixes)
+            print(f"\nPlanned in {time.perf_counter() - started:.1f}s")
+            if not args.apply:
+                connection.rollback()
+                if plan.invoices:
+                    print("Dry run: nothing written (use --apply)")
+                return
+            ran = time.perf_counter()
+            run_purge(cursor, plan)
+        connection.commit()
+        print(f"Purged {len(plan.invoices)} invoices and {len(plan.entries)} journal entries "
+              f"in {time.perf_counter() - ran:.1f}s; run balance_maintainer.py --verify --repair")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
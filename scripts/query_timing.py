@@ -0,0 +1,217 @@
+"""Opt-in SQL timing and EXPLAIN capture for psycopg2 maintenance scripts.
+
+Set FLEETIFY_QUERY_TIMING=1 and open connections through db_connection.connect()
+to time every execute(). Statements slower than FLEETIFY_SLOW_QUERY_MS
+(default 500) are recorded; read-only ones are re-run under
+EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) to capture the plan. When the script
+exits, the slow queries are written as JSON rows shaped like the
+api_slow_queries table to FLEETIFY_QUERY_REPORT (default
+query-timing-<script>-<timestamp>.json in the working directory).
+
+Example:
+    FLEETIFY_QUERY_TIMING=1 FLEETIFY_SLOW_QUERY_MS=200 python scripts/verify_health_v2.py
+"""
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2.extensions
+
+
+DEFAULT_THRESHOLD_MS = 500
+READ_ONLY_PATTERN = re.compile(r"^\s*(SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|ALTER|DROP|INTO)\b", re.IGNORECASE)
+COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def timing_enabled() -> bool:
+    return os.environ.get("FLEETIFY_QUERY_TIMING", "").lower() in ("1", "true", "yes", "on")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(COMMENT_PATTERN.sub(" ", query).split())
+
+
+def is_read_only(query: str) -> bool:
+    """Only plain reads are safe to re-execute under EXPLAIN ANALYZE."""
+    statement = COMMENT_PATTERN.sub(" ", query).strip().rstrip(";")
+    if ";" in statement or not READ_ONLY_PATTERN.match(statement):
+        return False
+    # Data-modifying CTEs and SELECT ... INTO also write.
+    return not WRITE_KEYWORDS.search(statement)
+
+
+def caller_frame() -> str:
+    """First stack frame outside psycopg2 and this module, for the report's stack_trace."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename != __file__ and "psycopg2" not in frame.filename:
+            return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return ""
+
+
+class SlowQueryLog:
+    """Per-run aggregate of slow statements, keyed by normalized query text."""
+
+    def __init__(self, threshold_ms: int, endpoint: str, company_id: str | None):
+        self.threshold_ms = threshold_ms
+        self.endpoint = endpoint
+        self.company_id = company_id
+        self.started_at = datetime.now(timezone.utc)
+        self.total_queries = 0
+        self.total_ms = 0.0
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, query: str, params, elapsed_ms: float, plan=None) -> None:
+        key = normalize_query(query)
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "endpoint_path": self.endpoint,
+                    "method": "SQL",
+                    "query_type": "database_query",
+                    "response_time": 0,
+                    "threshold_ms": self.threshold_ms,
+                    "frequency": 0,
+                    "query_text": key,
+                    "parameters": {"params": params, "total_ms": 0.0, "explain": None},
+                    "stack_trace": caller_frame(),
+                    "company_id": self.company_id,
+                    "first_seen": now,
+                    "last_seen": now,
+                    "status": "active",
+                }
+            entry["frequency"] += 1
+            entry["last_seen"] = now
+            entry["parameters"]["total_ms"] = round(entry["parameters"]["total_ms"] + elapsed_ms, 3)
+            if elapsed_ms >= entry["response_time"]:
+                entry["response_time"] = int(round(elapsed_ms))
+                entry["parameters"]["params"] = params
+                if plan is not None:
+                    entry["parameters"]["explain"] = plan
+
+    def count(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.total_queries += 1
+            self.total_ms += elapsed_ms
+
+    def rows(self) -> list[dict]:
+        return sorted(self._entries.values(), key=lambda entry: entry["response_time"], reverse=True)
+
+    def write(self, path: Path) -> None:
+        report = {
+            "endpoint_path": self.endpoint,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "threshold_ms": self.threshold_ms,
+            "total_queries": self.total_queries,
+            "total_ms": round(self.total_ms, 3),
+            "api_slow_queries": self.rows(),
+        }
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+
+
+_log: SlowQueryLog | None = None
+
+
+def get_log() -> SlowQueryLog:
+    """Create the run's log on first use and register the exit-time report."""
+    global _log
+    if _log is None:
+        script = Path(sys.argv[0] or "interactive").name
+        _log = SlowQueryLog(
+            threshold_ms=int(os.environ.get("FLEETIFY_SLOW_QUERY_MS", DEFAULT_THRESHOLD_MS)),
+            endpoint=script,
+            company_id=os.environ.get("FLEETIFY_COMPANY_ID"),
+        )
+        stamp = _log.started_at.strftime("%Y%m%dT%H%M%S")
+        report_path = Path(os.environ.get("FLEETIFY_QUERY_REPORT") or f"query-timing-{Path(script).stem}-{stamp}.json")
+        atexit.register(_write_report, report_path)
+    return _log
+
+
+def _write_report(path: Path) -> None:
+    log = _log
+    if log is None or log.total_queries == 0:
+        return
+    log.write(path)
+    print(
+        f"[query-timing] {log.total_queries} queries, {log.total_ms / 1000:.2f}s total, "
+        f"{len(log.rows())} slow (>{log.threshold_ms}ms) -> {path}",
+        file=sys.stderr,
+    )
+
+
+def jsonable_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {str(key): str(value) for key, value in params.items()}
+    return [str(value) for value in params]
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that times execute() and captures plans for slow read-only statements."""
+
+    def execute(self, query, vars=None):
+        log = get_log()
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            result = super().execute(query, vars)
+            succeeded = True
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            log.count(elapsed_ms)
+            if elapsed_ms >= log.threshold_ms:
+                text = query.decode() if isinstance(query, bytes) else str(query)
+                plan = self._explain(text, vars) if succeeded else None
+                log.record(text, jsonable_params(vars), elapsed_ms, plan)
+
+    def executemany(self, query, vars_list):
+        log = get_log()
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            log.count(elapsed_ms)
+            if elapsed_ms >= log.threshold_ms:
+                text = query.decode() if isinstance(query, bytes) else str(query)
+                log.record(text, None, elapsed_ms)
+
+    def _explain(self, query: str, vars):
+        if not is_read_only(query):
+            return None
+        connection = self.connection
+        if connection.closed or connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return None
+        # The EXPLAIN runs the statement again, so it is always rolled back: a
+        # read-only transaction in autocommit mode, a savepoint otherwise.
+        if connection.autocommit:
+            begin, undo = "BEGIN READ ONLY", "ROLLBACK"
+        else:
+            begin, undo = "SAVEPOINT query_timing_explain", "ROLLBACK TO SAVEPOINT query_timing_explain"
+        try:
+            # A plain cursor, so the EXPLAIN itself is not timed and does not disturb our result set.
+            with connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+                cursor.execute(begin)
+                try:
+                    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, vars)
+                    return cursor.fetchone()[0]
+                except psycopg2.Error as error:
+                    return {"error": str(error).strip()}
+                finally:
+                    cursor.execute(undo)
+        except psycopg2.Error as error:
+            return {"error": str(error).strip()}
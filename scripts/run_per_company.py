@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Run a single-company maintenance script for every company and merge the results.
+
+Companies are discovered from the companies table together with the tenants
+that belong to them. Each company runs the target script in its own process
+with FLEETIFY_COMPANY_ID set (see db_connection.get_company_id), bounded by a
+per-company timeout. Scripts that call db_connection.write_company_result()
+have their structured result merged into the combined report.
+
+Usage:
+    python scripts/run_per_company.py --workers 4 scripts/analyze_je_structure.py
+    python scripts/run_per_company.py --company <uuid> --timeout 900 scripts/fix_final_v3.py
+    python scripts/run_per_company.py --output out.json scripts/backfill-customer-id-proposal-evidence.py --limit 50
+
+Runner options go before the script path; everything after it is passed to the script.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2
+
+from db_connection import get_database_url
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+OUTPUT_TAIL_LINES = 40
+
+
+def discover_companies(
+    database_url: str,
+    *,
+    only: list[str] | None = None,
+    include_demo: bool = False,
+    require_tenants: bool = False,
+) -> list[dict]:
+    """Return companies with their tenant counts, in a stable order."""
+    query = """
+        SELECT c.id::text, c.name, COALESCE(c.is_demo, false), COUNT(t.id)
+        FROM companies c
+        LEFT JOIN tenants t ON t.company_id = c.id
+        GROUP BY c.id, c.name, c.is_demo
+        ORDER BY c.name, c.id
+    """
+    with psycopg2.connect(database_url, connect_timeout=10) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            rows = cursor.fetchall()
+
+    companies = []
+    for company_id, name, is_demo, tenant_count in rows:
+        if only and company_id not in only:
+            continue
+        if is_demo and not include_demo and not only:
+            continue
+        if require_tenants and tenant_count == 0:
+            continue
+        companies.append({
+            "company_id": company_id,
+            "name": name,
+            "is_demo": is_demo,
+            "tenant_count": tenant_count,
+        })
+    return companies
+
+
+def tail(text: str, lines: int = OUTPUT_TAIL_LINES) -> str:
+    return "\n".join(text.splitlines()[-lines:])
+
+
+def run_company(script: Path, script_args: list[str], company: dict, timeout: int) -> dict:
+    """Run the script for one company in a child process and collect its outcome."""
+    with tempfile.TemporaryDirectory(prefix="company-run-") as work_dir:
+        result_path = Path(work_dir) / "result.json"
+        env = {
+            **os.environ,
+            "FLEETIFY_COMPANY_ID": company["company_id"],
+            "FLEETIFY_RESULT_PATH": str(result_path),
+            "PYTHONIOENCODING": "utf-8",
+        }
+        started = time.monotonic()
+        outcome = {**company, "status": "ok", "returncode": None, "result": None}
+        try:
+            completed = subprocess.run(
+                [sys.executable, str(script), *script_args],
+                cwd=REPO_ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=timeout,
+            )
+            outcome["returncode"] = completed.returncode
+            if completed.returncode != 0:
+                outcome["status"] = "failed"
+            stdout, stderr = completed.stdout, completed.stderr
+        except subprocess.TimeoutExpired as error:
+            outcome["status"] = "timeout"
+            stdout = error.stdout or ""
+            stderr = error.stderr or ""
+            if isinstance(stdout, bytes):
+                stdout = stdout.decode("utf-8", errors="replace")
+            if isinstance(stderr, bytes):
+                stderr = stderr.decode("utf-8", errors="replace")
+
+        outcome["duration_seconds"] = round(time.monotonic() - started, 3)
+        outcome["stdout_tail"] = tail(stdout)
+        outcome["stderr_tail"] = tail(stderr)
+        if result_path.exists():
+            try:
+                outcome["result"] = json.loads(result_path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError as error:
+                outcome["result"] = {"error": f"Unreadable result file: {error}"}
+        return outcome
+
+
+def merge_report(script: Path, script_args: list[str], outcomes: list[dict], started_at: str) -> dict:
+    statuses = {"ok": 0, "failed": 0, "timeout": 0}
+    for outcome in outcomes:
+        statuses[outcome["status"]] += 1
+    return {
+        "script": str(script.relative_to(REPO_ROOT) if script.is_relative_to(REPO_ROOT) else script),
+        "script_args": script_args,
+        "started_at": started_at,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "company_count": len(outcomes),
+        "summary": statuses,
+        "companies": sorted(outcomes, key=lambda outcome: (outcome["name"] or "", outcome["company_id"])),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("script", type=Path, help="Script that reads db_connection.get_company_id()")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER, help="Arguments passed to the script")
+    parser.add_argument("--company", action="append", default=[], help="Limit to this company id (repeatable)")
+    parser.add_argument("--include-demo", action="store_true", help="Also run demo companies")
+    parser.add_argument("--require-tenants", action="store_true", help="Skip companies without tenants")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--timeout", type=int, default=600, help="Per-company timeout in seconds")
+    parser.add_argument("--output", type=Path, help="Write the merged JSON report here")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the companies that would run")
+    args = parser.parse_args()
+
+    script = args.script.resolve()
+    if not script.exists():
+        raise SystemExit(f"Script not found: {args.script}")
+
+    companies = discover_companies(
+        get_database_url(),
+        only=args.company,
+        include_demo=args.include_demo,
+        require_tenants=args.require_tenants,
+    )
+    print(f"Discovered {len(companies)} companies", flush=True)
+    if args.dry_run:
+        for company in companies:
+            print(f"  {company['company_id']}  tenants={company['tenant_count']:<6} {company['name']}")
+        return
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {
+            pool.submit(run_company, script, args.script_args, company, args.timeout): company
+            for company in companies
+        }
+        for index, future in enumerate(as_completed(futures), start=1):
+            outcome = future.result()
+            outcomes.append(outcome)
+            print(
+                f"[{index}/{len(companies)}] {outcome['status']:<7} "
+                f"{outcome['duration_seconds']:>8.1f}s {outcome['company_id']} {outcome['name']}",
+                flush=True,
+            )
+
+    report = merge_report(script, args.script_args, outcomes, started_at)
+    summary = report["summary"]
+    print(f"Complete: ok={summary['ok']} failed={summary['failed']} timeout={summary['timeout']}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"Report written to {args.output}")
+    if summary["failed"] or summary["timeout"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
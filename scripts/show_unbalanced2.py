@@ -1,21 +1,23 @@
 import json
+
+from ledger_engine import Ledger
+
 TMP = 'C:/Users/khamis/AppData/Local/Temp'
 with open(f'{TMP}/unbalanced_jes.json') as f:
     jes = json.load(f)
 with open(f'{TMP}/unbalanced_jel.json') as f:
     jels = json.load(f)
+
+ledger = Ledger.from_records(jes, jels)
+debit, credit, _ = ledger.entry_totals()
 print('=== UNBALANCED JEs ===')
-for je in jes:
+for i, je in enumerate(jes):
     print(f"{je['entry_number']}: id={je['id']}")
     print(f"  desc={je.get('description')} status={je.get('status')} ref_type={je.get('reference_type')} ref_id={je.get('reference_id')}")
     print(f"  total_debit={je.get('total_debit')} total_credit={je.get('total_credit')}")
     print(f"  company_id={je.get('company_id','?')[:8]}...")
-    lines = [l for l in jels if l.get('journal_entry_id') == je['id']]
-    for l in lines:
-        print(f"  Line {l.get('line_number')}: account={l.get('account_id','?')[:8]}... D={l.get('debit_amount')} C={l.get('credit_amount')} desc={l.get('line_description')}")
-    diff = float(je.get('total_debit',0)) - float(je.get('total_credit',0))
-    print(f"  HEADER diff={diff:.2f}")
-    line_sum_d = sum(float(l.get('debit_amount') or 0) for l in lines)
-    line_sum_c = sum(float(l.get('credit_amount') or 0) for l in lines)
-    print(f"  LINE sum: D={line_sum_d:.2f} C={line_sum_c:.2f} diff={line_sum_d-line_sum_c:.2f}")
+    for l in ledger.lines_of(i):
+        print(f"  Line {ledger.line_number[l]}: account={(ledger.line_account_id[l] or '?')[:8]}... D={ledger.fmt(ledger.line_debit[l])} C={ledger.fmt(ledger.line_credit[l])} desc={ledger.line_description[l]}")
+    print(f"  HEADER diff={ledger.fmt(ledger.entry_debit[i] - ledger.entry_credit[i])}")
+    print(f"  LINE sum: D={ledger.fmt(debit[i])} C={ledger.fmt(credit[i])} diff={ledger.fmt(debit[i] - credit[i])}")
     print()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Parallel ledger audit that reads one consistent snapshot across all workers.
+
+audit_full.py and diagnose_full.py run each query in autocommit mode, so checks
+can disagree with each other while payments are being posted. Here a
+coordinator connection opens a REPEATABLE READ, READ ONLY transaction and
+exports its snapshot with pg_export_snapshot(). Every worker process opens its
+own connection and imports that snapshot with SET TRANSACTION SNAPSHOT before
+running its check, so all checks see exactly the same ledger state while the
+work is spread across cores.
+
+The exported snapshot only exists while the coordinator transaction is open,
+and it needs a session-level connection: point SUPABASE_DB_URL at the direct
+database or the session pooler (port 5432), not the transaction pooler.
+
+Usage:
+    python scripts/snapshot_audit.py --company <uuid> --workers 6 --output audit.json
+    python scripts/snapshot_audit.py --check line_unbalanced --check header_vs_lines
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2
+import psycopg2.extras
+
+from db_connection import get_database_url
+
+
+TOLERANCE = 0.01
+
+# Every check is scoped by %(company_id)s; NULL means all companies.
+AUDIT_CHECKS = {
+    "header_unbalanced": (
+        "CRITICAL",
+        "Journal entry headers whose total_debit differs from total_credit",
+        """
+        SELECT id, entry_number, status, total_debit, total_credit,
+               total_debit - total_credit AS difference
+        FROM journal_entries
+        WHERE (%(company_id)s::uuid IS NULL OR company_id = %(company_id)s::uuid)
+          AND abs(total_debit - total_credit) > %(tolerance)s
+        ORDER BY abs(total_debit - total_credit) DESC
+        """,
+    ),
+    "line_unbalanced": (
+        "CRITICAL",
+        "Journal entries whose lines do not balance",
+        """
+        SELECT je.id, je.entry_number, je.status,
+               SUM(COALESCE(jel.debit_amount, 0)) AS line_debit,
+               SUM(COALESCE(jel.credit_amount, 0)) AS line_credit,
+               COUNT(*) AS line_count
+        FROM journal_entries je
+        JOIN journal_entry_lines jel ON jel.journal_entry_id = je.id
+        WHERE (%(company_id)s::uuid IS NULL OR je.company_id = %(company_id)s::uuid)
+        GROUP BY je.id, je.entry_number, je.status
+        HAVING abs(SUM(COALESCE(jel.debit_amount, 0)) - SUM(COALESCE(jel.credit_amount, 0))) > %(tolerance)s
+        """,
+    ),
+    "single_line_entries": (
+        "CRITICAL",
+        "Journal entries with fewer than two lines",
+        """
+        SELECT je.id, je.entry_number, je.status, COUNT(*) AS line_count
+        FROM journal_entries je
+        JOIN journal_entry_lines jel ON jel.journal_entry_id = je.id
+        WHERE (%(company_id)s::uuid IS NULL OR je.company_id = %(company_id)s::uuid)
+        GROUP BY je.id, je.entry_number, je.status
+        HAVING COUNT(*) < 2
+        """,
+    ),
+    "header_vs_lines": (
+        "HIGH",
+        "Journal entries whose header totals disagree with their line totals",
+        """
+        SELECT je.id, je.entry_number, je.total_debit, je.total_credit,
+               SUM(COALESCE(jel.debit_amount, 0)) AS line_debit,
+               SUM(COALESCE(jel.credit_amount, 0)) AS line_credit
+        FROM journal_entries je
+        JOIN journal_entry_lines jel ON jel.journal_entry_id = je.id
+        WHERE (%(company_id)s::uuid IS NULL OR je.company_id = %(company_id)s::uuid)
+        GROUP BY je.id, je.entry_number, je.total_debit, je.total_credit
+        HAVING abs(je.total_debit - SUM(COALESCE(jel.debit_amount, 0))) > %(tolerance)s
+            OR abs(je.total_credit - SUM(COALESCE(jel.credit_amount, 0))) > %(tolerance)s
+        """,
+    ),
+    "entries_without_lines": (
+        "HIGH",
+        "Journal entries that have no lines at all",
+        """
+        SELECT je.id, je.entry_number, je.status, je.total_debit
+        FROM journal_entries je
+        WHERE (%(company_id)s::uuid IS NULL OR je.company_id = %(company_id)s::uuid)
+          AND NOT EXISTS (SELECT 1 FROM journal_entry_lines jel WHERE jel.journal_entry_id = je.id)
+        """,
+    ),
+    "zero_amount_entries": (
+        "MEDIUM",
+        "Journal entries with zero debit and zero credit",
+        """
+        SELECT id, entry_number, status
+        FROM journal_entries
+        WHERE (%(company_id)s::uuid IS NULL OR company_id = %(company_id)s::uuid)
+          AND COALESCE(total_debit, 0) = 0 AND COALESCE(total_credit, 0) = 0
+        """,
+    ),
+    "invoices_overpaid": (
+        "HIGH",
+        "Invoices whose paid_amount exceeds total_amount",
+        """
+        SELECT id, invoice_number, total_amount, paid_amount, payment_status
+        FROM invoices
+        WHERE (%(company_id)s::uuid IS NULL OR company_id = %(company_id)s::uuid)
+          AND COALESCE(paid_amount, 0) - total_amount > %(tolerance)s
+        """,
+    ),
+    "invoice_paid_vs_payments": (
+        "HIGH",
+        "Invoices whose paid_amount disagrees with the completed payments linked to them",
+        """
+        SELECT i.id, i.invoice_number, i.paid_amount,
+               COALESCE(SUM(p.amount), 0) AS payments_total
+        FROM invoices i
+        LEFT JOIN payments p
+          ON p.invoice_id = i.id AND p.payment_status = 'completed'
+        WHERE (%(company_id)s::uuid IS NULL OR i.company_id = %(company_id)s::uuid)
+        GROUP BY i.id, i.invoice_number, i.paid_amount
+        HAVING abs(COALESCE(i.paid_amount, 0) - COALESCE(SUM(p.amount), 0)) > %(tolerance)s
+        """,
+    ),
+    "invoices_without_journal": (
+        "MEDIUM",
+        "Non-zero, non-cancelled invoices without a journal entry",
+        """
+        SELECT id, invoice_number, total_amount, status
+        FROM invoices
+        WHERE (%(company_id)s::uuid IS NULL OR company_id = %(company_id)s::uuid)
+          AND journal_entry_id IS NULL
+          AND total_amount > 0
+          AND status <> 'cancelled'
+        """,
+    ),
+    "entry_status_counts": (
+        "INFO",
+        "Journal entries by status",
+        """
+        SELECT status, COUNT(*) AS entries
+        FROM journal_entries
+        WHERE (%(company_id)s::uuid IS NULL OR company_id = %(company_id)s::uuid)
+        GROUP BY status
+        ORDER BY status
+        """,
+    ),
+}
+
+
+@contextmanager
+def exported_snapshot(database_url: str):
+    """Hold a REPEATABLE READ, READ ONLY transaction open and yield its snapshot id."""
+    connection = psycopg2.connect(database_url, connect_timeout=10)
+    try:
+        connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_export_snapshot(), now()")
+            snapshot_id, snapshot_time = cursor.fetchone()
+        yield snapshot_id, snapshot_time
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+@contextmanager
+def snapshot_connection(database_url: str, snapshot_id: str):
+    """Open a worker connection whose transaction reads the exported snapshot."""
+    connection = psycopg2.connect(database_url, connect_timeout=10)
+    try:
+        connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with connection.cursor() as cursor:
+            # SET TRANSACTION SNAPSHOT must be the first statement of the transaction.
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+        yield connection
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def run_check(database_url: str, snapshot_id: str, name: str, params: dict) -> dict:
+    """Worker entry point: run one named check inside the shared snapshot."""
+    severity, description, query = AUDIT_CHECKS[name]
+    started = time.monotonic()
+    with snapshot_connection(database_url, snapshot_id) as connection:
+        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+    return {
+        "check": name,
+        "severity": severity,
+        "description": description,
+        "count": len(rows),
+        "rows": [dict(row) for row in rows],
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "worker_pid": os.getpid(),
+    }
+
+
+def run_snapshot_audit(
+    database_url: str,
+    checks: list[str],
+    *,
+    company_id: str | None = None,
+    workers: int = 4,
+    tolerance: float = TOLERANCE,
+) -> dict:
+    params = {"company_id": company_id, "tolerance": tolerance}
+    started = time.monotonic()
+    results = []
+    with exported_snapshot(database_url) as (snapshot_id, snapshot_time):
+        print(f"Exported snapshot {snapshot_id} at {snapshot_time}", flush=True)
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(checks)))) as pool:
+            futures = [
+                pool.submit(run_check, database_url, snapshot_id, name, params)
+                for name in checks
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(
+                    f"  {result['check']:<26} {result['count']:>7} rows  "
+                    f"{result['duration_seconds']:>7.2f}s  pid={result['worker_pid']}",
+                    flush=True,
+                )
+
+    results.sort(key=lambda result: checks.index(result["check"]))
+    return {
+        "company_id": company_id,
+        "snapshot_id": snapshot_id,
+        "snapshot_time": snapshot_time.isoformat(),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "checks": results,
+    }
+
+
+def overall_risk(report: dict) -> str:
+    for severity in ("CRITICAL", "HIGH", "MEDIUM"):
+        if any(c["severity"] == severity and c["count"] for c in report["checks"]):
+            return severity
+    return "LOW"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company", help="Limit the audit to one company id (default: all companies)")
+    parser.add_argument("--check", action="append", choices=sorted(AUDIT_CHECKS), help="Run only these checks")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--output", type=Path, help="Write the full JSON report here")
+    args = parser.parse_args()
+
+    checks = args.check or list(AUDIT_CHECKS)
+    report = run_snapshot_audit(
+        get_database_url(),
+        checks,
+        company_id=args.company,
+        workers=args.workers,
+        tolerance=args.tolerance,
+    )
+
+    print("\n" + "=" * 60)
+    print(f"SNAPSHOT AUDIT ({report['snapshot_id']})")
+    print("=" * 60)
+    for check in report["checks"]:
+        print(f"[{check['severity']:<8}] {check['description']}: {check['count']}")
+        if check["severity"] != "INFO":
+            for row in check["rows"][:5]:
+                print(f"    {json.dumps(row, ensure_ascii=False, default=str)}")
+    print(f"\nOverall: {overall_risk(report)}  ({report['duration_seconds']}s)")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
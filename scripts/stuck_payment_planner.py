@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""Plan the release of payments stuck on PYINV* placeholder invoices and run each strategy as one bulk statement.
+
+A payment is stuck when an active invoice allocation, or its legacy
+payments.invoice_id link, points at a placeholder invoice (invoice_number
+starting with one of --prefix). Instead of trying PATCH after PATCH per payment
+and undoing the failures, everything the allocation controls check is read
+from one REPEATABLE READ snapshot:
+
+  invoice headroom   total_amount minus canonical paid (active allocations of
+                     completed receipts, plus legacy invoice_id links of
+                     receipts without allocations), as canonical_invoice_paid_amount
+  payment headroom   the placeholder amount being moved; kept allocations stay
+  legacy contract    contracts.total_paid + amount against contract_amount x 1.10
+  limits             and single payments against max(10 x monthly, 50000), only
+                     when prevent_overpayment_trigger or
+                     validate_payment_before_insert_or_update is still enabled
+
+Every stuck payment gets the one strategy those checks allow:
+
+  reallocate  completed receipt: the placeholder amount moves to real open
+              invoices of the same customer and contract, drained with
+              payment_allocator.allocate so receipts share the headroom in
+              payment order; any remainder becomes unallocated credit
+  unallocate  completed receipt with no headroom left: the placeholder
+              allocations are dropped and the other allocations kept
+  void        not a completed receipt, or holding non-invoice allocations that
+              replace_payment_invoice_allocations refuses: the placeholder
+              allocation rows are voided directly
+  resync      only a stale invoice_id link without allocations to fix:
+              sync_payment_allocation_state recomputes it
+  blocked     an enabled legacy trigger would reject the payment update
+
+--apply runs each strategy as a single statement in its own savepoint (the
+replace function and sync_payment_allocation_state over jsonb_to_recordset or
+unnest, or one UPDATE of the allocation rows), then recalculates the
+placeholder invoices. Receipts carry their allocations from the snapshot as the
+expected state, so a payment that changed since then fails its strategy's
+statement instead of being overwritten; that strategy is rolled back and
+reported, the others still commit.
+
+Usage:
+    python scripts/stuck_payment_planner.py
+    python scripts/stuck_payment_planner.py --format csv --output stuck-payments.csv
+    python scripts/stuck_payment_planner.py --apply --reason "Release PYINV placeholder payments"
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal
+
+from db_connection import connect, get_company_id
+from money import company_scale, minor_array, to_major
+from payment_allocator import RULES, allocate
+
+
+PLACEHOLDER_PREFIXES = ("PYINV-", "PYINV2-", "PYINV3-")
+STRATEGIES = ("reallocate", "unallocate", "void", "resync", "blocked")
+LEGACY_TRIGGERS = ("prevent_overpayment_trigger", "validate_payment_before_insert_or_update")
+# allocate() only builds contract queues for truthy contract ids; payments and
+# invoices without a contract still have to match each other exactly.
+NO_CONTRACT = "-"
+
+INVOICES = """
+    SELECT i.id, i.invoice_number, i.customer_id, i.contract_id, COALESCE(i.invoice_date, i.due_date),
+           COALESCE(i.due_date, i.invoice_date), COALESCE(i.total_amount, 0),
+           COALESCE(i.invoice_number, '') LIKE ANY(%(patterns)s),
+           lower(COALESCE(i.status, '')) IN ('cancelled', 'canceled', 'void', 'voided', 'deleted')
+               OR lower(COALESCE(i.payment_status, '')) IN ('cancelled', 'canceled', 'void', 'voided')
+    FROM invoices i
+    WHERE i.company_id = %(company)s
+"""
+PAYMENTS = """
+    SELECT p.id, p.payment_number, p.customer_id, p.contract_id, p.payment_date, p.created_at,
+           COALESCE(p.amount, 0), p.invoice_id,
+           lower(COALESCE(p.payment_status, '')) IN ('completed', 'paid', 'success', 'succeeded')
+               AND lower(COALESCE(p.transaction_type::text, 'receipt')) = 'receipt',
+           COALESCE(a.other_types, false), COALESCE(a.expected, '[]')
+    FROM payments p
+    LEFT JOIN (
+        SELECT payment_id,
+               bool_or(allocation_type <> 'invoice') AS other_types,
+               (COALESCE(jsonb_agg(jsonb_build_object('invoice_id', target_id, 'amount', amount) ORDER BY allocation_order)
+                   FILTER (WHERE allocation_type = 'invoice'), '[]'))::text AS expected
+        FROM payment_allocations
+        WHERE company_id = %(company)s AND is_active
+        GROUP BY payment_id
+    ) a ON a.payment_id = p.id
+    WHERE p.company_id = %(company)s
+"""
+ALLOCATIONS = """
+    SELECT id, payment_id, target_id, amount
+    FROM payment_allocations
+    WHERE company_id = %(company)s AND is_active AND allocation_type = 'invoice'
+    ORDER BY payment_id, allocation_order
+"""
+CONTRACTS = """
+    SELECT id, COALESCE(contract_amount, 0), COALESCE(monthly_amount, 0), COALESCE(total_paid, 0)
+    FROM contracts
+    WHERE company_id = %(company)s
+"""
+ENABLED_LEGACY_TRIGGERS = """
+    SELECT tgname
+    FROM pg_trigger
+    WHERE tgrelid = 'public.payments'::regclass
+      AND NOT tgisinternal
+      AND tgenabled <> 'D'
+      AND tgname = ANY(%(names)s)
+"""
+REPLACE_ALLOCATIONS = """
+    SELECT count(replace_payment_invoice_allocations(
+        plan.payment_id, %(company)s, plan.allocations, %(reason)s, plan.expected::jsonb, %(actor)s
+    ))
+    FROM jsonb_to_recordset(%(plans)s::jsonb) AS plan(payment_id uuid, allocations jsonb, expected text)
+"""
+VOID_ALLOCATIONS = """
+    UPDATE payment_allocations
+    SET is_active = false, voided_at = now(), voided_by = %(actor)s, void_reason = %(reason)s, updated_at = now()
+    WHERE id = ANY(%(ids)s::uuid[]) AND is_active
+"""
+SYNC_PAYMENTS = "SELECT count(sync_payment_allocation_state(id)) FROM unnest(%(ids)s::uuid[]) AS id"
+RECALCULATE_INVOICES = "SELECT count(recalculate_invoice_financial_state(id)) FROM unnest(%(ids)s::uuid[]) AS id"
+
+
+@dataclass
+class Snapshot:
+    invoices: list[tuple]
+    payments: list[tuple]
+    allocations: list[tuple]
+    contracts: list[tuple]
+    legacy_triggers: list[str]
+    scale: int
+
+
+@dataclass
+class Repair:
+    payment_id: str
+    payment_number: str
+    payment_date: str
+    customer_id: str | None
+    contract_id: str | None
+    amount: Decimal
+    strategy: str
+    stuck_amount: Decimal
+    moved_amount: Decimal
+    placeholders: str
+    targets: str
+    reason: str
+    placeholder_ids: list[str] = field(default_factory=list)
+    void_ids: list[str] = field(default_factory=list)
+    allocations: list[dict] = field(default_factory=list)
+    expected: str = "[]"
+
+
+CSV_FIELDS = [name for name in Repair.__dataclass_fields__ if name not in ("placeholder_ids", "void_ids", "allocations", "expected")]
+
+
+def load_snapshot(cursor, company_id: str, prefixes=PLACEHOLDER_PREFIXES) -> Snapshot:
+    """Everything plan_repairs needs, read in the cursor's (REPEATABLE READ) transaction."""
+    params = {"company": company_id, "patterns": [prefix + "%" for prefix in prefixes]}
+    cursor.execute(INVOICES, params)
+    invoices = cursor.fetchall()
+    cursor.execute(PAYMENTS, params)
+    payments = cursor.fetchall()
+    cursor.execute(ALLOCATIONS, params)
+    allocations = cursor.fetchall()
+    cursor.execute(CONTRACTS, params)
+    contracts = cursor.fetchall()
+    cursor.execute(ENABLED_LEGACY_TRIGGERS, {"names": list(LEGACY_TRIGGERS)})
+    legacy = [row[0] for row in cursor.fetchall()]
+    return Snapshot(invoices, payments, allocations, contracts, legacy, company_scale(cursor, company_id))
+
+
+def legacy_rejection(amount: Decimal, contract: tuple | None) -> str | None:
+    """Why validate_payment_amount would reject an update of this payment, or None."""
+    if contract is None or amount <= 0:
+        return None
+    contract_amount, monthly, total_paid = (Decimal(str(value)) for value in contract[1:])
+    if monthly > 0 and amount > max(monthly * 10, Decimal(50000)):
+        return f"legacy trigger: payment above max(10 x monthly {monthly}, 50000)"
+    if contract_amount > 0 and total_paid + amount > contract_amount * Decimal("1.10"):
+        return f"legacy trigger: contract total_paid {total_paid} + {amount} above 110% of {contract_amount}"
+    return None
+
+
+def plan_repairs(snapshot: Snapshot, *, rule: str = "fifo", allow_future: bool = False) -> list[Repair]:
+    """One Repair per stuck payment, with every reallocation fitting the snapshot's headroom."""
+    scale = snapshot.scale
+    invoice_index = {str(row[0]): i for i, row in enumerate(snapshot.invoices)}
+    placeholder = {str(row[0]) for row in snapshot.invoices if row[7]}
+    contracts = {str(row[0]): row for row in snapshot.contracts}
+    by_payment = defaultdict(list)
+    for row in snapshot.allocations:
+        by_payment[str(row[1])].append(row)
+
+    # Canonical paid per invoice, in minor units.
+    paid = [0] * len(snapshot.invoices)
+    receipts = {str(row[0]) for row in snapshot.payments if row[8]}
+    for row in snapshot.allocations:
+        target = invoice_index.get(str(row[2]))
+        if target is not None and str(row[1]) in receipts:
+            paid[target] += int(minor_array([row[3]], scale)[0])
+    for row in snapshot.payments:
+        payment_id = str(row[0])
+        if row[8] and row[7] and payment_id not in by_payment and str(row[7]) in invoice_index:
+            paid[invoice_index[str(row[7])]] += int(minor_array([row[6]], scale)[0])
+    totals = minor_array([row[6] for row in snapshot.invoices], scale)
+    open_invoices = [
+        (row[0], row[1], row[2], row[3] or NO_CONTRACT, row[4], row[5], to_major(int(totals[i]) - paid[i], scale))
+        for i, row in enumerate(snapshot.invoices)
+        if not row[7] and not row[8] and row[2] is not None and row[4] is not None and int(totals[i]) > paid[i]
+    ]
+
+    repairs = []
+    movable = []
+    for row in snapshot.payments:
+        payment_id, number, customer_id, contract_id, paid_on, created_at, amount, invoice_id, receipt, other_types, expected = row
+        payment_id = str(payment_id)
+        stuck = [a for a in by_payment.get(payment_id, ()) if str(a[2]) in placeholder]
+        linked = invoice_id is not None and str(invoice_id) in placeholder
+        if not stuck and not linked:
+            continue
+        amount = Decimal(str(amount))
+        placeholder_ids = sorted({str(a[2]) for a in stuck} | ({str(invoice_id)} if linked else set()))
+        repair = Repair(
+            payment_id, number, str(paid_on)[:10], str(customer_id) if customer_id else None,
+            str(contract_id) if contract_id else None, amount, "",
+            sum((Decimal(str(a[3])) for a in stuck), Decimal(0)) if stuck else amount, Decimal(0),
+            ";".join(str(snapshot.invoices[invoice_index[i]][1]) for i in placeholder_ids), "", "",
+            placeholder_ids=placeholder_ids, expected=expected,
+        )
+        repairs.append(repair)
+
+        rejection = legacy_rejection(amount, contracts.get(repair.contract_id)) if snapshot.legacy_triggers else None
+        if rejection:
+            repair.strategy, repair.reason = "blocked", rejection
+        elif receipt and not other_types and (stuck or payment_id not in by_payment):
+            repair.allocations = [
+                {"invoice_id": str(a[2]), "amount": Decimal(str(a[3]))}
+                for a in by_payment.get(payment_id, ()) if str(a[2]) not in placeholder
+            ]
+            if customer_id is not None and paid_on is not None:
+                movable.append((payment_id, number, customer_id, contract_id or NO_CONTRACT, paid_on, created_at, repair.stuck_amount))
+            repair.strategy = "unallocate"
+            repair.reason = "no open invoice headroom for this customer and contract"
+        elif stuck:
+            repair.strategy, repair.void_ids = "void", [str(a[0]) for a in stuck]
+            repair.reason = "has non-invoice allocations" if receipt else "not a completed receipt"
+        else:
+            repair.strategy, repair.reason = "resync", "stale invoice_id link"
+
+    moves = allocate(open_invoices, movable, rule=rule, scope="contract", allow_future=allow_future, scale=scale)
+    planned = {repair.payment_id: repair for repair in repairs}
+    for move in moves:
+        repair = planned[move.payment_id]
+        current = next((a for a in repair.allocations if a["invoice_id"] == move.invoice_id), None)
+        if current is None:
+            repair.allocations.append({"invoice_id": move.invoice_id, "amount": move.amount})
+        else:
+            current["amount"] += move.amount
+        repair.moved_amount += move.amount
+        repair.targets = ";".join(filter(None, (repair.targets, str(move.invoice_number))))
+        repair.strategy = "reallocate"
+        repair.reason = ("placeholder amount moved to open invoices" if repair.moved_amount == repair.stuck_amount
+                         else "partly moved; the rest stays unallocated")
+    return repairs
+
+
+def apply_repairs(connection, company_id: str, repairs: list[Repair], reason: str,
+                  actor_id: str | None = None) -> dict[str, str]:
+    """Run each strategy as one statement under its own savepoint and commit what succeeded."""
+    outcomes = {}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('request.jwt.claim.role', 'service_role', false)")
+        for strategy in STRATEGIES[:-1]:
+            group = [repair for repair in repairs if repair.strategy == strategy]
+            if not group:
+                continue
+            cursor.execute("SAVEPOINT repair_strategy")
+            try:
+                if strategy == "void":
+                    ids = [allocation_id for repair in group for allocation_id in repair.void_ids]
+                    cursor.execute(VOID_ALLOCATIONS, {"ids": ids, "reason": reason, "actor": actor_id})
+                    done, expected = cursor.rowcount, len(ids)
+                elif strategy == "resync":
+                    cursor.execute(SYNC_PAYMENTS, {"ids": [repair.payment_id for repair in group]})
+                    done, expected = cursor.fetchone()[0], len(group)
+                else:
+                    plans = [{
+                        "payment_id": repair.payment_id,
+                        "allocations": [{"invoice_id": a["invoice_id"], "amount": str(a["amount"])} for a in repair.allocations],
+                        "expected": repair.expected,
+                    } for repair in group]
+                    cursor.execute(REPLACE_ALLOCATIONS, {
+                        "company": company_id, "reason": reason, "actor": actor_id, "plans": json.dumps(plans),
+                    })
+                    done, expected = cursor.fetchone()[0], len(group)
+                if done != expected:
+                    raise RuntimeError(f"{done} of {expected} rows still matched the snapshot")
+                cursor.execute("RELEASE SAVEPOINT repair_strategy")
+                outcomes[strategy] = f"{len(group)} payments"
+            except Exception as error:
+                cursor.execute("ROLLBACK TO SAVEPOINT repair_strategy")
+                outcomes[strategy] = f"rolled back ({str(error).strip().splitlines()[0]})"
+        placeholders = sorted({i for repair in repairs if repair.strategy != "blocked" for i in repair.placeholder_ids})
+        cursor.execute(RECALCULATE_INVOICES, {"ids": placeholders})
+    connection.commit()
+    return outcomes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company (default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--prefix", action="append", help=f"Placeholder invoice_number prefix (default {', '.join(PLACEHOLDER_PREFIXES)})")
+    parser.add_argument("--rule", choices=RULES, default="fifo", help="Order open invoices are drained in")
+    parser.add_argument("--allow-future", action="store_true", help="Also move onto invoices issued after the receipt")
+    parser.add_argument("--format", choices=("console", "csv", "json"), default="console")
+    parser.add_argument("--output", help="Write csv or json here instead of stdout")
+    parser.add_argument("--apply", action="store_true", help="Run the plan (default is a dry run)")
+    parser.add_argument("--reason", help="Reason recorded on changed allocations with --apply")
+    parser.add_argument("--actor-id", help="User recorded as the actor with --apply")
+    args = parser.parse_args()
+    if args.apply and not args.reason:
+        parser.error("--apply needs --reason")
+
+    company_id = args.company_id or get_company_id()
+    started = time.perf_counter()
+    connection = connect(connect_timeout=10)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            snapshot = load_snapshot(cursor, company_id, tuple(args.prefix or PLACEHOLDER_PREFIXES))
+        connection.rollback()
+        loaded = time.perf_counter() - started
+        repairs = plan_repairs(snapshot, rule=args.rule, allow_future=args.allow_future)
+        planned = time.perf_counter() - started - loaded
+
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            if args.format == "csv":
+                writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(asdict(repair) for repair in repairs)
+            elif args.format == "json":
+                json.dump([asdict(repair) for repair in repairs], out, ensure_ascii=False, indent=2, default=str)
+                out.write("\n")
+        finally:
+            if args.output:
+                out.close()
+
+        log = sys.stderr if args.format != "console" and not args.output else sys.stdout
+        counts = Counter(repair.strategy for repair in repairs)
+        amounts = defaultdict(Decimal)
+        for repair in repairs:
+            amounts[repair.strategy] += repair.stuck_amount
+        print(f"{len(repairs)} stuck payments (loaded in {loaded:.1f}s, planned in {planned:.2f}s)", file=log)
+        if snapshot.legacy_triggers:
+            print(f"  legacy triggers enabled on payments: {', '.join(snapshot.legacy_triggers)}", file=log)
+        for strategy in STRATEGIES:
+            if counts[strategy]:
+                moved = sum((r.moved_amount for r in repairs if r.strategy == strategy), Decimal(0))
+                print(f"  {strategy:<11} {counts[strategy]:>6} payments  {amounts[strategy]:>14,} stuck"
+                      + (f"  {moved:,} moved" if moved else ""), file=log)
+        if args.format == "console":
+            for repair in repairs[:20]:
+                print(f"    {repair.payment_number or repair.payment_id[:8]:<20} {repair.strategy:<11} "
+                      f"{repair.stuck_amount:>12,} {repair.placeholders} -> {repair.targets or '-'}  ({repair.reason})")
+
+        if args.apply:
+            outcomes = apply_repairs(connection, company_id, repairs, args.reason, args.actor_id)
+            for strategy, outcome in outcomes.items():
+                print(f"  {strategy}: {outcome}")
+        elif repairs:
+            print("Dry run: nothing written (use --apply)", file=log)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
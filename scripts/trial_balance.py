@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Trial balance computed straight from journal_entry_lines.
+
+Opening, period and closing balances per account are grouped sums over the
+ledger engine's line arrays, so the result does not depend on
+chart_of_accounts.current_balance or on update_account_balances_from_entries
+having just run. Balances are signed by the account's balance_type, like the
+RPC (NULL counts as credit), and roll up the parent_account_id hierarchy, by account type and by month.
+
+Usage:
+    python scripts/trial_balance.py --start 2025-01-01 --end 2025-12-31
+    python scripts/trial_balance.py --by-period --format csv --output tb.csv
+    python scripts/trial_balance.py --entries je.json --lines jel.json --accounts coa.json
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+import numpy as np
+
+from db_connection import get_company_id
+from ledger_engine import Ledger, load_ledger, period_label
+from money import group_sum
+
+
+POSTED = ("posted",)
+# Both spellings occur in chart_of_accounts and in the migrations.
+INCOME_TYPES = ("revenue", "income")
+EXPENSE_TYPES = ("expenses", "expense")
+
+
+@dataclass
+class TrialBalance:
+    ledger: Ledger
+    accounts: np.ndarray  # account indexes in the trial balance, ordered by code
+    sign: np.ndarray  # +1 for debit-nature accounts, -1 for credit-nature
+    opening: np.ndarray  # natural-sign balance before start, per account, in minor units
+    debit: np.ndarray  # period movements
+    credit: np.ndarray
+    closing: np.ndarray
+    rolled_closing: np.ndarray  # closing including all descendant accounts
+    start: str | None
+    end: str | None
+
+    def rows(self) -> list[dict]:
+        ledger = self.ledger
+        return [
+            {
+                "account_code": ledger.account_code[a],
+                "account_name": ledger.account_name[a],
+                "account_type": ledger.account_type_name(a),
+                "level": int(ledger.account_level[a]),
+                "is_header": bool(ledger.account_is_header[a]),
+                "opening": ledger.major(self.opening[a]),
+                "debit": ledger.major(self.debit[a]),
+                "credit": ledger.major(self.credit[a]),
+                "closing": ledger.major(self.closing[a]),
+                "rolled_closing": ledger.major(self.rolled_closing[a]),
+            }
+            for a in self.accounts.tolist()
+        ]
+
+    def by_type(self) -> dict[str, int]:
+        """Closing natural-sign balance per account type, in minor units."""
+        ledger = self.ledger
+        totals = group_sum(ledger.account_type[self.accounts], self.closing[self.accounts], len(ledger.account_types))
+        return {str(name): int(total) for name, total in zip(ledger.account_types, totals)}
+
+    def equation(self) -> dict[str, Decimal]:
+        """Assets against liabilities + equity, with and without unclosed net income."""
+        types = self.by_type()
+        assets, liabilities, equity = (types.get(t, 0) for t in ("assets", "liabilities", "equity"))
+        net_income = sum(types.get(t, 0) for t in INCOME_TYPES) - sum(types.get(t, 0) for t in EXPENSE_TYPES)
+        major = self.ledger.major
+        return {
+            **{name: major(value) for name, value in sorted(types.items())},
+            "net_income": major(net_income),
+            "difference": major(assets - (liabilities + equity)),
+            "difference_with_net_income": major(assets - (liabilities + equity + net_income)),
+        }
+
+    def totals(self) -> dict[str, Decimal]:
+        return {"debit": self.ledger.major(self.debit.sum()), "credit": self.ledger.major(self.credit.sum())}
+
+
+def balance_sign(balance_type) -> int:
+    """+1 for a debit balance_type, else -1: NULL is credit, as in update_account_balances_from_entries."""
+    return 1 if str(balance_type or "").lower() == "debit" else -1
+
+
+def natural_sign(ledger: Ledger) -> np.ndarray:
+    """balance_sign of every account."""
+    return np.array([balance_sign(b) for b in ledger.account_balance_type], dtype=np.int64)
+
+
+def resolve_parents(ledger: Ledger) -> np.ndarray:
+    """parent_account_id, falling back to parent_account_code within the same company."""
+    parents = ledger.account_parent.copy()
+    by_code = {
+        (company, code): a
+        for a, (company, code) in enumerate(zip(ledger.account_company.tolist(), ledger.account_code))
+    }
+    for a in np.flatnonzero(parents < 0).tolist():
+        if ledger.account_parent_code[a]:
+            parents[a] = by_code.get((int(ledger.account_company[a]), ledger.account_parent_code[a]), -1)
+    parents[parents == np.arange(len(parents))] = -1
+    return parents
+
+
+def account_depths(parents: np.ndarray) -> np.ndarray:
+    """Depth of every account under its root, in one vectorized step per level."""
+    depth = np.zeros(len(parents), dtype=np.int32)
+    ancestor = parents.copy()
+    for _ in range(len(parents)):
+        has_parent = ancestor >= 0
+        if not has_parent.any():
+            break
+        depth += has_parent
+        ancestor = np.where(has_parent, parents[np.maximum(ancestor, 0)], -1)
+    return depth
+
+
+def roll_up(values: np.ndarray, parents: np.ndarray) -> np.ndarray:
+    """Add every account's value into all its ancestors, deepest level first."""
+    rolled = values.astype(np.int64)
+    depth = account_depths(parents)
+    for level in range(int(depth.max(initial=0)), 0, -1):
+        children = np.flatnonzero((depth == level) & (parents >= 0))
+        np.add.at(rolled, parents[children], rolled[children])
+    return rolled
+
+
+def compute_trial_balance(
+    ledger: Ledger,
+    start=None,
+    end=None,
+    *,
+    company_id: str | None = None,
+    statuses=POSTED,
+) -> TrialBalance:
+    sign = natural_sign(ledger)
+    base = ledger.line_mask(statuses=statuses, company_id=company_id)
+    if start is not None:
+        opening_d, opening_c = ledger.account_balances(base & ledger.line_mask(end=np.datetime64(str(start)) - 1))
+    else:
+        opening_d = opening_c = np.zeros(ledger.n_accounts, dtype=np.int64)
+    debit, credit = ledger.account_balances(base & ledger.line_mask(start=start, end=end))
+
+    opening = sign * (opening_d - opening_c)
+    closing = opening + sign * (debit - credit)
+    accounts = np.arange(ledger.n_accounts)
+    if company_id is not None:
+        accounts = accounts[ledger.account_company == ledger.company_code(company_id)]
+    accounts = accounts[np.argsort(ledger.account_code[accounts].astype(str), kind="stable")]
+
+    # A child's natural-sign balance is re-signed into its parent's nature.
+    signed = roll_up(sign * closing, resolve_parents(ledger))
+    return TrialBalance(
+        ledger=ledger,
+        accounts=accounts,
+        sign=sign,
+        opening=opening,
+        debit=debit,
+        credit=credit,
+        closing=closing,
+        rolled_closing=sign * signed,
+        start=None if start is None else str(start),
+        end=None if end is None else str(end),
+    )
+
+
+def period_movements(
+    ledger: Ledger,
+    start=None,
+    end=None,
+    *,
+    company_id: str | None = None,
+    statuses=POSTED,
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """Month labels and (accounts x months) debit and credit matrices in minor units, one grouped sum each."""
+    mask = ledger.line_mask(statuses=statuses, start=start, end=end, company_id=company_id)
+    mask &= ledger.line_account >= 0
+    periods = ledger.entry_period[ledger.line_entry[mask]]
+    labels, column = np.unique(periods, return_inverse=True)
+    cells = ledger.line_account[mask].astype(np.int64) * len(labels) + column
+    shape = (ledger.n_accounts, len(labels))
+    debit = group_sum(cells, ledger.line_debit[mask], shape[0] * shape[1]).reshape(shape)
+    credit = group_sum(cells, ledger.line_credit[mask], shape[0] * shape[1]).reshape(shape)
+    return [period_label(int(p)) for p in labels], debit, credit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", help="Company to report (default FLEETIFY_COMPANY_ID)")
+    parser.add_argument("--start", help="First entry_date of the period (opening balance is everything before)")
+    parser.add_argument("--end", help="Last entry_date of the period")
+    parser.add_argument("--status", action="append", help="Entry statuses to include (default posted)")
+    parser.add_argument("--by-period", action="store_true", help="Also report monthly movements per account")
+    parser.add_argument("--entries", help="journal_entries JSON dump instead of the database")
+    parser.add_argument("--lines", help="journal_entry_lines JSON dump")
+    parser.add_argument("--accounts", help="chart_of_accounts JSON dump")
+    parser.add_argument("--format", choices=("console", "csv", "json"), default="console")
+    parser.add_argument("--output", help="Write csv/json here instead of stdout")
+    args = parser.parse_args()
+
+    company_id = args.company_id or get_company_id()
+    started = time.perf_counter()
+    if args.entries or args.lines or args.accounts:
+        if not (args.entries and args.lines and args.accounts):
+            parser.error("--entries, --lines and --accounts must be given together")
+        ledger = Ledger.from_json_files(args.entries, args.lines, args.accounts)
+    else:
+        ledger = load_ledger([company_id])
+    loaded = time.perf_counter()
+    statuses = args.status or POSTED
+    tb = compute_trial_balance(ledger, args.start, args.end, company_id=company_id, statuses=statuses)
+    rows = tb.rows()
+    if args.by_period:
+        labels, debit, credit = period_movements(
+            ledger, args.start, args.end, company_id=company_id, statuses=statuses
+        )
+        for row, a in zip(rows, tb.accounts.tolist()):
+            row["periods"] = {
+                label: {"debit": ledger.major(d), "credit": ledger.major(c)}
+                for label, d, c in zip(labels, debit[a], credit[a])
+                if d or c
+            }
+    computed = time.perf_counter()
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump({
+                "company_id": company_id,
+                "start": tb.start,
+                "end": tb.end,
+                "statuses": list(statuses),
+                "totals": tb.totals(),
+                "equation": tb.equation(),
+                "accounts": rows,
+            }, out, ensure_ascii=False, indent=2, default=str)
+        elif args.format == "csv":
+            writer = csv.DictWriter(out, fieldnames=[k for k in rows[0] if k != "periods"] if rows else [])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({k: v for k, v in row.items() if k != "periods"})
+        else:
+            print(f"{'Code':<12} {'Account':<40} {'Opening':>15} {'Debit':>15} {'Credit':>15} {'Closing':>15}", file=out)
+            for row in rows:
+                if row["opening"] or row["debit"] or row["credit"] or row["rolled_closing"]:
+                    print(
+                        f"{row['account_code'] or '':<12} {str(row['account_name'] or '')[:40]:<40} "
+                        f"{row['opening']:>15,} {row['debit']:>15,} {row['credit']:>15,} "
+                        f"{row['rolled_closing'] if row['is_header'] else row['closing']:>15,}",
+                        file=out,
+                    )
+                    for label, movement in row.get("periods", {}).items():
+                        print(f"{'':<12}   {label:<37} {'':>15} {movement['debit']:>15,} {movement['credit']:>15,}", file=out)
+            totals = tb.totals()
+            print(f"\nTotals: D={totals['debit']:,} C={totals['credit']:,}", file=out)
+            equation = tb.equation()
+            print("Equation: " + "  ".join(f"{k}={v:,}" for k, v in equation.items()), file=out)
+            verdict = "FAIL" if equation["difference_with_net_income"] else "PASS"
+            print(f"{verdict}: A = L + E + net income", file=out)
+    finally:
+        if args.output:
+            out.close()
+    print(
+        f"{ledger.n_lines} lines, {len(rows)} accounts: load {loaded - started:.2f}s, "
+        f"trial balance {computed - loaded:.3f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
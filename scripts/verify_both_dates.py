@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
-import psycopg2
 from datetime import datetime
-from db_connection import get_database_url
+from db_connection import connect
 
-conn = psycopg2.connect(get_database_url())
+conn = connect()
 conn.autocommit = True
 cur = conn.cursor()
 
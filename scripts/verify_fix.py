@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 """Verify the auto-fix flow works end-to-end for a problematic contract."""
-import psycopg2
 from datetime import datetime, timedelta
-from db_connection import get_database_url
+from db_connection import connect, get_database_url
 
 DB_URL = get_database_url()
 
-conn = psycopg2.connect(DB_URL)
+conn = connect(DB_URL)
 conn.autocommit = True
 cur = conn.cursor()
 
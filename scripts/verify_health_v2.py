@@ -3,11 +3,10 @@
 Check ALL contracts: how many would still show 'missing invoices'
 using the same logic as the fixed health analysis.
 """
-import psycopg2
 from datetime import datetime
-from db_connection import get_database_url
+from db_connection import connect
 
-conn = psycopg2.connect(get_database_url())
+conn = connect()
 conn.autocommit = True
 cur = conn.cursor()
 
@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
 """Verify gap=1 contract would be fixed by auto-fix."""
-import psycopg2
 from datetime import datetime
-from db_connection import get_database_url
+from db_connection import connect
 
-conn = psycopg2.connect(get_database_url())
+conn = connect()
 conn.autocommit = True
 cur = conn.cursor()
 
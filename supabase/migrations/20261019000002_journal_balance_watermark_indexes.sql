@@ -0,0 +1,11 @@
+-- Watermark scans for the incremental account-balance maintainer
+-- (scripts/balance_maintainer.py) and the GL index refresh (scripts/gl_index.py):
+-- entries and lines changed since the last sync are found by range scans
+-- instead of full-table scans. Lines are watched by updated_at because editing
+-- a line's amount or account does not touch its entry.
+
+CREATE INDEX IF NOT EXISTS idx_journal_entries_updated_at
+  ON public.journal_entries (updated_at);
+
+CREATE INDEX IF NOT EXISTS idx_journal_entry_lines_updated_at
+  ON public.journal_entry_lines (updated_at);
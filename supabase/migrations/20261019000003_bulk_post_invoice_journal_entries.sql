@@ -0,0 +1,233 @@
+-- Set-based invoice -> journal posting for maintenance clients
+-- (scripts/invoice_posting.py).
+--
+-- post_invoice_journal_entries takes a jsonb array of invoice ids and, in a
+-- handful of set-based statements, does what trg_invoice_journal_entry_fn does
+-- per invoice: create the journal entry and its lines from account_mappings,
+-- post it and store journal_entry_id on the invoice. Created entries are
+-- matched back to their invoices by reference_id, never by position, and an
+-- invoice that already has exactly one company-scoped 'invoice' reference
+-- journal is linked to it instead of getting a second one; an invoice with
+-- several is left unlinked as ambiguous_existing for manual review.
+--
+-- One row is returned per requested id with its outcome:
+--   posted, linked_existing, ambiguous_existing, already_linked, not_found,
+--   zero_amount, missing_accounts, period_locked
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.post_invoice_journal_entries(
+  p_invoice_ids jsonb
+)
+RETURNS TABLE (invoice_id uuid, journal_entry_id uuid, outcome text)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = pg_catalog, public, pg_temp
+AS $$
+#variable_conflict use_column
+DECLARE
+  v_previous_bypass text := COALESCE(
+    current_setting('app.financial_controls_bypass', true),
+    ''
+  );
+BEGIN
+  IF jsonb_typeof(p_invoice_ids) <> 'array' THEN
+    RAISE EXCEPTION 'p_invoice_ids must be a jsonb array of invoice ids'
+      USING ERRCODE = '22023';
+  END IF;
+
+  -- Lock the invoices first so the link state read below is current and a
+  -- concurrent run cannot create a second journal for them.
+  PERFORM 1
+  FROM public.invoices inv
+  WHERE inv.id IN (SELECT value::uuid FROM jsonb_array_elements_text(p_invoice_ids))
+  ORDER BY inv.id
+  FOR UPDATE;
+
+  DROP TABLE IF EXISTS pg_temp.invoice_posting_batch;
+  CREATE TEMP TABLE invoice_posting_batch (
+    invoice_id uuid PRIMARY KEY,
+    company_id uuid,
+    invoice_number text,
+    entry_date date,
+    total_amount numeric,
+    tax_amount numeric,
+    created_by uuid,
+    ar_account_id uuid,
+    revenue_account_id uuid,
+    tax_account_id uuid,
+    journal_entry_id uuid,
+    outcome text
+  ) ON COMMIT DROP;
+
+  INSERT INTO invoice_posting_batch (
+    invoice_id, company_id, invoice_number, entry_date,
+    total_amount, tax_amount, created_by, journal_entry_id, outcome
+  )
+  SELECT
+    requested.id,
+    inv.company_id,
+    inv.invoice_number,
+    COALESCE(inv.invoice_date, CURRENT_DATE),
+    COALESCE(inv.total_amount, 0),
+    COALESCE(inv.tax_amount, 0),
+    inv.created_by,
+    inv.journal_entry_id,
+    CASE
+      WHEN inv.id IS NULL THEN 'not_found'
+      WHEN inv.journal_entry_id IS NOT NULL THEN 'already_linked'
+      WHEN COALESCE(inv.total_amount, 0) <= 0 THEN 'zero_amount'
+    END
+  FROM (
+    SELECT DISTINCT value::uuid AS id
+    FROM jsonb_array_elements_text(p_invoice_ids)
+  ) requested
+  LEFT JOIN public.invoices inv ON inv.id = requested.id;
+
+  -- An invoice with exactly one existing reference journal is linked to it;
+  -- with several there is no safe choice, so it is reported and left unlinked.
+  UPDATE invoice_posting_batch batch
+  SET journal_entry_id = CASE WHEN existing.journals = 1 THEN existing.id END,
+      outcome = CASE WHEN existing.journals = 1 THEN 'linked_existing' ELSE 'ambiguous_existing' END
+  FROM (
+    SELECT je.company_id, je.reference_id, count(*) AS journals, min(je.id::text)::uuid AS id
+    FROM public.journal_entries je
+    JOIN invoice_posting_batch b
+      ON b.company_id = je.company_id
+     AND b.invoice_id = je.reference_id
+    WHERE je.reference_type = 'invoice'
+    GROUP BY je.company_id, je.reference_id
+  ) existing
+  WHERE batch.outcome IS NULL
+    AND existing.company_id = batch.company_id
+    AND existing.reference_id = batch.invoice_id;
+
+  UPDATE invoice_posting_batch batch
+  SET ar_account_id = accounts.ar_account_id,
+      revenue_account_id = accounts.revenue_account_id,
+      tax_account_id = accounts.tax_account_id
+  FROM (
+    SELECT
+      am.company_id,
+      (array_agg(am.chart_of_accounts_id ORDER BY am.created_at)
+        FILTER (WHERE dat.type_code = 'RECEIVABLES'))[1] AS ar_account_id,
+      (array_agg(am.chart_of_accounts_id ORDER BY
+        CASE dat.type_code
+          WHEN 'RENTAL_REVENUE' THEN 1
+          WHEN 'SALES_REVENUE' THEN 2
+          ELSE 3
+        END, am.created_at)
+        FILTER (WHERE dat.type_code IN ('RENTAL_REVENUE', 'SALES_REVENUE', 'REVENUE')))[1] AS revenue_account_id,
+      (array_agg(am.chart_of_accounts_id ORDER BY am.created_at)
+        FILTER (WHERE dat.type_code IN ('TAX_PAYABLE', 'VAT_PAYABLE', 'TAX')))[1] AS tax_account_id
+    FROM public.account_mappings am
+    JOIN public.default_account_types dat ON dat.id = am.default_account_type_id
+    WHERE am.is_active = true
+      AND am.company_id IN (SELECT b.company_id FROM invoice_posting_batch b WHERE b.outcome IS NULL)
+    GROUP BY am.company_id
+  ) accounts
+  WHERE batch.outcome IS NULL
+    AND accounts.company_id = batch.company_id;
+
+  UPDATE invoice_posting_batch batch
+  SET outcome = 'missing_accounts'
+  WHERE batch.outcome IS NULL
+    AND (batch.ar_account_id IS NULL OR batch.revenue_account_id IS NULL);
+
+  -- Skipped rather than raised, so one locked month does not fail the batch.
+  UPDATE invoice_posting_batch batch
+  SET outcome = 'period_locked'
+  WHERE batch.outcome IS NULL
+    AND EXISTS (
+      SELECT 1
+      FROM public.accounting_periods ap
+      WHERE ap.company_id = batch.company_id
+        AND batch.entry_date BETWEEN ap.start_date AND ap.end_date
+        AND lower(ap.status) IN ('closed', 'locked')
+    );
+
+  WITH created AS (
+    INSERT INTO public.journal_entries (
+      company_id, entry_number, entry_date, description,
+      total_debit, total_credit, status, reference_type, reference_id, created_by
+    )
+    SELECT
+      batch.company_id,
+      'INV-' || to_char(batch.entry_date, 'YYYYMMDD') || '-' || substring(batch.invoice_id::text, 1, 8),
+      batch.entry_date,
+      'Invoice: ' || COALESCE(batch.invoice_number, batch.invoice_id::text),
+      batch.total_amount, batch.total_amount, 'draft', 'invoice', batch.invoice_id, batch.created_by
+    FROM invoice_posting_batch batch
+    WHERE batch.outcome IS NULL
+    RETURNING id, company_id, reference_id
+  )
+  UPDATE invoice_posting_batch batch
+  SET journal_entry_id = created.id,
+      outcome = 'posted'
+  FROM created
+  WHERE created.reference_id = batch.invoice_id
+    AND created.company_id = batch.company_id;
+
+  -- Revenue takes whatever tax is not credited to a tax account, so every
+  -- entry balances even when subtotal + tax differs from the total.
+  INSERT INTO public.journal_entry_lines (
+    journal_entry_id, account_id, line_number, line_description, debit_amount, credit_amount
+  )
+  SELECT batch.journal_entry_id, line.account_id, line.line_number, line.description, line.debit, line.credit
+  FROM invoice_posting_batch batch
+  CROSS JOIN LATERAL (
+    VALUES
+      (1, batch.ar_account_id, 'Customer receivable', batch.total_amount, 0::numeric),
+      (
+        2, batch.revenue_account_id, 'Service revenue', 0::numeric,
+        batch.total_amount - CASE WHEN batch.tax_account_id IS NOT NULL THEN batch.tax_amount ELSE 0 END
+      ),
+      (
+        3, batch.tax_account_id, 'Collected tax', 0::numeric,
+        CASE WHEN batch.tax_account_id IS NOT NULL THEN batch.tax_amount ELSE 0 END
+      )
+  ) AS line (line_number, account_id, description, debit, credit)
+  WHERE batch.outcome = 'posted'
+    AND (line.debit > 0 OR line.credit > 0);
+
+  UPDATE public.journal_entries je
+  SET status = 'posted',
+      posted_by = batch.created_by,
+      posted_at = now(),
+      updated_at = now()
+  FROM invoice_posting_batch batch
+  WHERE batch.outcome = 'posted'
+    AND je.id = batch.journal_entry_id;
+
+  PERFORM set_config('app.financial_controls_bypass', 'on', true);
+
+  UPDATE public.invoices inv
+  SET journal_entry_id = batch.journal_entry_id,
+      updated_at = now()
+  FROM invoice_posting_batch batch
+  WHERE batch.outcome IN ('posted', 'linked_existing')
+    AND inv.id = batch.invoice_id
+    AND inv.company_id = batch.company_id
+    AND inv.journal_entry_id IS NULL;
+
+  PERFORM set_config('app.financial_controls_bypass', v_previous_bypass, true);
+
+  RETURN QUERY
+  SELECT batch.invoice_id, batch.journal_entry_id, batch.outcome
+  FROM invoice_posting_batch batch
+  ORDER BY batch.invoice_id;
+EXCEPTION
+  WHEN OTHERS THEN
+    PERFORM set_config('app.financial_controls_bypass', v_previous_bypass, true);
+    RAISE;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.post_invoice_journal_entries(jsonb)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.post_invoice_journal_entries(jsonb) TO service_role;
+
+COMMENT ON FUNCTION public.post_invoice_journal_entries(jsonb) IS
+  'Creates, posts and links invoice journal entries for a jsonb array of invoice ids in set-based statements; returns one outcome row per id.';
+
+COMMIT;